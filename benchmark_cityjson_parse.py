@@ -0,0 +1,172 @@
+"""
+Benchmark for parse_cityjson_geometry in cityjson_to_3dtiles.py.
+
+This script:
+- Builds a synthetic CityJSON with box-shaped buildings (one Solid of 6 quads each).
+- Times the original per-surface parser against the array-backed parser.
+- Checks both parsers produce the same triangles.
+- Checks a CityJSONSeq batch of the same city (L-shaped and courtyard footprints, so the
+  surfaces are ear clipped) parses to the same triangles as the whole file.
+
+Usage:
+python benchmark_cityjson_parse.py [num_buildings]
+"""
+
+import sys
+import time
+import numpy as np
+
+from cityjson_to_3dtiles import parse_cityjson_geometry, parse_cityjson_features, vertex_coordinates
+from benchmark_suite import make_synthetic_footprints, make_footprint_cityjson
+
+# Quads of a box over its 8 corners (4 bottom, 4 top)
+BOX_FACES = [
+    [0, 3, 2, 1],  # bottom
+    [4, 5, 6, 7],  # top
+    [0, 1, 5, 4],
+    [1, 2, 6, 5],
+    [2, 3, 7, 6],
+    [3, 0, 4, 7],
+]
+
+def make_synthetic_cityjson(num_buildings, extent=10000.0, seed=0):
+    """
+    Create a CityJSON dict with num_buildings random boxes spread over an extent x extent area.
+    The same seed always gives the same city.
+    """
+    rng = np.random.default_rng(seed)
+    origin = rng.uniform(0, extent, size=(num_buildings, 2))
+    size = rng.uniform(5, 40, size=(num_buildings, 2))
+    height = rng.uniform(3, 120, size=num_buildings)
+
+    x0, y0 = origin[:, 0], origin[:, 1]
+    x1, y1 = x0 + size[:, 0], y0 + size[:, 1]
+    zero = np.zeros(num_buildings)
+    corners = np.stack([
+        np.column_stack((x0, y0, zero)), np.column_stack((x1, y0, zero)),
+        np.column_stack((x1, y1, zero)), np.column_stack((x0, y1, zero)),
+        np.column_stack((x0, y0, height)), np.column_stack((x1, y0, height)),
+        np.column_stack((x1, y1, height)), np.column_stack((x0, y1, height)),
+    ], axis=1)
+    faces = (np.arange(num_buildings)[:, None, None] * 8 + np.array(BOX_FACES)[None]).tolist()
+
+    city_objects = {}
+    for i, building_faces in enumerate(faces):
+        city_objects[f"building_{i}"] = {
+            "type": "Building",
+            "geometry": [{
+                "type": "Solid",
+                "lod": "1",
+                "boundaries": [[[face] for face in building_faces]]
+            }]
+        }
+
+    return {
+        "type": "CityJSON",
+        "version": "1.0",
+        "CityObjects": city_objects,
+        "vertices": np.round(corners.reshape(-1, 3), 3).tolist()
+    }
+
+def legacy_parse_cityjson_geometry(cityjson):
+    """
+    The original per-surface parser, kept here as the baseline.
+    """
+    vertices_list = []
+    indices_list = []
+
+    vertices_global = np.array(cityjson.get("vertices", []), dtype=np.float32)
+
+    for obj_id, obj in cityjson.get("CityObjects", {}).items():
+        for g in obj.get("geometry", []):
+            geom_type = g.get("type")
+            boundaries = g.get("boundaries", [])
+            if geom_type == "Solid":
+                surfaces = [surface for shell in boundaries for surface in shell]
+            elif geom_type == "MultiSurface":
+                surfaces = boundaries
+            else:
+                continue
+            for surface in surfaces:
+                exterior_ring = surface[0]
+                verts = vertices_global[exterior_ring]
+                indices = []
+                for i in range(1, len(exterior_ring)-1):
+                    indices.append([0, i, i+1])
+                vertices_list.append(verts)
+                indices_list.append(np.array(indices, dtype=np.uint16))
+
+    return vertices_list, indices_list
+
+def _local_ids(boundaries, local):
+    if isinstance(boundaries, int):
+        return local.setdefault(boundaries, len(local))
+    return [_local_ids(item, local) for item in boundaries]
+
+def split_features(cityjson):
+    """
+    The CityObjects of cityjson as CityJSONFeatures with their own vertex lists, as the
+    lines of a CityJSONSeq file hold them.
+    """
+    features = []
+    for obj_id, obj in cityjson["CityObjects"].items():
+        local = {}
+        geometry = [dict(g, boundaries=_local_ids(g["boundaries"], local)) for g in obj.get("geometry", [])]
+        features.append({
+            "type": "CityJSONFeature",
+            "id": obj_id,
+            "CityObjects": {obj_id: dict(obj, geometry=geometry)},
+            "vertices": [cityjson["vertices"][i] for i in local],
+        })
+    return features
+
+def check_streamed_parse(cityjson):
+    """
+    Parse cityjson whole and as one batch of CityJSONFeatures; both must give the same
+    triangles, triangle surfaces and triangle coordinates.
+    """
+    full = parse_cityjson_geometry(cityjson)
+    streamed = parse_cityjson_features(split_features(cityjson))
+    for key in ("triangles", "triangle_surface"):
+        if not np.array_equal(full[key], streamed[key]):
+            raise AssertionError(f"CityJSONSeq batch parse gives other {key} than the full parse")
+    if not np.array_equal(vertex_coordinates(full, full["ring_vertices"]),
+                          vertex_coordinates(streamed, streamed["ring_vertices"])):
+        raise AssertionError("CityJSONSeq batch parse gives other ring coordinates than the full parse")
+    return len(full["triangles"])
+
+def time_call(func, *args, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    num_buildings = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print(f"Generating synthetic CityJSON with {num_buildings} buildings...")
+    cityjson = make_synthetic_cityjson(num_buildings)
+
+    legacy_time, (vertices_list, indices_list) = time_call(legacy_parse_cityjson_geometry, cityjson)
+    array_time, geometry = time_call(parse_cityjson_geometry, cityjson)
+
+    # Both parsers must produce the same triangle coordinates
+    legacy_triangles = np.vstack([verts[inds] for verts, inds in zip(vertices_list, indices_list)])
+    array_triangles = vertex_coordinates(geometry, geometry["ring_vertices"][geometry["triangles"]]).astype(np.float32)
+    if not np.array_equal(legacy_triangles, array_triangles):
+        raise AssertionError("Array-backed parser output differs from the legacy parser")
+
+    num_triangles = len(geometry["triangles"])
+    print(f"Surfaces: {len(geometry['surface_offsets']) - 1}, triangles: {num_triangles}")
+    print(f"Legacy parser:       {legacy_time:8.3f} s ({num_triangles / legacy_time:,.0f} triangles/s)")
+    print(f"Array-backed parser: {array_time:8.3f} s ({num_triangles / array_time:,.0f} triangles/s)")
+    print(f"Speed-up: {legacy_time / array_time:.1f}x")
+
+    num_checked = check_streamed_parse(make_footprint_cityjson(make_synthetic_footprints(min(num_buildings, 3000))))
+    print(f"CityJSONSeq batch parse matches the full parse ({num_checked} triangles)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark for the JSON backends of json_backend.py on a large CityJSON file.
+
+This script:
+- Uses the given CityJSON file (e.g. the singapore_buildings_*.city.json export of
+  extract_singapore_obj.py), or writes a synthetic city of extruded footprints with OSM-like
+  attributes (benchmark_suite.py) to a temporary file.
+- Times, for every available backend, loading the file (from a memory map), and dumping the
+  loaded CityJSON compact and with indent=2, against the original json.load / json.dump
+  (indent=2) path as the baseline.
+- Checks every backend loads the same CityJSON, and reports the compact and indented sizes.
+
+Usage:
+python benchmark_json.py singapore_buildings_20250101_120000.city.json
+python benchmark_json.py --buildings 200000 --repeat 3
+"""
+
+import os
+import io
+import json
+import time
+import argparse
+import tempfile
+
+import json_backend
+
+def time_call(func, *args, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def stdlib_load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def stdlib_dump(cityjson):
+    f = io.StringIO()
+    json.dump(cityjson, f, indent=2)
+    return f.getvalue().encode("utf-8")
+
+def run(path, repeat):
+    size = os.path.getsize(path)
+    print(f"{path}: {size / 2**20:.1f} MB")
+    print(f"{'backend':<16}{'load (s)':>10}{'MB/s':>8}{'dump (s)':>10}{'dump indent=2 (s)':>19}"
+          f"{'compact MB':>12}{'indented MB':>13}")
+
+    load_time, reference = time_call(stdlib_load, path, repeat=repeat)
+    indent_time, indented = time_call(stdlib_dump, reference, repeat=repeat)
+    print(f"{'json (baseline)':<16}{load_time:>10.3f}{size / 2**20 / load_time:>8.0f}{'-':>10}"
+          f"{indent_time:>19.3f}{'-':>12}{len(indented) / 2**20:>13.1f}")
+
+    for name in json_backend.BACKENDS:
+        json_backend.set_backend(name)
+        load_time, cityjson = time_call(json_backend.load, path, repeat=repeat)
+        if cityjson != reference:
+            raise AssertionError(f"{name} loaded a different CityJSON than json.load")
+        dump_time, compact = time_call(json_backend.dumps, cityjson, repeat=repeat)
+        indent_time, indented = time_call(json_backend.dumps, cityjson, 2, repeat=repeat)
+        print(f"{name:<16}{load_time:>10.3f}{size / 2**20 / load_time:>8.0f}{dump_time:>10.3f}"
+              f"{indent_time:>19.3f}{len(compact) / 2**20:>12.1f}{len(indented) / 2**20:>13.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time CityJSON loading and dumping with every available JSON backend.")
+    parser.add_argument("input", nargs="?", help="CityJSON file (default: a synthetic city)")
+    parser.add_argument("--buildings", type=int, default=100000,
+                        help="buildings of the synthetic city when no input is given (default: 100000)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the fastest is kept (default: 3)")
+    args = parser.parse_args()
+
+    if args.input:
+        run(args.input, args.repeat)
+        return
+
+    from benchmark_suite import make_synthetic_footprints, make_footprint_cityjson
+
+    print(f"Generating synthetic CityJSON with {args.buildings} buildings...")
+    cityjson = make_footprint_cityjson(make_synthetic_footprints(args.buildings))
+    with tempfile.TemporaryDirectory() as folder:
+        # Written indented, like the original Singapore export
+        path = os.path.join(folder, "synthetic.city.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cityjson, f, indent=2)
+        del cityjson
+        run(path, args.repeat)
+
+if __name__ == "__main__":
+    main()
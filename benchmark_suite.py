@@ -0,0 +1,376 @@
+"""
+Benchmark suite for the CityJSON / OSM conversion pipeline.
+
+This script:
+- Generates a deterministic synthetic city of building footprints (rotated rectangles,
+  L-shapes and courtyard blocks with a hole) with OSM-like attributes, at any size.
+- Times each pipeline stage on it:
+  extrude_cityjson  create_extruded_building_object for every footprint (per-building baseline)
+  extrude_trimesh   create_trimesh_extruded_building for every footprint (per-building baseline)
+  extrude_bulk      extrusion.extrude_footprints and extruded_mesh on all footprints at once
+  heights           building_heights.normalize_heights on OSM-like height and floor tags
+  parse             parse_cityjson_geometry on the extruded city
+  tiling            build_tiles writing GLB tiles with feature metadata into a folder
+  gltf              create_gltf_from_mesh writing the whole city as one glTF
+  slpk              the cityjson_to_slpk packaging (I3S nodes into an SLPK archive)
+- Runs every stage and size in a fresh process, so its peak RSS is its own.
+- Reports time, throughput, peak RSS and output bytes, saves them as JSON together with the
+  git commit, and compares them with the JSON of an earlier run when given.
+
+Inputs are generated before the timer starts; only the stage itself is timed (best of
+--repeat runs).
+
+Dependencies:
+- numpy, shapely, trimesh (the per-building extrusion baselines)
+- pipeline_metrics (for the peak RSS; reported as null where resource is missing)
+
+Usage:
+python benchmark_suite.py
+python benchmark_suite.py --sizes 1000,10000,100000,500000 --output results.json
+python benchmark_suite.py --stages parse,tiling --compare results.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from pipeline_metrics import peak_rss
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+# Buildings per square kilometer of the synthetic city, about a dense city centre
+BUILDINGS_PER_KM2 = 2000
+
+# Footprint outlines in a unit square, counter-clockwise; the courtyard has a hole
+FOOTPRINT_SHAPES = {
+    "rectangle": [[(0, 0), (1, 0), (1, 1), (0, 1)]],
+    "l_shape": [[(0, 0), (1, 0), (1, 0.4), (0.4, 0.4), (0.4, 1), (0, 1)]],
+    "courtyard": [[(0, 0), (1, 0), (1, 1), (0, 1)], [(0.3, 0.3), (0.3, 0.7), (0.7, 0.7), (0.7, 0.3)]],
+}
+BUILDING_TYPES = ["residential", "commercial", "apartments", "industrial", "yes"]
+
+def make_synthetic_footprints(num_buildings, seed=0):
+    """
+    Create num_buildings footprints spread over a square at BUILDINGS_PER_KM2, with heights
+    and OSM-like attributes. The same seed always gives the same city.
+    Returns a list of (shapely Polygon, height, attributes).
+    """
+    import shapely.geometry
+
+    rng = np.random.default_rng(seed)
+    extent = np.sqrt(num_buildings / BUILDINGS_PER_KM2) * 1000.0
+    shapes = list(FOOTPRINT_SHAPES.values())
+    kind = rng.choice(len(shapes), size=num_buildings, p=[0.6, 0.3, 0.1])
+    size = rng.uniform(8, 40, size=(num_buildings, 2))
+    angle = rng.uniform(0, np.pi / 2, size=num_buildings)
+    origin = rng.uniform(0, extent, size=(num_buildings, 2))
+    levels = rng.integers(1, 40, size=num_buildings)
+    building = rng.choice(len(BUILDING_TYPES), size=num_buildings)
+
+    footprints = []
+    for i in range(num_buildings):
+        cos, sin = np.cos(angle[i]), np.sin(angle[i])
+        rotation = np.array([[cos, -sin], [sin, cos]])
+        rings = [np.asarray(ring) * size[i] @ rotation.T + origin[i] for ring in shapes[kind[i]]]
+        height = float(levels[i]) * 3.0
+        attributes = {"osmid": 100000 + i, "height_m": height, "building": BUILDING_TYPES[building[i]],
+                      "building:levels": int(levels[i])}
+        footprints.append((shapely.geometry.Polygon(rings[0], rings[1:]), height, attributes))
+    return footprints
+
+def create_trimesh_extruded_building(footprint, height):
+    """
+    Create a trimesh mesh of an extruded polygon footprint: the per-building baseline of
+    the extrude_trimesh stage.
+    Args:
+        footprint (shapely.geometry.Polygon): 2D footprint polygon.
+        height (float): extrusion height in meters.
+    Returns:
+        trimesh.Trimesh: extruded mesh.
+    """
+    import trimesh
+
+    exterior_coords = np.array(footprint.exterior.coords)
+    # Create vertices for bottom and top
+    bottom = np.column_stack((exterior_coords, np.zeros(len(exterior_coords))))
+    top = np.column_stack((exterior_coords, np.full(len(exterior_coords), height)))
+
+    vertices = np.vstack((bottom, top))
+
+    n = len(exterior_coords)
+    faces = []
+    # Bottom face (triangle fan)
+    for i in range(1, n-1):
+        faces.append([0, i, i+1])
+    # Top face (triangle fan)
+    for i in range(1, n-1):
+        faces.append([n, n+i+1, n+i])
+    # Side faces (quads split into two triangles)
+    for i in range(n-1):
+        a = i
+        b = i+1
+        c = n + b
+        d = n + a
+        faces.append([a, b, c])
+        faces.append([a, c, d])
+
+    mesh = trimesh.Trimesh(vertices=vertices, faces=faces)
+    return mesh
+
+def create_extruded_building_object(footprint, height, vertices, attributes):
+    """
+    Create a CityJSON Building with a Solid of an extruded polygon footprint: the
+    per-building baseline of the extrude_cityjson stage.
+    Args:
+        footprint (shapely.geometry.Polygon): 2D footprint polygon, holes are kept.
+        height (float): extrusion height in meters.
+        vertices (list): CityJSON vertex list; the building's vertices are appended to it.
+        attributes (dict): CityObject attributes.
+    Returns:
+        dict: CityObject.
+    """
+    import shapely.geometry
+
+    footprint = shapely.geometry.polygon.orient(footprint, sign=1.0)
+    # Drop the closing vertex, CityJSON rings are implicitly closed
+    rings = [np.asarray(footprint.exterior.coords)[:-1]]
+    rings += [np.asarray(interior.coords)[:-1] for interior in footprint.interiors]
+
+    bottom, top, walls = [], [], []
+    for ring in rings:
+        n = len(ring)
+        start = len(vertices)
+        vertices.extend([float(x), float(y), 0.0] for x, y in ring[:, :2])
+        vertices.extend([float(x), float(y), float(height)] for x, y in ring[:, :2])
+        bottom_ids = list(range(start, start + n))
+        top_ids = list(range(start + n, start + 2 * n))
+        # Bottom faces down, top faces up
+        bottom.append(bottom_ids[::-1])
+        top.append(top_ids)
+        # Side faces, one quad per footprint edge
+        for i in range(n):
+            j = (i + 1) % n
+            walls.append([[bottom_ids[i], bottom_ids[j], top_ids[j], top_ids[i]]])
+
+    return {
+        "type": "Building",
+        "geometry": [{
+            "type": "Solid",
+            "boundaries": [[bottom, top] + walls]
+        }],
+        "attributes": attributes
+    }
+
+def make_footprint_cityjson(footprints):
+    """
+    The CityJSON of the extruded footprints, one create_extruded_building_object each.
+    """
+    cityjson = {"type": "CityJSON", "version": "1.0", "CityObjects": {}, "vertices": []}
+    for footprint, height, attributes in footprints:
+        cityjson["CityObjects"][str(attributes["osmid"])] = create_extruded_building_object(
+            footprint, height, cityjson["vertices"], attributes)
+    return cityjson
+
+def folder_size(folder):
+    return sum(os.path.getsize(os.path.join(path, name))
+               for path, _, names in os.walk(folder) for name in names)
+
+# Every stage has a setup (untimed) building its input from the footprints, and a run
+# writing into an empty output folder and returning the number of items it processed.
+
+def _setup_footprints(footprints):
+    return footprints
+
+def _setup_footprint_arrays(footprints):
+    return np.array([footprint for footprint, _, _ in footprints], dtype=object), \
+        np.array([height for _, height, _ in footprints])
+
+def _setup_height_tags(footprints):
+    import pandas as pd
+    # A third of the buildings tag their height (some with units), the rest only their floors
+    heights = [None if i % 3 else (f"{height:g}" if i % 2 else f"{height / 0.3048:.0f} ft")
+               for i, (_, height, _) in enumerate(footprints)]
+    levels = [str(attributes["building:levels"]) for _, _, attributes in footprints]
+    return pd.DataFrame({"height": heights, "building:levels": levels})
+
+def _setup_geometry(footprints):
+    from cityjson_to_3dtiles import parse_cityjson_geometry
+    return parse_cityjson_geometry(make_footprint_cityjson(footprints))
+
+def _setup_mesh(footprints):
+    from cityjson_to_3dtiles import vertex_coordinates
+    geometry = _setup_geometry(footprints)
+    return vertex_coordinates(geometry, geometry["ring_vertices"]), geometry["triangles"]
+
+def _run_extrude_cityjson(footprints, output_folder):
+    make_footprint_cityjson(footprints)
+    return len(footprints)
+
+def _run_extrude_trimesh(footprints, output_folder):
+    for footprint, height, _ in footprints:
+        create_trimesh_extruded_building(footprint, height)
+    return len(footprints)
+
+def _run_extrude_bulk(footprint_arrays, output_folder):
+    from extrusion import extrude_footprints, extruded_mesh
+    footprints, heights = footprint_arrays
+    extruded_mesh(extrude_footprints(footprints, heights))
+    return len(footprints)
+
+def _run_heights(tags, output_folder):
+    from building_heights import normalize_heights
+    normalize_heights(tags)
+    return len(tags)
+
+def _run_parse(cityjson, output_folder):
+    from cityjson_to_3dtiles import parse_cityjson_geometry
+    return len(parse_cityjson_geometry(cityjson)["triangles"])
+
+def _run_tiling(geometry, output_folder):
+    from cityjson_to_3dtiles import build_tiles
+    build_tiles(geometry, output_folder, "glb", feature_metadata=True)
+    return len(geometry["triangles"])
+
+def _run_gltf(mesh, output_folder):
+    from cityjson_to_3dtiles import create_gltf_from_mesh
+    vertices, indices = mesh
+    create_gltf_from_mesh(vertices, indices, os.path.join(output_folder, "city.gltf"))
+    return len(indices)
+
+def _run_slpk(geometry, output_folder):
+    from cityjson_to_3dtiles import build_tiles
+    from cityjson_to_slpk import SlpkWriter, STORED_EXTENSIONS
+    from i3s import write_i3s_layer
+
+    # The options cityjson_to_slpk's main uses
+    with SlpkWriter(os.path.join(output_folder, "city.slpk"), stored_extensions=STORED_EXTENSIONS | {".json"}) as slpk:
+        root = build_tiles(geometry, slpk, "i3s", max_vertices=sys.maxsize, max_triangles=sys.maxsize,
+                           feature_metadata=True)
+        write_i3s_layer(slpk, root, root["schema"], "city", 3414)
+    return len(geometry["triangles"])
+
+# Stage name -> (setup, run, unit of the items run returns)
+STAGES = {
+    "extrude_cityjson": (_setup_footprints, _run_extrude_cityjson, "buildings"),
+    "extrude_trimesh": (_setup_footprints, _run_extrude_trimesh, "buildings"),
+    "extrude_bulk": (_setup_footprint_arrays, _run_extrude_bulk, "buildings"),
+    "heights": (_setup_height_tags, _run_heights, "buildings"),
+    "parse": (make_footprint_cityjson, _run_parse, "triangles"),
+    "tiling": (_setup_geometry, _run_tiling, "triangles"),
+    "gltf": (_setup_mesh, _run_gltf, "triangles"),
+    "slpk": (_setup_geometry, _run_slpk, "triangles"),
+}
+
+def measure(stage, num_buildings, repeat=1, seed=0):
+    """
+    Build the input of stage for num_buildings and time the stage (best of repeat runs).
+    Meant to run in a fresh process (see main), so the peak RSS is the stage's own.
+    Returns the result row.
+    """
+    setup, run, unit = STAGES[stage]
+    data = setup(make_synthetic_footprints(num_buildings, seed))
+    rss_before = peak_rss()
+
+    best = float("inf")
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as output_folder:
+            start = time.perf_counter()
+            items = run(data, output_folder)
+            best = min(best, time.perf_counter() - start)
+            output_bytes = folder_size(output_folder)
+
+    rss_after = peak_rss()
+    return {
+        "stage": stage,
+        "buildings": num_buildings,
+        "items": items,
+        "unit": unit,
+        "seconds": best,
+        "buildings_per_s": num_buildings / best,
+        "items_per_s": items / best,
+        "peak_rss_bytes": rss_after,
+        "stage_rss_bytes": None if rss_after is None else rss_after - rss_before,
+        "output_bytes": output_bytes,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(rows, previous=None):
+    """
+    Print the result rows, with the speed-up over the matching rows of previous when given.
+    """
+    baseline = {(row["stage"], row["buildings"]): row for row in (previous or {}).get("results", [])}
+    header = f"{'stage':<18}{'buildings':>10}{'time (s)':>10}{'items/s':>14}{'peak RSS MB':>13}{'output MB':>11}"
+    print(header + (f"{'speed-up':>10}" if previous else ""))
+    for row in rows:
+        rss = "-" if row["peak_rss_bytes"] is None else f"{row['peak_rss_bytes'] / 2**20:.0f}"
+        line = (f"{row['stage']:<18}{row['buildings']:>10}{row['seconds']:>10.3f}{row['items_per_s']:>14,.0f}"
+                f"{rss:>13}{row['output_bytes'] / 2**20:>11.2f}")
+        old = baseline.get((row["stage"], row["buildings"]))
+        if old is not None:
+            line += f"{old['seconds'] / row['seconds']:>9.2f}x"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the conversion pipeline stages on synthetic cities.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help=f"comma-separated building counts (default: {','.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"comma-separated stages to run (default: all of {','.join(STAGES)})")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage, the fastest is kept (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic city (default: 0)")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to save the results to")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    stages = args.stages.split(",")
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+    previous = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+
+    rows = []
+    context = multiprocessing.get_context("spawn")
+    for num_buildings in sizes:
+        for stage in stages:
+            print(f"{stage}: {num_buildings} buildings...", flush=True)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                rows.append(executor.submit(measure, stage, num_buildings, args.repeat, args.seed).result())
+
+    results = {
+        "commit": git_commit(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": rows,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print_results(rows, previous)
+    print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Size and time comparison of the tile output formats of cityjson_to_3dtiles.py.
+
+This script:
+- Builds a synthetic CityJSON (see benchmark_cityjson_parse.py) and parses it once.
+- Writes the tiles once per output format (gltf, glb, b3dm) into a temporary folder, and
+  again as GLB with quantized positions and/or meshopt compression.
+- Reports write time, number of files and total bytes per variant.
+
+The meshopt variants are skipped when the meshoptimizer package is not installed.
+
+Usage:
+python benchmark_tile_formats.py [num_buildings]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from benchmark_cityjson_parse import make_synthetic_cityjson
+from cityjson_to_3dtiles import TILE_WRITERS, meshoptimizer, parse_cityjson_geometry, build_tiles
+
+# Variant name -> (output format, mesh options)
+VARIANTS = {output_format: (output_format, {}) for output_format in TILE_WRITERS}
+VARIANTS.update({
+    "glb+quantize": ("glb", {"quantize": True}),
+    "glb+meshopt": ("glb", {"meshopt": True}),
+    "glb+quantize+meshopt": ("glb", {"quantize": True, "meshopt": True}),
+})
+
+def folder_size(folder):
+    files = [os.path.join(folder, name) for name in os.listdir(folder)]
+    return len(files), sum(os.path.getsize(path) for path in files)
+
+def main():
+    num_buildings = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print(f"Generating synthetic CityJSON with {num_buildings} buildings...")
+    geometry = parse_cityjson_geometry(make_synthetic_cityjson(num_buildings))
+
+    results = {}
+    for variant, (output_format, mesh_options) in VARIANTS.items():
+        if mesh_options.get("meshopt") and meshoptimizer is None:
+            continue
+        with tempfile.TemporaryDirectory() as output_folder:
+            start = time.perf_counter()
+            build_tiles(geometry, output_folder, output_format, mesh_options=mesh_options)
+            elapsed = time.perf_counter() - start
+            results[variant] = (elapsed,) + folder_size(output_folder)
+
+    baseline_time, _, baseline_bytes = results["gltf"]
+    print(f"{'variant':<22}{'time (s)':>10}{'files':>8}{'bytes':>14}{'vs gltf':>10}")
+    for variant, (elapsed, num_files, num_bytes) in results.items():
+        print(f"{variant:<22}{elapsed:>10.3f}{num_files:>8}{num_bytes:>14,}{num_bytes / baseline_bytes:>10.1%}")
+    print(f"glb write speed-up over gltf: {baseline_time / results['glb'][0]:.1f}x")
+
+if __name__ == "__main__":
+    main()
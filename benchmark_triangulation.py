@@ -0,0 +1,96 @@
+"""
+Benchmark for triangulate_surfaces in triangulation.py.
+
+This script:
+- Builds synthetic surfaces of three kinds: convex quads, concave L-shaped footprints and
+  squares with a square hole, each randomly oriented in 3D.
+- Times the original per-surface fan loop against the batched triangulation.
+- Checks the triangulated area equals the polygon area (outer minus holes) for every kind.
+
+The fan loop is only correct for the convex quads; it is timed on the other kinds to show
+the cost of doing real triangulation.
+
+Usage:
+python benchmark_triangulation.py [num_surfaces]
+"""
+
+import sys
+import time
+import numpy as np
+
+from triangulation import constrained_delaunay_triangles, mapbox_earcut, triangulate_surfaces
+
+SHAPES = {
+    "convex": ([[(0, 0), (1, 0), (1, 1), (0, 1)]], 1.0),
+    "concave": ([[(0, 0), (4, 0), (4, 1), (1, 1), (1, 3), (0, 3)]], 6.0),
+    "holes": ([[(0, 0), (10, 0), (10, 10), (0, 10)], [(3, 3), (3, 6), (6, 6), (6, 3)]], 91.0),
+}
+
+def make_surfaces(rings, num_surfaces, seed=0):
+    """
+    Repeat one 2D polygon (exterior ring, then holes) num_surfaces times, each copy scaled,
+    rotated and moved randomly in 3D. Returns flattened boundaries and the copy scales.
+    """
+    rng = np.random.default_rng(seed)
+    shape = np.vstack([np.column_stack((np.array(ring, dtype=np.float64), np.zeros(len(ring)))) for ring in rings])
+    ring_sizes = [len(ring) for ring in rings]
+
+    # Random rotations from QR decompositions of random matrices
+    q, r = np.linalg.qr(rng.normal(size=(num_surfaces, 3, 3)))
+    rotation = q * np.sign(np.diagonal(r, axis1=1, axis2=2))[:, None, :]
+    scale = rng.uniform(1, 30, size=num_surfaces)
+    offset = rng.uniform(0, 10000, size=(num_surfaces, 3))
+    vertices = np.einsum("sij,pj->spi", rotation, shape) * scale[:, None, None] + offset[:, None, :]
+
+    ring_vertices = np.arange(num_surfaces * len(shape))
+    ring_offsets = np.concatenate(([0], np.cumsum(np.tile(ring_sizes, num_surfaces))))
+    surface_offsets = np.arange(num_surfaces + 1) * len(rings)
+    return vertices.reshape(-1, 3), ring_vertices, ring_offsets, surface_offsets, scale
+
+def legacy_fan(ring_vertices, ring_offsets, surface_offsets):
+    """
+    The original per-surface fan over the exterior ring, kept here as the baseline.
+    """
+    triangles = []
+    for s in range(len(surface_offsets) - 1):
+        start, stop = ring_offsets[surface_offsets[s]], ring_offsets[surface_offsets[s] + 1]
+        for i in range(1, stop - start - 1):
+            triangles.append([start, start + i, start + i + 1])
+    return np.array(triangles, dtype=np.int64).reshape(-1, 3)
+
+def time_call(func, *args, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    num_surfaces = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    if mapbox_earcut is not None:
+        print("Ear clipping: mapbox_earcut")
+    elif constrained_delaunay_triangles is not None:
+        print("Ear clipping: GEOS constrained Delaunay batch (shapely), pure Python for the rest")
+    else:
+        print("Ear clipping: pure Python")
+    print(f"{'shape':<10}{'triangles':>11}{'fan (tri/s)':>16}{'batched (tri/s)':>18}")
+
+    for name, (rings, polygon_area) in SHAPES.items():
+        vertices, ring_vertices, ring_offsets, surface_offsets, scale = make_surfaces(rings, num_surfaces)
+        fan_time, fan = time_call(legacy_fan, ring_vertices, ring_offsets, surface_offsets)
+        batched_time, (triangles, triangle_surface) = time_call(
+            triangulate_surfaces, vertices, ring_vertices, ring_offsets, surface_offsets)
+
+        # Every surface must be covered exactly, holes left open
+        corners = vertices[ring_vertices[triangles]]
+        areas = np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1) / 2
+        surface_area = np.bincount(triangle_surface, areas, num_surfaces)
+        if not np.allclose(surface_area, polygon_area * scale ** 2, rtol=1e-6):
+            raise AssertionError(f"Triangulated area of the {name} surfaces differs from the polygon area")
+
+        print(f"{name:<10}{len(triangles):>11}{len(fan) / fan_time:>16,.0f}{len(triangles) / batched_time:>18,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Column-wise building height normalization from OSM tags and HDB data.
+
+This module:
+- Derives the height of every building from, in order of precedence:
+  max_floor_lvl   HDB floors (from the geocoded HDB CSV) * LEVEL_HEIGHT
+  height          OSM height tag, in meters unless it has a unit (m, ft, ')
+  building:levels OSM floors * LEVEL_HEIGHT, plus roof:height when tagged
+  default         the given default height, or missing
+  A value that is missing, unparsable or not positive falls through to the next rule.
+- Reads min_height (the height the building part starts at) as the base of the extrusion,
+  when it is below the height.
+- Reports how many buildings each rule covered, and how many tag values could not be parsed.
+
+Every distinct tag value is parsed once (pd.factorize): plain numbers with pd.to_numeric, the
+values left over (units, separators) with a vectorized regular expression, so a million
+rows take a fraction of a second.
+
+Dependencies:
+- numpy
+- pandas
+"""
+
+import numpy as np
+import pandas as pd
+
+# Meters per floor
+LEVEL_HEIGHT = 3.0
+# Meters per unit of a length tag; a bare number is in meters
+UNITS = {"": 1.0, "m": 1.0, "meter": 1.0, "meters": 1.0, "metre": 1.0, "metres": 1.0,
+         "ft": 0.3048, "feet": 0.3048, "foot": 0.3048, "'": 0.3048}
+# Leading number of a tag value (decimal comma allowed), then an optional unit
+LENGTH_PATTERN = r"^\s*(\d+(?:[.,]\d+)?|[.,]\d+)\s*([a-zA-Z']*)"
+# Rules in order of precedence, as reported in the coverage statistics
+HEIGHT_RULES = ["max_floor_lvl", "height", "building:levels", "default"]
+
+def _parse_distinct(values, parse):
+    """
+    Apply parse (Series -> float64 Series) to the distinct values only; tag columns repeat a
+    few values ("3", "12 m", ...) across many buildings.
+    """
+    values = pd.Series(values)
+    codes, distinct = pd.factorize(values)
+    parsed = parse(pd.Series(distinct, dtype=object)).to_numpy(dtype=np.float64)
+    # Missing values have code -1, which picks the NaN appended last
+    return pd.Series(np.append(parsed, np.nan)[codes], index=values.index)
+
+def _numbers(values, units):
+    """
+    Numbers of the values; with units, lengths in meters (see UNITS), else unitless counts.
+    """
+    parsed = pd.to_numeric(values, errors="coerce").astype(np.float64)
+    rest = parsed.isna() & values.notna()
+    if rest.any():
+        parts = values[rest].astype(str).str.extract(LENGTH_PATTERN)
+        number = pd.to_numeric(parts[0].str.replace(",", ".", regex=False), errors="coerce")
+        factor = parts[1].str.lower().map(UNITS) if units else (parts[1] == "").map({True: 1.0, False: np.nan})
+        parsed[rest] = (number * factor).to_numpy(dtype=np.float64)
+    return parsed
+
+def parse_lengths(values):
+    """
+    Lengths in meters of tag values such as 12, "12", "12.5 m", "40 ft", "12,5" or "3;4" (the
+    first value counts). Missing and unparsable values are NaN.
+    """
+    return _parse_distinct(values, lambda distinct: _numbers(distinct, units=True))
+
+def parse_counts(values):
+    """
+    Floor counts of tag values such as 3, "3", "3.5" or "3;4"; units are not allowed.
+    """
+    return _parse_distinct(values, lambda distinct: _numbers(distinct, units=False))
+
+def _column(df, name, parse):
+    if name not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    return parse(df[name])
+
+def normalize_heights(df, default=None, level_height=LEVEL_HEIGHT):
+    """
+    Heights of the buildings in df (a GeoDataFrame or DataFrame with any of the columns
+    max_floor_lvl, height, building:levels, min_height and roof:height).
+    default: height of the buildings no rule covers (NaN when None)
+    Returns (DataFrame with height_m, min_height_m (0 when not tagged) and height_source
+    (the rule used, see HEIGHT_RULES; None when missing), coverage dict of counts).
+    """
+    parsed = {
+        "max_floor_lvl": _column(df, "max_floor_lvl", parse_counts),
+        "height": _column(df, "height", parse_lengths),
+        "building:levels": _column(df, "building:levels", parse_counts),
+        "min_height": _column(df, "min_height", parse_lengths),
+        "roof:height": _column(df, "roof:height", parse_lengths),
+    }
+    roof_height = parsed["roof:height"].where(parsed["roof:height"] >= 0, 0.0)
+    candidates = [
+        parsed["max_floor_lvl"] * level_height,
+        parsed["height"],
+        parsed["building:levels"] * level_height + roof_height,
+        pd.Series(np.nan if default is None else float(default), index=df.index),
+    ]
+
+    height = np.full(len(df), np.nan)
+    source = np.full(len(df), None, dtype=object)
+    for rule, candidate in zip(HEIGHT_RULES, candidates):
+        use = np.isnan(height) & (candidate.to_numpy() > 0)
+        height[use] = candidate.to_numpy()[use]
+        source[use] = rule
+
+    min_height = parsed["min_height"].to_numpy()
+    has_base = (min_height > 0) & (min_height < height)
+    result = pd.DataFrame({"height_m": height, "min_height_m": np.where(has_base, min_height, 0.0),
+                           "height_source": source}, index=df.index)
+
+    coverage = {f"from_{rule}": int((source == rule).sum()) for rule in HEIGHT_RULES}
+    coverage["missing"] = int(np.isnan(height).sum())
+    coverage["with_min_height"] = int(has_base.sum())
+    coverage["with_roof_height"] = int(((source == "building:levels") & (roof_height > 0).to_numpy()).sum())
+    for name, values in parsed.items():
+        if name in df.columns:
+            coverage[f"unparsed_{name}"] = int((values.isna() & df[name].notna()).sum())
+    return result, coverage
@@ -2,67 +2,244 @@
 Python script to convert CityJSON files to 3D Tiles format.
 
 This script:
-- Loads a CityJSON file.
-- Extracts building geometries.
-- Converts geometries to glTF files using pygltflib.
-- Generates a tileset.json referencing the glTF files as tiles.
+- Loads a CityJSON file, or streams a CityJSONSeq (.jsonl) file feature by feature.
+- Extracts building geometries and triangulates their surfaces, concave ones and holes included
+  (see triangulation.py).
+- Converts geometries to glTF, GLB or b3dm tiles.
+- Tiles the buildings with an adaptive quadtree over the extent of the data.
+- Generates a tileset.json with the quadtree hierarchy, the geometricError halving at every level
+  (or, with --lod, simplified parent tiles with their measured error).
 
 Dependencies:
 - numpy
 - pygltflib
+- mapbox_earcut (optional, faster triangulation of concave surfaces)
+- meshoptimizer (optional, for --meshopt)
+- orjson or pysimdjson (optional, faster CityJSON parsing; see json_backend)
 
 Install dependencies with:
 pip install numpy pygltflib
 
 Usage:
 python cityjson_to_3dtiles.py input_cityjson.json output_3dtiles_folder
+python cityjson_to_3dtiles.py input_cityjson.city.jsonl output_3dtiles_folder
+python cityjson_to_3dtiles.py input_cityjson.json output_3dtiles_folder --output-format glb
+
+--output-format selects the tile content: gltf (JSON + .bin, default), glb or b3dm.
+--max-tile-features / --max-tile-bytes: quadtree nodes are split until they hold at most this
+many buildings and estimated bytes.
+--max-tile-vertices / --max-tile-triangles set the per-tile budget; larger leaves are split
+into several tiles, and 32-bit indices are used only for tiles above 65535 vertices.
+--workers N merges and writes tiles in N processes; the output is the same as a serial run.
+--feature-metadata keeps buildings pickable in the merged tiles: every vertex gets the feature id
+of its CityObject (EXT_mesh_features; _BATCHID for b3dm) and the CityObject ids and attributes
+are written as a property table per tile (EXT_structural_metadata; the batch table for b3dm).
+--lod fills the parent tiles with simplified geometry (vertex clustering, see simplification.py) and
+refines by replacement; each parent's geometricError is its measured simplification error.
+--quantize stores positions as int16 relative to each tile's bounding box (KHR_mesh_quantization).
+--meshopt compresses the vertex and index buffers (EXT_meshopt_compression, needs meshoptimizer).
+--implicit-tiling writes a 3D Tiles 1.1 tileset.json with quadtree implicit tiling and binary
+subtrees/*.subtree availability files instead of listing every tile. Every tile's content then
+lies inside its quadtree cell: buildings crossing a cell's centre lines stay in that cell's tile.
+Vertices stay in the int32 form CityJSON stores them with its 'transform' until a tile is
+merged; tile positions are written as float32 relative to the tile's center (glTF node
+translation, b3dm RTC_CENTER), which keeps millimetre precision at projected-CRS magnitudes.
+A build_manifest.json records a hash of every leaf's input and output files; a rerun into the
+same folder only rewrites the leaves whose input changed (--full-rebuild rewrites everything).
 
 Note:
 This is a basic implementation and may need enhancements for complex CityJSON files.
 """
 
 import os
-import sys
 import json
+import math
+import argparse
+import hashlib
+import io
+import struct
+import tempfile
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, repeat
+from multiprocessing import shared_memory
 from pygltflib import GLTF2, Scene, Node, Mesh, Buffer, BufferView, Accessor, Asset, Primitive, Material
 
-def create_gltf_from_mesh(vertices, indices, output_path):
+from triangulation import triangulate_surfaces
+from feature_metadata import FEATURE_CLASS, batch_table, infer_schema, metadata_schema, property_table_columns
+from simplification import simplify_for_ancestors
+from i3s import create_i3s_from_mesh
+import pipeline_metrics
+import json_backend
+
+try:
+    import meshoptimizer
+except ImportError:
+    meshoptimizer = None
+
+B3DM_HEADER_LENGTH = 28
+# Largest quantized coordinate; positions span 0..QUANTIZED_MAX on every axis of the tile
+QUANTIZED_MAX = 32767
+
+def quantize_positions(vertices):
     """
-    Create a simple glTF file from vertices and triangle indices.
+    Quantize positions to int16 relative to their bounding box (KHR_mesh_quantization).
+    Every axis is mapped onto 0..32767 and padded with a fourth component so a vertex
+    stays 4-byte aligned (8 bytes instead of 12).
+    Returns (Nx4 int16 array, translation, scale) where translation + scale * q restores
+    the position; both go on the glTF node.
+    """
+    lo = vertices.min(axis=0).astype(np.float64) if len(vertices) else np.zeros(3)
+    hi = vertices.max(axis=0).astype(np.float64) if len(vertices) else np.zeros(3)
+    scale = np.where(hi > lo, hi - lo, 1.0) / QUANTIZED_MAX
+    quantized = np.zeros((len(vertices), 4), dtype=np.int16)
+    quantized[:, :3] = np.rint((vertices - lo) / scale)
+    return quantized, lo.tolist(), scale.tolist()
+
+def _meshopt_encode(array, mode, vertex_count):
+    """
+    Encode a vertex attribute (mode "ATTRIBUTES", one row per vertex) or index array
+    (mode "TRIANGLES") with the meshoptimizer codecs used by EXT_meshopt_compression.
+    Returns the encoded buffer as a uint8 array.
+    """
+    if meshoptimizer is None:
+        raise ImportError("EXT_meshopt_compression needs the meshoptimizer package (pip install meshoptimizer)")
+    if mode == "ATTRIBUTES":
+        # EXT_meshopt_compression only defines version 0 of the vertex codec
+        meshoptimizer.encode_vertex_version(0)
+        encoded = meshoptimizer.encode_vertex_buffer(array.view(np.uint8).reshape(len(array), -1))
+    else:
+        flat_indices = np.ascontiguousarray(array.reshape(-1), dtype=np.uint32)
+        encoded = meshoptimizer.encode_index_buffer(flat_indices, len(flat_indices), vertex_count)
+    return np.frombuffer(encoded, dtype=np.uint8)
+
+def _add_buffer_view(gltf, arrays, array, alignment=4, **kwargs):
+    """
+    Append array to the arrays of buffer 0 (padded to alignment) and add a buffer view for it.
+    Returns the index of the new buffer view.
+    """
+    offset = sum(a.nbytes for a in arrays)
+    if _pad(offset, alignment):
+        arrays.append(np.zeros(_pad(offset, alignment), dtype=np.uint8))
+        offset += arrays[-1].nbytes
+    gltf.bufferViews.append(BufferView(buffer=0, byteOffset=offset, byteLength=array.nbytes, **kwargs))
+    arrays.append(array)
+    return len(gltf.bufferViews) - 1
+
+def build_gltf_document(vertices, indices, quantize=False, meshopt=False, features=None, batch_ids=False,
+                        center=None):
+    """
+    Build the glTF document for a single mesh without attaching any buffer data.
     vertices: Nx3 numpy array
     indices: Mx3 numpy array (triangles)
-    output_path: path to save the glTF file
+    center: (x, y, z) the vertices are relative to; it becomes the translation of the node
+            (in float64 JSON), so the float32 positions stay precise far from the origin
+    quantize: store positions as int16 with KHR_mesh_quantization (see quantize_positions)
+    meshopt: compress the vertex and index buffer views with EXT_meshopt_compression; the
+             uncompressed layout is described by a fallback buffer without data
+    features: dict with 'vertex_feature' (feature id of every vertex, 0..K-1), 'rows' (the
+              K feature attribute dicts) and 'schema' (see feature_metadata.infer_schema).
+              The ids are stored as the _FEATURE_ID_0 attribute (EXT_mesh_features) and
+              the rows as an EXT_structural_metadata property table.
+    batch_ids: store the feature ids as the b3dm _BATCHID attribute instead, without
+               glTF metadata (the rows go to the b3dm batch table)
+    Returns (gltf, arrays) where arrays are the numpy arrays that make up buffer 0, in order.
     """
     gltf = GLTF2()
     gltf.asset = Asset(version="2.0")
 
-    # Flatten vertex data
-    vertex_data = vertices.astype(np.float32).tobytes()
-    index_data = indices.astype(np.uint16).tobytes()
-
-    # Create buffer
-    buffer = Buffer()
-    buffer.byteLength = len(vertex_data) + len(index_data)
-    gltf.buffers.append(buffer)
+    # Vertex and index arrays, laid out back to back in buffer 0
+    translation = scale = None
+    byte_stride = None
+    if quantize:
+        vertex_array, translation, scale = quantize_positions(vertices)
+        position_component = 5122  # SHORT
+        position_min = vertex_array[:, :3].min(axis=0).tolist() if len(vertices) else [0, 0, 0]
+        position_max = vertex_array[:, :3].max(axis=0).tolist() if len(vertices) else [0, 0, 0]
+        byte_stride = vertex_array.strides[0]
+    else:
+        vertex_array = np.ascontiguousarray(vertices, dtype=np.float32)
+        position_component = 5126  # FLOAT
+        position_min = [float(np.min(vertices[:,0])), float(np.min(vertices[:,1])), float(np.min(vertices[:,2]))]
+        position_max = [float(np.max(vertices[:,0])), float(np.max(vertices[:,1])), float(np.max(vertices[:,2]))]
+    # 16-bit indices when every index fits below the uint16 primitive restart value, else 32-bit
+    index_dtype, index_component = (np.uint16, 5123) if len(vertices) <= 0xFFFF else (np.uint32, 5125)
+    index_array = np.ascontiguousarray(indices, dtype=index_dtype)
 
     # BufferViews
-    vertex_buffer_view = BufferView(buffer=0, byteOffset=0, byteLength=len(vertex_data), target=34962)  # ARRAY_BUFFER
-    index_buffer_view = BufferView(buffer=0, byteOffset=len(vertex_data), byteLength=len(index_data), target=34963)  # ELEMENT_ARRAY_BUFFER
-    gltf.bufferViews.extend([vertex_buffer_view, index_buffer_view])
+    arrays = []
+    _add_buffer_view(gltf, arrays, vertex_array, byteStride=byte_stride, target=34962)  # ARRAY_BUFFER
+    _add_buffer_view(gltf, arrays, index_array, target=34963)  # ELEMENT_ARRAY_BUFFER
+    # Views that meshopt compresses, with their codec mode and element count
+    compressed_views = [(0, vertex_array, "ATTRIBUTES"), (1, index_array, "TRIANGLES")]
+
+    attributes = {"POSITION": 0}
+    feature_array = None
+    if features is not None:
+        # Feature ids as floats: exact up to 2^24 and 4-byte aligned as vertex attributes must be
+        feature_array = np.ascontiguousarray(features["vertex_feature"], dtype=np.float32)
+        view = _add_buffer_view(gltf, arrays, feature_array, target=34962)
+        compressed_views.append((view, feature_array, "ATTRIBUTES"))
+        attributes["_BATCHID" if batch_ids else "_FEATURE_ID_0"] = 2
+
+    if meshopt:
+        # Buffer 0 holds the compressed views; buffer 1 is the uncompressed fallback layout
+        fallback_length = sum(array.nbytes for array in arrays)
+        arrays = []
+        for view_index, array, mode in compressed_views:
+            encoded = _meshopt_encode(array, mode, len(vertex_array))
+            view = gltf.bufferViews[view_index]
+            used = sum(a.nbytes for a in arrays)
+            if _pad(used, 4):
+                arrays.append(np.zeros(_pad(used, 4), dtype=np.uint8))
+            offset = used + _pad(used, 4)
+            arrays.append(encoded)
+            view.buffer = 1
+            view.extensions = {"EXT_meshopt_compression": {
+                "buffer": 0, "byteOffset": offset, "byteLength": encoded.nbytes,
+                "byteStride": array.strides[0] if mode == "ATTRIBUTES" else array.itemsize,
+                "count": len(array) if mode == "ATTRIBUTES" else array.size, "mode": mode,
+            }}
+        gltf.extensionsUsed.append("EXT_meshopt_compression")
+        gltf.extensionsRequired.append("EXT_meshopt_compression")
 
     # Accessors
     # Positions
-    accessor_positions = Accessor(bufferView=0, byteOffset=0, componentType=5126, count=len(vertices), type="VEC3",
-                                  min=[float(np.min(vertices[:,0])), float(np.min(vertices[:,1])), float(np.min(vertices[:,2]))],
-                                  max=[float(np.max(vertices[:,0])), float(np.max(vertices[:,1])), float(np.max(vertices[:,2]))])
+    accessor_positions = Accessor(bufferView=0, byteOffset=0, componentType=position_component, count=len(vertices),
+                                  type="VEC3", min=position_min, max=position_max)
     # Indices
-    accessor_indices = Accessor(bufferView=1, byteOffset=0, componentType=5123, count=len(indices)*3, type="SCALAR")
+    accessor_indices = Accessor(bufferView=1, byteOffset=0, componentType=index_component, count=len(indices)*3, type="SCALAR")
 
     gltf.accessors.extend([accessor_positions, accessor_indices])
+    if feature_array is not None:
+        gltf.accessors.append(Accessor(bufferView=2, byteOffset=0, componentType=5126, count=len(feature_array),
+                                       type="SCALAR"))
 
     # Mesh primitive
-    primitive = Primitive(attributes={"POSITION":0}, indices=1, mode=4)  # TRIANGLES
+    primitive = Primitive(attributes=attributes, indices=1, mode=4)  # TRIANGLES
+
+    if features is not None and not batch_ids:
+        # Property table columns go to buffer 0 uncompressed, 8-byte aligned
+        properties = {}
+        for property_id, column in property_table_columns(features["rows"], features["schema"]).items():
+            properties[property_id] = {"values": _add_buffer_view(gltf, arrays, column["values"], alignment=8)}
+            if "stringOffsets" in column:
+                properties[property_id]["stringOffsets"] = _add_buffer_view(gltf, arrays, column["stringOffsets"],
+                                                                            alignment=8)
+                properties[property_id]["stringOffsetType"] = "UINT32"
+        gltf.extensions["EXT_structural_metadata"] = {
+            "schema": metadata_schema(features["schema"]),
+            "propertyTables": [{"class": FEATURE_CLASS, "count": len(features["rows"]), "properties": properties}],
+        }
+        primitive.extensions = {"EXT_mesh_features": {
+            "featureIds": [{"featureCount": len(features["rows"]), "attribute": 0, "propertyTable": 0}]
+        }}
+        gltf.extensionsUsed.extend(["EXT_mesh_features", "EXT_structural_metadata"])
+
+    # Create buffer
+    gltf.buffers.append(Buffer(byteLength=sum(array.nbytes for array in arrays)))
+    if meshopt:
+        gltf.buffers.append(Buffer(byteLength=fallback_length, extensions={"EXT_meshopt_compression": {"fallback": True}}))
 
     # Material (default)
     material = Material()
@@ -72,190 +249,1559 @@ def create_gltf_from_mesh(vertices, indices, output_path):
     mesh = Mesh(primitives=[primitive])
     gltf.meshes.append(mesh)
 
-    # Node
-    node = Node(mesh=0)
+    # Node; quantized positions are mapped back to their bounding box by the node transform,
+    # and relative positions moved back to their center
+    if center is not None:
+        translation = (np.asarray(center, dtype=np.float64) + (translation or 0.0)).tolist()
+    node = Node(mesh=0, translation=translation, scale=scale)
     gltf.nodes.append(node)
+    if quantize:
+        gltf.extensionsUsed.append("KHR_mesh_quantization")
+        gltf.extensionsRequired.append("KHR_mesh_quantization")
 
     # Scene
     scene = Scene(nodes=[0])
     gltf.scenes.append(scene)
     gltf.scene = 0
 
-    # Set buffer data
-    gltf.set_binary_blob(vertex_data + index_data)
+    return gltf, arrays
+
+def create_gltf_from_mesh(vertices, indices, output_path, quantize=False, meshopt=False, features=None,
+                          opener=open, center=None):
+    """
+    Create a simple glTF file from vertices and triangle indices.
+    vertices: Nx3 numpy array
+    indices: Mx3 numpy array (triangles)
+    output_path: path to save the glTF file
+    quantize, meshopt: position quantization and buffer compression (see build_gltf_document)
+    features: per-vertex feature ids and attribute rows (see build_gltf_document)
+    opener: called as opener(path, "wb") to open the output files (see open_output)
+    center: point the vertices are relative to (see build_gltf_document)
+    """
+    gltf, arrays = build_gltf_document(vertices, indices, quantize, meshopt, features, center=center)
+
+    # Buffer 0 goes to a .bin file next to the glTF; a meshopt fallback buffer has no data
+    bin_path = os.path.splitext(output_path)[0] + ".bin"
+    gltf.buffers[0].uri = os.path.basename(bin_path)
+    with opener(bin_path, "wb") as f:
+        for array in arrays:
+            f.write(array.data)
 
     # Save glTF
-    gltf.save(output_path)
+    with opener(output_path, "wb") as f:
+        f.write(gltf.gltf_to_json().encode("utf-8"))
 
-def parse_cityjson_geometry(cityjson):
+def _pad(length, alignment):
+    return (alignment - length % alignment) % alignment
+
+def _glb_layout(gltf, arrays, alignment=4):
     """
-    Parse CityJSON geometries into a list of (vertices, indices) tuples.
-    This function assumes simple geometry types (e.g. MultiSurface or Solid).
+    Serialize the glTF JSON chunk and compute the BIN chunk length for a GLB container.
+    Both chunks are padded to 4 bytes; the BIN chunk is padded further so the whole
+    GLB length is a multiple of alignment.
+    Returns (json_chunk, bin_length, glb_length).
     """
-    vertices_list = []
-    indices_list = []
+    json_chunk = gltf.gltf_to_json(separators=(",", ":"), indent=None).encode("utf-8")
+    json_chunk += b" " * _pad(len(json_chunk), 4)
+    data_length = sum(array.nbytes for array in arrays)
+    bin_length = data_length + _pad(data_length, 4)
+    bin_length += _pad(12 + 8 + len(json_chunk) + 8 + bin_length, alignment)
+    glb_length = 12 + 8 + len(json_chunk) + 8 + bin_length
+    return json_chunk, bin_length, glb_length
 
-    vertices_global = cityjson.get("vertices", [])
-    vertices_global = np.array(vertices_global, dtype=np.float32)
+def _write_glb(f, arrays, json_chunk, bin_length, glb_length):
+    """
+    Write a GLB container with one JSON chunk and one BIN chunk.
+    The arrays are written straight from their memory, without joining them into one bytes object.
+    """
+    f.write(struct.pack("<4sII", b"glTF", 2, glb_length))
+    f.write(struct.pack("<I4s", len(json_chunk), b"JSON"))
+    f.write(json_chunk)
+    f.write(struct.pack("<I4s", bin_length, b"BIN\0"))
+    written = 0
+    for array in arrays:
+        f.write(array.data)
+        written += array.nbytes
+    f.write(b"\0" * (bin_length - written))
+
+def create_glb_from_mesh(vertices, indices, output_path, quantize=False, meshopt=False, features=None,
+                         opener=open, center=None):
+    """
+    Create a binary glTF (.glb) file from vertices and triangle indices.
+    vertices: Nx3 numpy array
+    indices: Mx3 numpy array (triangles)
+    output_path: path to save the GLB file
+    quantize, meshopt: position quantization and buffer compression (see build_gltf_document)
+    features: per-vertex feature ids and attribute rows (see build_gltf_document)
+    opener: called as opener(path, "wb") to open the output file (see open_output)
+    center: point the vertices are relative to (see build_gltf_document)
+    """
+    gltf, arrays = build_gltf_document(vertices, indices, quantize, meshopt, features, center=center)
+    json_chunk, bin_length, glb_length = _glb_layout(gltf, arrays)
+    with opener(output_path, "wb") as f:
+        _write_glb(f, arrays, json_chunk, bin_length, glb_length)
+
+def create_b3dm_from_mesh(vertices, indices, output_path, batch_length=0, quantize=False, meshopt=False,
+                          features=None, opener=open, center=None):
+    """
+    Create a 3D Tiles Batched 3D Model (.b3dm) file from vertices and triangle indices.
+    The feature table holds BATCH_LENGTH; the GLB payload is embedded as in create_glb_from_mesh.
+    vertices: Nx3 numpy array
+    indices: Mx3 numpy array (triangles)
+    output_path: path to save the b3dm file
+    batch_length: number of features (batch ids) in the model
+    quantize, meshopt: position quantization and buffer compression (see build_gltf_document)
+    features: per-vertex feature ids and attribute rows (see build_gltf_document); the ids
+              become the _BATCHID attribute, the rows the batch table, and batch_length
+              the number of rows
+    opener: called as opener(path, "wb") to open the output file (see open_output)
+    center: point the vertices are relative to; written as the feature table RTC_CENTER
+    """
+    gltf, arrays = build_gltf_document(vertices, indices, quantize, meshopt, features, batch_ids=True)
+    json_chunk, bin_length, glb_length = _glb_layout(gltf, arrays, alignment=8)
+
+    # The feature and batch table JSON are padded so the GLB starts on an 8-byte boundary
+    batch_table_json = b""
+    if features is not None:
+        batch_length = len(features["rows"])
+        batch_table_json = json_backend.dumps(batch_table(features["rows"], features["schema"]))
+        batch_table_json += b" " * _pad(len(batch_table_json), 8)
+    feature_table = {"BATCH_LENGTH": batch_length}
+    if center is not None:
+        feature_table["RTC_CENTER"] = [float(c) for c in center]
+    feature_table = json_backend.dumps(feature_table)
+    feature_table += b" " * _pad(B3DM_HEADER_LENGTH + len(feature_table), 8)
+    byte_length = B3DM_HEADER_LENGTH + len(feature_table) + len(batch_table_json) + glb_length
+
+    with opener(output_path, "wb") as f:
+        f.write(struct.pack("<4s6I", b"b3dm", 1, byte_length, len(feature_table), 0, len(batch_table_json), 0))
+        f.write(feature_table)
+        f.write(batch_table_json)
+        _write_glb(f, arrays, json_chunk, bin_length, glb_length)
+
+# Tile writers by output format; the format is also the tile file extension
+TILE_WRITERS = {
+    "gltf": create_gltf_from_mesh,
+    "glb": create_glb_from_mesh,
+    "b3dm": create_b3dm_from_mesh,
+}
+# Writers of formats that write several resources per tile and are only written into
+# archives (see cityjson_to_slpk.py), not referenced from a tileset.json
+ARCHIVE_WRITERS = {
+    "i3s": create_i3s_from_mesh,
+}
+
+def _concat_ranges(starts, stops):
+    """
+    Concatenate the integer ranges [starts[i], stops[i]) into one flat array without a Python loop.
+    """
+    lengths = stops - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    keep = lengths > 0
+    starts, lengths = starts[keep], lengths[keep]
+    steps = np.ones(total, dtype=np.int64)
+    steps[0] = starts[0]
+    heads = np.cumsum(lengths)[:-1]
+    steps[heads] = starts[1:] - (starts[:-1] + lengths[:-1] - 1)
+    return np.cumsum(steps)
 
+def parse_cityjson_geometry(cityjson):
+    """
+    Parse CityJSON geometries into flat, offset-indexed arrays.
+    This function handles 'Solid' and 'MultiSurface' geometries; other types are skipped.
+
+    Vertices are kept as CityJSON stores them: int32 with a 'transform', float64 without.
+    Use vertex_coordinates for their real-world coordinates.
+
+    Returns a dict with:
+    - vertices: Nx3 int32 (or float64) array of all CityJSON vertices
+    - scale, translate: (3,) float64 transform of the vertices (1 and 0 without a transform)
+    - ring_vertices: flat array of vertex ids of every ring (exterior and interior)
+    - ring_offsets: (R+1) offsets of each ring into ring_vertices
+    - surface_offsets: (S+1) offsets of each surface into the rings, first ring is exterior
+    - surface_object: (S,) index into object_ids of the CityObject owning each surface
+    - object_ids: list of CityObject ids
+    - object_attributes: list of the 'attributes' dict of every CityObject
+    - triangles: Tx3 triangles of every surface (holes included), as positions into ring_vertices
+    - triangle_surface: (T,) surface index of each triangle, sorted (triangles are in surface order)
+    """
+    transform = cityjson.get("transform")
+    vertices_global = _stored_vertices(cityjson.get("vertices", []), transform)
     city_objects = cityjson.get("CityObjects", {})
+    return _flatten_city_objects(vertices_global, city_objects.items(), transform)
+
+def parse_cityjson_features(features, transform=None):
+    """
+    Parse a batch of CityJSONFeature objects (from a CityJSONSeq file) into the same
+    structure as parse_cityjson_geometry.
+    Each feature has its own vertex list; the ring vertex ids are shifted so they index
+    the concatenated vertices. The vertices keep the header 'transform' (scale/translate),
+    as in parse_cityjson_geometry.
+    The result has an extra 'object_feature' array mapping each CityObject to its feature.
+    """
+    vertex_arrays = []
+    object_counts = []
+    for feature in features:
+        vertex_arrays.append(_stored_vertices(feature.get("vertices", []), transform))
+        object_counts.append(len(feature.get("CityObjects", {})))
+    vertices = np.vstack(vertex_arrays) if vertex_arrays else _stored_vertices([], transform)
+
+    # Each feature's local vertex ids are shifted by the feature's offset into the stacked vertices
+    vertex_offsets = np.cumsum([0] + [len(v) for v in vertex_arrays[:-1]]).astype(np.int64)
+    object_feature = np.repeat(np.arange(len(object_counts), dtype=np.int64), object_counts)
+    items = chain.from_iterable(feature.get("CityObjects", {}).items() for feature in features)
+    geometry = _flatten_city_objects(vertices, items, transform, vertex_offsets[object_feature])
+    geometry["object_feature"] = object_feature
+    return geometry
 
-    for obj_id, obj in city_objects.items():
-        geom = obj.get("geometry", [])
-        for g in geom:
-            # We handle only 'Solid' or 'MultiSurface' types here
+def _stored_vertices(vertices, transform):
+    """
+    CityJSON vertices as an Nx3 array in their stored form: int32 when a transform applies
+    (int64 if they do not fit), float64 otherwise or when the file stores non-integer
+    vertices despite its transform.
+    """
+    array = np.asarray(vertices).reshape(-1, 3)
+    if not transform or array.dtype.kind not in "iu":
+        return array.astype(np.float64, copy=False)
+    info = np.iinfo(np.int32)
+    if not len(array) or (array.min() >= info.min and array.max() <= info.max):
+        return array.astype(np.int32)
+    return array.astype(np.int64, copy=False)
+
+def vertex_coordinates(geometry, vertex_ids=None):
+    """
+    Real-world float64 coordinates of the given vertices (all of them when None), with the
+    CityJSON transform applied: stored * scale + translate.
+    """
+    vertices = geometry["vertices"] if vertex_ids is None else geometry["vertices"][vertex_ids]
+    return vertices * geometry["scale"] + geometry["translate"]
+
+def _flatten_city_objects(vertices_global, city_objects, transform=None, object_vertex_offsets=None):
+    """
+    Flatten (id, CityObject) pairs that index into vertices_global; see parse_cityjson_geometry.
+    transform: the CityJSON transform of vertices_global, or None
+    object_vertex_offsets: optional offset added to the vertex ids of every CityObject, for
+                           objects whose ids are local to their own vertex list
+    """
+    # Collect the surfaces of every geometry; only one Python step per geometry, not per surface
+    surfaces = []
+    surface_counts = []
+    object_ids = []
+    object_attributes = []
+    for obj_id, obj in city_objects:
+        object_ids.append(obj_id)
+        object_attributes.append(obj.get("attributes") or {})
+        count = 0
+        for g in obj.get("geometry", []):
             geom_type = g.get("type")
             boundaries = g.get("boundaries", [])
-
             if geom_type == "Solid":
                 # Solid boundaries: list of shells, each shell is list of surfaces
                 for shell in boundaries:
-                    for surface in shell:
-                        # surface is list of rings, first ring is exterior
-                        exterior_ring = surface[0]
-                        # Convert vertex indices to coordinates
-                        verts = vertices_global[exterior_ring]
-                        # Triangulate polygon (assuming convex polygon)
-                        # Simple fan triangulation
-                        indices = []
-                        for i in range(1, len(exterior_ring)-1):
-                            indices.append([0, i, i+1])
-                        vertices_list.append(verts)
-                        indices_list.append(np.array(indices, dtype=np.uint16))
+                    surfaces.extend(shell)
+                    count += len(shell)
             elif geom_type == "MultiSurface":
-                # MultiSurface boundaries: list of surfaces
-                for surface in boundaries:
-                    # surface is list of rings, first ring is exterior
-                    exterior_ring = surface[0]
-                    verts = vertices_global[exterior_ring]
-                    indices = []
-                    for i in range(1, len(exterior_ring)-1):
-                        indices.append([0, i, i+1])
-                    vertices_list.append(verts)
-                    indices_list.append(np.array(indices, dtype=np.uint16))
-            else:
-                # Unsupported geometry type
-                continue
+                surfaces.extend(boundaries)
+                count += len(boundaries)
+        surface_counts.append(count)
+
+    surface_object = np.repeat(np.arange(len(object_ids), dtype=np.int64),
+                               np.asarray(surface_counts, dtype=np.int64))
+
+    # Flatten surfaces -> rings -> vertex ids in bulk
+    ring_counts = np.fromiter(map(len, surfaces), dtype=np.int64, count=len(surfaces))
+    rings = list(chain.from_iterable(surfaces))
+    ring_sizes = np.fromiter(map(len, rings), dtype=np.int64, count=len(rings))
+    ring_vertices = np.fromiter(chain.from_iterable(rings), dtype=np.int64, count=int(ring_sizes.sum()))
+
+    surface_offsets = np.zeros(len(surfaces) + 1, dtype=np.int64)
+    np.cumsum(ring_counts, out=surface_offsets[1:])
+    ring_offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+    np.cumsum(ring_sizes, out=ring_offsets[1:])
+    if object_vertex_offsets is not None:
+        # Before triangulating, so every ring is clipped with its own object's coordinates
+        surface_corners = ring_offsets[surface_offsets[1:]] - ring_offsets[surface_offsets[:-1]]
+        ring_vertices += np.repeat(object_vertex_offsets[surface_object], surface_corners)
+
+    # Fan convex rings in bulk, ear clip concave rings and rings with holes. The stored
+    # vertices do: the triangulation of a polygon does not change under scale and translate
+    triangles, triangle_surface = triangulate_surfaces(vertices_global, ring_vertices, ring_offsets, surface_offsets)
+
+    transform = transform or {}
+    return {
+        "vertices": vertices_global,
+        "scale": np.asarray(transform.get("scale", [1, 1, 1]), dtype=np.float64),
+        "translate": np.asarray(transform.get("translate", [0, 0, 0]), dtype=np.float64),
+        "ring_vertices": ring_vertices,
+        "ring_offsets": ring_offsets,
+        "surface_offsets": surface_offsets,
+        "surface_object": surface_object,
+        "object_ids": object_ids,
+        "object_attributes": object_attributes,
+        "triangles": triangles,
+        "triangle_surface": triangle_surface,
+    }
+
+def exterior_ring_ranges(geometry):
+    """
+    Return (start, stop) positions into ring_vertices of the exterior ring of every surface.
+    Surfaces without rings get an empty range.
+    """
+    ring_offsets = geometry["ring_offsets"]
+    first_ring = geometry["surface_offsets"][:-1]
+    has_ring = geometry["surface_offsets"][1:] > first_ring
+    start = ring_offsets[first_ring]
+    stop = np.where(has_ring, ring_offsets[np.minimum(first_ring + 1, len(ring_offsets) - 1)], start)
+    return start, stop
 
-    return vertices_list, indices_list
+def surface_ring_ranges(geometry):
+    """
+    Return (start, stop) positions into ring_vertices covering all rings (exterior and
+    interior) of every surface.
+    """
+    ring_offsets = geometry["ring_offsets"]
+    surface_offsets = geometry["surface_offsets"]
+    return ring_offsets[surface_offsets[:-1]], ring_offsets[surface_offsets[1:]]
 
-def generate_tileset_json(tiles, output_folder):
+def write_if_changed(path, data):
+    """
+    Write data to path unless the file already holds exactly these bytes, so unchanged
+    files keep their modification time. Returns True if the file was written.
+    """
+    if os.path.isfile(path) and os.path.getsize(path) == len(data):
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+# The tile output ("output_folder") is a directory path, or an archive: any object with an
+# open(name, mode) method returning a writable binary file, e.g. cityjson_to_slpk.SlpkWriter,
+# that the tiles are streamed into instead of being written to disk.
+
+def open_output(output_folder, name):
+    """
+    Path of file `name` in the tile output and the opener to open it with (builtin open
+    for a directory, the archive's open otherwise). Returns (path, opener).
+    """
+    if isinstance(output_folder, str):
+        return os.path.join(output_folder, name), open
+    return name, output_folder.open
+
+def write_output(output_folder, name, data):
+    """
+    Write the bytes of file `name` (e.g. tileset.json) to the tile output; in a directory
+    unchanged files are left untouched (see write_if_changed). Returns True if written.
+    """
+    if isinstance(output_folder, str):
+        return write_if_changed(os.path.join(output_folder, name), data)
+    with output_folder.open(name, "wb") as f:
+        f.write(data)
+    return True
+
+class _MemoryFile(io.BytesIO):
+    def __init__(self, files, name):
+        super().__init__()
+        self._files, self._name = files, name
+
+    def close(self):
+        if not self.closed:
+            self._files[self._name] = self.getvalue()
+        super().close()
+
+class MemoryOutput:
+    """
+    Tile output keeping the written files in memory, as {name: bytes} in `files`.
+    Pool workers write to one when the real output is an archive they cannot share, and
+    send the files back to the process owning the archive (see copy_output).
+    """
+    def __init__(self):
+        self.files = {}
+
+    def open(self, name, mode="wb"):
+        return _MemoryFile(self.files, name)
+
+def copy_output(files, output_folder):
+    """
+    Write the {name: bytes} files kept by a MemoryOutput to the tile output.
+    """
+    for name, data in files.items():
+        with output_folder.open(name, "wb") as f:
+            f.write(data)
+
+def tile_box(min_xyz, max_xyz):
+    """
+    3D Tiles oriented bounding box (axis aligned) for the given min/max corners.
+    """
+    center = ((np.asarray(min_xyz) + np.asarray(max_xyz)) / 2).tolist()
+    half_sizes = ((np.asarray(max_xyz) - np.asarray(min_xyz)) / 2).tolist()
+    return [
+        center[0], center[1], center[2],
+        half_sizes[0], 0, 0,
+        0, half_sizes[1], 0,
+        0, 0, half_sizes[2]
+    ]
+
+def _tileset_entry(tile):
+    tile_entry = {
+        "boundingVolume": {
+            "box": tile_box(tile["min"], tile["max"])
+        },
+        "geometricError": tile["geometricError"]
+    }
+    if "gltf" in tile:
+        tile_entry["content"] = {
+            "uri": tile["gltf"]
+        }
+    if "contents" in tile:
+        tile_entry["contents"] = [{"uri": content["gltf"]} for content in tile["contents"]]
+    if tile.get("children"):
+        tile_entry["children"] = [_tileset_entry(child) for child in tile["children"]]
+    return tile_entry
+
+def _has_contents(tile):
+    return "contents" in tile or any(_has_contents(child) for child in tile.get("children", []))
+
+def generate_tileset_json(root, output_folder):
     """
     Generate a tileset.json file for 3D Tiles referencing the glTF tiles.
-    tiles: list of dicts with keys: 'gltf', 'boundingVolume' (box)
-    output_folder: folder to save tileset.json
+    root: root tile dict returned by build_tiles, with keys 'min', 'max', 'geometricError'
+          and optionally 'gltf' (content uri), 'contents' (several content tile dicts),
+          'children' and 'refine' (default ADD)
+    output_folder: folder (or archive, see open_output) to save tileset.json to
+    Tiles with several contents need 3D Tiles 1.1; the tileset is 1.0 otherwise.
     """
     tileset = {
         "asset": {
-            "version": "1.0"
+            "version": "1.1" if _has_contents(root) else "1.0"
+        },
+        "geometricError": max(2 * root["geometricError"], 1.0),
+        "root": _tileset_entry(root)
+    }
+    tileset["root"]["refine"] = root.get("refine", "ADD")
+
+    write_output(output_folder, "tileset.json", json_backend.dumps(tileset))
+
+# Levels per .subtree file in implicit tiling output
+SUBTREE_LEVELS = 4
+
+def _morton_index(x, y):
+    """
+    Morton (Z-order) index of quadtree cell (x, y) within its level, x in the even bits.
+    """
+    index = 0
+    for bit in range(max(int(x), int(y)).bit_length()):
+        index |= ((x >> bit) & 1) << (2 * bit) | ((y >> bit) & 1) << (2 * bit + 1)
+    return index
+
+def _implicit_tiles(tile, tiles):
+    """
+    Collect the quadtree tiles of the tile tree as (level, x, y) -> set of content indices.
+    Content 0 is a single tile (<name>); a tile split into n chunks has contents 1..n
+    (<name>_0 .. <name>_<n-1>), as chunk child tiles or as 'contents'.
+    """
+    contents = set()
+    if "gltf" in tile:
+        contents.add(0)
+    contents.update(content["chunk"] + 1 for content in tile.get("contents", []))
+    for child in tile.get("children", []):
+        if "level" in child:
+            _implicit_tiles(child, tiles)
+        else:
+            # A node holding items besides its children has its content as child tiles
+            contents.add(child.get("chunk", -1) + 1)
+    tiles[(tile["level"], tile["x"], tile["y"])] = contents
+    return tiles
+
+def _availability(bits, buffer_views, chunks):
+    """
+    Availability object for a bit array: a constant when every bit is the same, else a
+    bitstream buffer view appended to chunks (padded to 8 bytes).
+    """
+    available = int(bits.sum())
+    if available in (0, len(bits)):
+        return {"constant": int(available > 0)}
+    data = np.packbits(bits, bitorder="little").tobytes()
+    offset = sum(len(chunk) for chunk in chunks)
+    chunks.append(data + b"\0" * _pad(len(data), 8))
+    buffer_views.append({"buffer": 0, "byteOffset": offset, "byteLength": len(data)})
+    return {"bitstream": len(buffer_views) - 1, "availableCount": available}
+
+def write_subtree(output_folder, name, tile_bits, content_bits, child_bits):
+    """
+    Write a binary .subtree file `name` to the tile output (3D Tiles 1.1 implicit tiling).
+    tile_bits: availability of every tile in the subtree, level by level in Morton order
+    content_bits: list of availability bit arrays, one per content of the tiles
+    child_bits: availability of the child subtrees, in Morton order
+    """
+    buffer_views, chunks = [], []
+    subtree = {
+        "tileAvailability": _availability(tile_bits, buffer_views, chunks),
+        "contentAvailability": [_availability(bits, buffer_views, chunks) for bits in content_bits],
+        "childSubtreeAvailability": _availability(child_bits, buffer_views, chunks),
+    }
+    binary = b"".join(chunks)
+    if binary:
+        subtree = {"buffers": [{"byteLength": len(binary)}], "bufferViews": buffer_views, **subtree}
+    json_chunk = json_backend.dumps(subtree)
+    json_chunk += b" " * _pad(len(json_chunk), 8)
+    write_output(output_folder, name,
+                 struct.pack("<4sIQQ", b"subt", 1, len(json_chunk), len(binary)) + json_chunk + binary)
+
+def generate_implicit_tileset(root, output_folder, output_format="gltf", subtree_levels=SUBTREE_LEVELS):
+    """
+    Generate a 3D Tiles 1.1 tileset.json with quadtree implicit tiling instead of explicit
+    tiles. The tileset only holds the root tile with content and subtree uri templates;
+    tile and content availability are written to binary subtrees/<level>_<x>_<y>.subtree
+    files of subtree_levels levels each.
+    root: root tile dict returned by build_tiles (see finalize_tile_tree)
+    output_folder: folder (or archive) holding the tiles, to save tileset.json and the subtrees to
+    output_format: tile file format, the extension of the content uris
+    The root tile covers the square quadtree cell over the data and its z range; the
+    geometricError halves at every level as in generate_tileset_json.
+    """
+    tiles = _implicit_tiles(root, {})
+    available_levels = max(level for level, _, _ in tiles) + 1
+    num_contents = max(max(contents, default=0) for contents in tiles.values()) + 1
+
+    # Group the tiles by the subtree they belong to
+    subtrees = {}
+    for (level, x, y), contents in tiles.items():
+        depth = level % subtree_levels
+        key = (level - depth, x >> depth, y >> depth)
+        subtrees.setdefault(key, []).append((depth, x - (key[1] << depth), y - (key[2] << depth), contents))
+
+    if isinstance(output_folder, str):
+        os.makedirs(os.path.join(output_folder, "subtrees"), exist_ok=True)
+    num_subtree_tiles = (4 ** subtree_levels - 1) // 3
+    for (level, x, y), members in subtrees.items():
+        tile_bits = np.zeros(num_subtree_tiles, dtype=np.uint8)
+        content_bits = np.zeros((num_contents, num_subtree_tiles), dtype=np.uint8)
+        for depth, local_x, local_y, contents in members:
+            bit = (4 ** depth - 1) // 3 + _morton_index(local_x, local_y)
+            tile_bits[bit] = 1
+            content_bits[sorted(contents), bit] = 1
+
+        # A child subtree is available when its root tile is
+        child_bits = np.zeros(4 ** subtree_levels, dtype=np.uint8)
+        child_level = level + subtree_levels
+        for child_x in range(x << subtree_levels, (x + 1) << subtree_levels):
+            for child_y in range(y << subtree_levels, (y + 1) << subtree_levels):
+                if (child_level, child_x, child_y) in subtrees:
+                    child_bits[_morton_index(child_x - (x << subtree_levels), child_y - (y << subtree_levels))] = 1
+
+        write_subtree(output_folder, f"subtrees/{level}_{x}_{y}.subtree", tile_bits, list(content_bits), child_bits)
+
+    content_uris = [f"tile_{{level}}_{{x}}_{{y}}.{output_format}"]
+    content_uris += [f"tile_{{level}}_{{x}}_{{y}}_{n}.{output_format}" for n in range(num_contents - 1)]
+    origin, size = root["origin"], root["size"]
+    root_error = size * math.sqrt(2)
+    root_tile = {
+        "boundingVolume": {
+            "box": tile_box([origin[0], origin[1], root["min"][2]], [origin[0] + size, origin[1] + size, root["max"][2]])
         },
-        "geometricError": 500,
-        "root": {
-            "boundingVolume": {
-                "box": [0,0,0, 1000,0,0, 0,1000,0, 0,0,1000]  # Placeholder box
-            },
-            "geometricError": 250,
-            "refine": "ADD",
-            "children": []
+        "geometricError": root_error,
+        "refine": root.get("refine", "ADD"),
+        "implicitTiling": {
+            "subdivisionScheme": "QUADTREE",
+            "subtreeLevels": subtree_levels,
+            "availableLevels": available_levels,
+            "subtrees": {"uri": "subtrees/{level}_{x}_{y}.subtree"}
         }
     }
+    if len(content_uris) == 1:
+        root_tile["content"] = {"uri": content_uris[0]}
+    else:
+        root_tile["contents"] = [{"uri": uri} for uri in content_uris]
 
+    tileset = {
+        "asset": {
+            "version": "1.1"
+        },
+        "geometricError": 2 * root_error,
+        "root": root_tile
+    }
+    write_output(output_folder, "tileset.json", json_backend.dumps(tileset))
+
+# Quadtree thresholds: a node is split while it holds more features or estimated bytes than this
+MAX_TILE_FEATURES = 2000
+MAX_TILE_BYTES = 4 * 1024 * 1024
+MAX_TREE_DEPTH = 12
+
+# Default per-tile budget; tiles over it are split into several content chunks
+MAX_TILE_VERTICES = 65535
+MAX_TILE_TRIANGLES = 100000
+
+# Number of CityJSONSeq features parsed together in streaming mode
+STREAM_BATCH_SIZE = 5000
+
+def item_stats(geometry, surface_item, num_items):
+    """
+    Centroid, x/y extent and estimated tile payload of every item (CityObject or feature).
+    surface_item: (S,) item index of every surface
+    The centroid is the mean of the item's exterior ring vertices; the payload is
+    12 bytes per vertex and 6 per triangle. Items without vertices get a NaN centroid.
+    Returns (centroids Nx3, extents Nx4 as xmin, ymin, xmax, ymax, sizes N).
+    """
+    start, stop = exterior_ring_ranges(geometry)
+    counts = stop - start
+    coords = vertex_coordinates(geometry, geometry["ring_vertices"])
+    csum = np.zeros((len(coords) + 1, 3), dtype=np.float64)
+    np.cumsum(coords, axis=0, out=csum[1:])
+    surface_sums = csum[stop] - csum[start]
+
+    vertex_counts = np.bincount(surface_item, weights=counts, minlength=num_items)
+    triangle_counts = np.bincount(surface_item[geometry["triangle_surface"]], minlength=num_items)
+    sums = np.column_stack([np.bincount(surface_item, weights=surface_sums[:, axis], minlength=num_items)
+                            for axis in range(3)]).reshape(-1, 3)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centroids = sums / vertex_counts[:, None]
+
+    # Exterior rings enclose the holes, so their vertices give the whole extent
+    extents = np.tile([np.inf, np.inf, -np.inf, -np.inf], (num_items, 1))
+    if len(coords):
+        exterior = np.repeat(np.arange(len(counts)), counts)
+        ring_position = np.arange(len(exterior)) - np.repeat(np.cumsum(counts) - counts, counts) + start[exterior]
+        vertex_item = surface_item[exterior]
+        np.minimum.at(extents[:, :2], vertex_item, coords[ring_position, :2])
+        np.maximum.at(extents[:, 2:], vertex_item, coords[ring_position, :2])
+    return centroids, extents, vertex_counts * 12 + triangle_counts * 6
+
+def build_quadtree(centroids, sizes, max_features=MAX_TILE_FEATURES, max_bytes=MAX_TILE_BYTES,
+                   max_depth=MAX_TREE_DEPTH, extents=None):
+    """
+    Build a quadtree over the x/y centroids of the items, starting from their extent.
+    A node is split into (up to) four children while it holds more than max_features
+    items or more than max_bytes estimated bytes, down to max_depth levels.
+    Items with a NaN centroid are left out.
+    extents: optional Nx4 x/y extents of the items (see item_stats). The root cell then
+             covers the whole extent of the items, and an item only moves into the child
+             whose cell contains all of it: items crossing the centre lines of a node stay
+             in that node, which then holds them besides its children. Every item lies
+             inside its node's cell, as implicit tiling requires.
+    Returns (root, leaves, item_leaf): the node tree, the list of nodes holding items
+    (the leaves, and with extents the nodes keeping items) and the index in it of every
+    item (-1 if left out). Nodes are dicts with keys 'name', 'level', 'x', 'y', 'size'
+    (edge length of the square cell) and 'children'; the root also has 'origin', the
+    x/y of its lower left corner.
+    """
+    item_leaf = np.full(len(centroids), -1, dtype=np.int64)
+    leaves = []
+    valid = np.flatnonzero(~np.isnan(centroids[:, 0]))
+
+    if len(valid) and extents is not None:
+        origin = extents[valid, :2].min(axis=0)
+        root_size = max(float((extents[valid, 2:].max(axis=0) - origin).max()), 1.0)
+    elif len(valid):
+        origin = centroids[valid, :2].min(axis=0)
+        root_size = max(float((centroids[valid, :2].max(axis=0) - origin).max()), 1.0)
+    else:
+        origin, root_size = np.zeros(2), 1.0
+
+    def split(level, x, y, idx):
+        size = root_size / 2 ** level
+        node = {"name": f"tile_{level}_{x}_{y}", "level": level, "x": x, "y": y, "size": size, "children": []}
+        if (len(idx) <= max_features and sizes[idx].sum() <= max_bytes) or level >= max_depth:
+            item_leaf[idx] = len(leaves)
+            leaves.append(node)
+            return node
+
+        # Quadrant of every item relative to the cell centre
+        half = size / 2
+        centre_x = origin[0] + (x * size + half)
+        centre_y = origin[1] + (y * size + half)
+        qx = centroids[idx, 0] >= centre_x
+        qy = centroids[idx, 1] >= centre_y
+        if extents is not None:
+            # Items reaching across a centre line fit in no child cell
+            fits = (np.where(qx, extents[idx, 0] >= centre_x, extents[idx, 2] <= centre_x)
+                    & np.where(qy, extents[idx, 1] >= centre_y, extents[idx, 3] <= centre_y))
+            if not fits.all():
+                item_leaf[idx[~fits]] = len(leaves)
+                leaves.append(node)
+                idx, qx, qy = idx[fits], qx[fits], qy[fits]
+        for dy in (0, 1):
+            for dx in (0, 1):
+                sub = idx[(qx == dx) & (qy == dy)]
+                if len(sub):
+                    node["children"].append(split(level + 1, 2 * x + dx, 2 * y + dy, sub))
+        return node
+
+    root = split(0, 0, 0, valid)
+    root["origin"] = origin.tolist()
+    return root, leaves, item_leaf
+
+def group_surfaces_by_tile(surface_tile):
+    """
+    Group surface ids by tile.
+    Yields (tile_key, surface ids) in order of first appearance in the input; surfaces keep
+    their input order inside a tile. Surfaces with tile -1 are skipped.
+    """
+    surface_ids = np.flatnonzero(surface_tile >= 0)
+    order = surface_ids[np.argsort(surface_tile[surface_ids], kind="stable")]
+    tile_keys, tile_first = np.unique(surface_tile[order], return_index=True)
+    tile_stop = np.append(tile_first[1:], len(order))
+
+    # Keep the tiles in order of first appearance in the input
+    for t in np.argsort(order[tile_first], kind="stable"):
+        yield int(tile_keys[t]), order[tile_first[t]:tile_stop[t]]
+
+def merge_surfaces(geometry, surfaces, feature_ids=False):
+    """
+    Merge the given surfaces (in that order) into one mesh.
+    Every CityJSON vertex used by the surfaces' rings is stored once, even when it is shared by
+    several surfaces (e.g. a wall and a roof); the triangles are remapped to the merged
+    vertex array. Returns (vertices Nx3 float64 real-world coordinates, indices Mx3).
+    feature_ids: also return the CityObject of every merged vertex, as a third array; a
+                 vertex shared by two CityObjects is then stored once per object
+    """
+    start, stop = surface_ring_ranges(geometry)
+    start, stop = start[surfaces], stop[surfaces]
+    corners = _concat_ranges(start, stop)
+    corner_ids = geometry["ring_vertices"][corners]
+    if feature_ids:
+        corner_object = np.repeat(geometry["surface_object"][surfaces], stop - start)
+        num_objects = int(corner_object.max()) + 1 if len(corner_object) else 1
+        keys, corner_vertex = np.unique(corner_ids * num_objects + corner_object, return_inverse=True)
+        unique_ids, vertex_object = keys // num_objects, keys % num_objects
+    else:
+        unique_ids, corner_vertex = np.unique(corner_ids, return_inverse=True)
+    merged_verts = vertex_coordinates(geometry, unique_ids)
+
+    # Triangles are stored in surface order, so each surface owns a contiguous range;
+    # shift them to positions in `corners`, then look up the merged vertex of each corner
+    triangle_surface = geometry["triangle_surface"]
+    triangle_start = np.searchsorted(triangle_surface, surfaces, side="left")
+    triangle_stop = np.searchsorted(triangle_surface, surfaces, side="right")
+    triangle_counts = triangle_stop - triangle_start
+    counts = stop - start
+    shift = np.cumsum(counts) - counts - start
+    corner_inds = geometry["triangles"][_concat_ranges(triangle_start, triangle_stop)] \
+        + np.repeat(shift, triangle_counts)[:, None]
+    merged_inds = corner_vertex.reshape(-1)[corner_inds]
+    if feature_ids:
+        return merged_verts, merged_inds, vertex_object
+    return merged_verts, merged_inds
+
+def leaf_features(geometry, surfaces):
+    """
+    The CityObjects owning the given surfaces, in index order, and their attribute rows
+    ('id' followed by the CityObject attributes). Returns (object indices, rows).
+    """
+    objects = np.unique(geometry["surface_object"][surfaces])
+    rows = []
+    for o in objects:
+        attributes = geometry["object_attributes"][o]
+        rows.append({"id": geometry["object_ids"][o], **{k: v for k, v in attributes.items() if k != "id"}})
+    return objects, rows
+
+def surface_corner_count(geometry, surfaces):
+    """
+    Number of ring corners of the given surfaces, i.e. the vertices a mesh would hold
+    with one vertex copy per surface.
+    """
+    start, stop = surface_ring_ranges(geometry)
+    return int((stop[surfaces] - start[surfaces]).sum())
+
+def count_tile_vertices(tile):
+    """
+    Total vertices written in the tile tree below tile.
+    """
+    return tile.get("vertex_count", 0) + sum(count_tile_vertices(child) for child in tile.get("children", []))
+
+def tile_tree_counts(tile, output_folder=None):
+    """
+    Content tiles, vertices and triangles written in the tile tree below tile (None for no
+    tree) and, for a folder output_folder, the bytes of their files. Returns a dict of counts.
+    """
+    counts = {"tiles": 0, "vertices": 0, "triangles": 0}
+    if isinstance(output_folder, str):
+        counts["output_bytes"] = 0
+    pending = [tile] if tile else []
+    while pending:
+        tile = pending.pop()
+        pending.extend(tile.get("children", []))
+        if "contents" in tile:
+            contents = tile["contents"]
+        else:
+            contents = [tile.get("mesh", tile)] if "gltf" in tile else []
+        for content in contents:
+            counts["tiles"] += 1
+            counts["vertices"] += content["vertex_count"]
+            counts["triangles"] += content["triangle_count"]
+            if "output_bytes" in counts:
+                counts["output_bytes"] += sum(os.path.getsize(os.path.join(output_folder, name))
+                                              for name in _tile_files(content))
+    return counts
+
+def report_vertex_sharing(root, corner_count):
+    stored = count_tile_vertices(root) if root else 0
+    if stored:
+        print(f"Vertices stored: {stored:,} instead of {corner_count:,} per-surface copies "
+              f"({corner_count / stored:.1f}x fewer)")
+
+def split_mesh(vertices, indices, max_vertices=MAX_TILE_VERTICES, max_triangles=MAX_TILE_TRIANGLES,
+               vertex_features=None):
+    """
+    Split a mesh into chunks of at most max_vertices vertices and max_triangles triangles.
+    The triangle list is halved recursively until every chunk fits, so consecutive
+    triangles (one surface, one building) stay together. Each chunk keeps only the
+    vertices its triangles use, with its indices remapped to them.
+    Returns a list of (vertices, indices); a mesh within budget is returned unchanged.
+    vertex_features: optional per-vertex array split along with the vertices; chunks are
+                     then (vertices, indices, vertex_features)
+    """
+    if len(vertices) <= max_vertices and len(indices) <= max_triangles:
+        return [(vertices, indices) if vertex_features is None else (vertices, indices, vertex_features)]
+
+    chunks = []
+    pending = [(0, len(indices))]
+    while pending:
+        lo, hi = pending.pop()
+        used, local_inds = np.unique(indices[lo:hi], return_inverse=True)
+        if (len(used) <= max_vertices and hi - lo <= max_triangles) or hi - lo == 1:
+            chunk = (vertices[used], local_inds.reshape(-1, 3))
+            if vertex_features is not None:
+                chunk += (vertex_features[used],)
+            chunks.append((lo,) + chunk)
+        else:
+            mid = (lo + hi) // 2
+            pending.extend([(mid, hi), (lo, mid)])
+
+    chunks.sort(key=lambda chunk: chunk[0])
+    return [chunk[1:] for chunk in chunks]
+
+def write_tile(name, merged_verts, merged_inds, output_folder, output_format="gltf", mesh_options=None,
+               features=None):
+    """
+    Write one merged tile mesh as name.<output_format> (see TILE_WRITERS and ARCHIVE_WRITERS)
+    and return its content tile dict (uri, bounds, geometricError 0, vertex and triangle
+    counts and, with features, the number of features its triangles belong to).
+    The vertices are real-world coordinates; the tile content stores them as float32
+    relative to the center of the tile's bounding box (RTC), which the writer records.
+    mesh_options: keyword arguments for the tile writer (quantize, meshopt)
+    features: per-vertex feature ids and attribute rows (see build_gltf_document)
+    """
+    if output_format in ARCHIVE_WRITERS and isinstance(output_folder, str):
+        raise ValueError(f"{output_format} tiles can only be written into an archive")
+    gltf_filename = f"{name}.{output_format}"
+    gltf_path, opener = open_output(output_folder, gltf_filename)
+    options = dict(mesh_options or {})
+    if features is not None:
+        options["features"] = features
+    merged_verts = np.asarray(merged_verts, dtype=np.float64)
+    low, high = merged_verts.min(axis=0), merged_verts.max(axis=0)
+    center = (low + high) / 2
+    writer = TILE_WRITERS.get(output_format) or ARCHIVE_WRITERS[output_format]
+    writer(merged_verts - center, merged_inds, gltf_path, opener=opener, center=center.tolist(), **options)
+
+    # Bounding box for tile
+    tile = {
+        "gltf": gltf_filename,
+        "min": low.tolist(),
+        "max": high.tolist(),
+        "geometricError": 0,
+        "vertex_count": len(merged_verts),
+        "triangle_count": len(merged_inds)
+    }
+    if features is not None:
+        tile["feature_count"] = len(np.unique(features["vertex_feature"][merged_inds[:, 0]]))
+    return tile
+
+def write_tile_chunks(name, merged_verts, merged_inds, output_folder, output_format="gltf",
+                      max_vertices=MAX_TILE_VERTICES, max_triangles=MAX_TILE_TRIANGLES, mesh_options=None,
+                      features=None):
+    """
+    Write a tile, split into content chunks when it is over the vertex or triangle budget.
+    A tile within budget is written as <name>; chunks of an oversized tile are written as
+    <name>_<n>, each with its own bounding box and its number n as 'chunk'.
+    features: per-vertex feature ids and attribute rows (see build_gltf_document); every
+              chunk gets the rows of the features it holds, renumbered from 0
+    Returns the list of tile dicts written.
+    """
+    if features is None:
+        chunks = split_mesh(merged_verts, merged_inds, max_vertices, max_triangles)
+        chunk_features = [None] * len(chunks)
+    else:
+        chunks, chunk_features = [], []
+        for chunk_verts, chunk_inds, vertex_feature in split_mesh(merged_verts, merged_inds, max_vertices,
+                                                                  max_triangles, features["vertex_feature"]):
+            used, local_feature = np.unique(vertex_feature, return_inverse=True)
+            chunks.append((chunk_verts, chunk_inds))
+            chunk_features.append({"vertex_feature": local_feature, "rows": [features["rows"][i] for i in used],
+                                   "ids": features["ids"][used], "schema": features["schema"]})
+    if len(chunks) == 1:
+        return [write_tile(name, *chunks[0], output_folder, output_format, mesh_options, chunk_features[0])]
+    tiles = []
+    for n, ((chunk_verts, chunk_inds), chunk_feature) in enumerate(zip(chunks, chunk_features)):
+        tile = write_tile(f"{name}_{n}", chunk_verts, chunk_inds, output_folder, output_format, mesh_options,
+                          chunk_feature)
+        tile["chunk"] = n
+        tiles.append(tile)
+    return tiles
+
+BUILD_MANIFEST = "build_manifest.json"
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _tile_files(tile):
+    """
+    Files written for a content tile dict: the content itself and, for .gltf, its .bin.
+    """
+    files = [tile["gltf"]]
+    if tile["gltf"].endswith(".gltf"):
+        files.append(os.path.splitext(tile["gltf"])[0] + ".bin")
+    return files
+
+def _output_unchanged(path, output):
+    """
+    True if the file at path still has the size and sha256 its manifest output recorded.
+    The size is compared first, so most changed files are not read.
+    """
+    return (os.path.isfile(path) and os.path.getsize(path) == output["bytes"]
+            and _file_digest(path) == output["sha256"])
+
+def write_leaf_tiles(name, merged_verts, merged_inds, output_folder, output_format="gltf",
+                     max_vertices=MAX_TILE_VERTICES, max_triangles=MAX_TILE_TRIANGLES, mesh_options=None,
+                     previous=None, features=None):
+    """
+    write_tile_chunks for one quadtree leaf, skipped when the leaf is unchanged since the
+    previous build.
+    The input hash covers the merged mesh, the features and every option that affects
+    the written bytes. When it equals previous["input"] and all previous outputs still exist with
+    their recorded size and sha256, the files are left untouched and the previous tile
+    dicts are reused.
+    previous: manifest entry of this leaf from the previous build, or None
+    features: per-vertex feature ids and attribute rows (see build_gltf_document)
+    Returns (manifest entry {"input", "tiles", "outputs"}, True if the leaf was written).
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([output_format, max_vertices, max_triangles, mesh_options or {}], sort_keys=True).encode("utf-8"))
+    h.update(np.ascontiguousarray(merged_verts, dtype=np.float64).data)
+    h.update(np.ascontiguousarray(merged_inds, dtype=np.uint32).data)
+    if features is not None:
+        h.update(np.ascontiguousarray(features["vertex_feature"], dtype=np.uint32).data)
+        # The global feature ids are left out: they only reach archive formats, which are
+        # always written in full, and they shift whenever objects are added before a leaf's
+        h.update(json.dumps([features["rows"], features["schema"]], sort_keys=True, default=str).encode("utf-8"))
+    input_hash = h.hexdigest()
+
+    if previous is not None and previous["input"] == input_hash and all(
+        _output_unchanged(os.path.join(output_folder, file), output) for file, output in previous["outputs"].items()
+    ):
+        return previous, False
+
+    tiles = write_tile_chunks(name, merged_verts, merged_inds, output_folder, output_format,
+                              max_vertices, max_triangles, mesh_options, features)
+    outputs = {}
+    if not isinstance(output_folder, str):
+        # Nothing to compare with next time: archives are always written in full
+        return {"input": input_hash, "tiles": tiles, "outputs": outputs}, True
     for tile in tiles:
-        tile_entry = {
-            "boundingVolume": {
-                "box": tile["boundingVolume"]
-            },
-            "geometricError": 0,
-            "content": {
-                "uri": tile["gltf"]
-            }
+        for file in _tile_files(tile):
+            path = os.path.join(output_folder, file)
+            outputs[file] = {"bytes": os.path.getsize(path), "sha256": _file_digest(path)}
+    return {"input": input_hash, "tiles": tiles, "outputs": outputs}, True
+
+def load_build_manifest(output_folder):
+    """
+    Read the build manifest of a previous run from output_folder.
+    Returns {leaf name: manifest entry} (empty when there is none).
+    """
+    path = os.path.join(output_folder, BUILD_MANIFEST)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("leaves", {})
+
+def save_build_manifest(output_folder, manifest):
+    write_if_changed(os.path.join(output_folder, BUILD_MANIFEST),
+                     json.dumps({"version": 1, "leaves": manifest}, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+
+def update_build_manifest(manifest, entries, rebuilt, output_folder):
+    """
+    Replace the leaves of manifest with entries, delete the files of leaves (or chunks)
+    that are no longer written, and report what was rebuilt.
+    manifest: {leaf name: entry} of the previous build, updated in place
+    entries, rebuilt: {leaf name: entry} and {leaf name: written} of this build
+    """
+    kept = set(chain.from_iterable(entry["outputs"] for entry in entries.values()))
+    stale = set(chain.from_iterable(entry["outputs"] for entry in manifest.values())) - kept
+    for file in stale:
+        path = os.path.join(output_folder, file)
+        if os.path.isfile(path):
+            os.remove(path)
+    manifest.clear()
+    manifest.update(entries)
+
+    num_rebuilt = sum(rebuilt.values())
+    print(f"Tiles rebuilt: {num_rebuilt} of {len(entries)} leaves ({len(entries) - num_rebuilt} unchanged), "
+          f"{len(stale)} stale files removed")
+
+def write_lod_tiles(root, simplified, output_folder, output_format="gltf", max_vertices=MAX_TILE_VERTICES,
+                    max_triangles=MAX_TILE_TRIANGLES, mesh_options=None, previous=None, schema=None):
+    """
+    Write the simplified content of every inner quadtree node: the simplified meshes of
+    all leaves below the node (see simplify_for_ancestors) concatenated, written with
+    write_leaf_tiles under the node's name, so unchanged nodes are not rewritten either.
+    simplified: dict of leaf name -> {"levels": simplified mesh per ancestor level,
+                "rows" and "ids": feature rows and global feature ids of the leaf, or None}
+    previous: build manifest of the previous run; schema: feature schema, or None
+    Returns (lod, entries, rebuilt): {node name: (tile dicts, simplification error)} for
+    finalize_tile_tree, and {node name: manifest entry} and {node name: written}.
+    """
+    previous = previous if previous is not None else {}
+    lod, entries, rebuilt = {}, {}, {}
+
+    def visit(node):
+        if not node["children"]:
+            return [node["name"]] if node["name"] in simplified else []
+        leaf_names = list(chain.from_iterable(visit(child) for child in node["children"]))
+        pieces = [simplified[leaf]["levels"][node["level"]] for leaf in leaf_names]
+        error = max((piece[3] for piece in pieces), default=0.0)
+        if not sum(len(piece[1]) for piece in pieces):
+            # Everything below the node collapsed: it shows nothing at this error
+            lod[node["name"]] = ([], error)
+            return leaf_names
+
+        vertex_offsets = np.cumsum([0] + [len(piece[0]) for piece in pieces[:-1]])
+        merged_verts = np.vstack([piece[0] for piece in pieces])
+        merged_inds = np.vstack([piece[1] + offset for piece, offset in zip(pieces, vertex_offsets)])
+        features = None
+        if schema is not None:
+            rows = [simplified[leaf]["rows"] for leaf in leaf_names]
+            row_offsets = np.cumsum([0] + [len(leaf_rows) for leaf_rows in rows[:-1]])
+            vertex_feature = np.concatenate([piece[2] + offset for piece, offset in zip(pieces, row_offsets)])
+            ids = np.concatenate([simplified[leaf]["ids"] for leaf in leaf_names])
+            features = {"vertex_feature": vertex_feature, "rows": list(chain.from_iterable(rows)), "ids": ids,
+                        "schema": schema}
+        entry, written = write_leaf_tiles(node["name"], merged_verts, merged_inds, output_folder, output_format,
+                                          max_vertices, max_triangles, mesh_options, previous.get(node["name"]),
+                                          features)
+        lod[node["name"]] = (entry["tiles"], error)
+        entries[node["name"]] = entry
+        rebuilt[node["name"]] = written
+        return leaf_names
+
+    visit(root)
+    return lod, entries, rebuilt
+
+def finalize_tile_tree(node, contents, lod=None):
+    """
+    Turn the quadtree into the tile tree for generate_tileset_json.
+    contents: dict of leaf node name -> list of tile dicts written for that leaf
+    Content tiles get geometricError 0; nodes with children get the diagonal of their
+    cell, so the error halves at every level. Bounding boxes of inner nodes enclose
+    their children. The tile of every quadtree node keeps its 'level', 'x', 'y' and
+    'size' (and the root its 'origin') for generate_implicit_tileset.
+    lod: dict of inner node name -> (tile dicts of its simplified content, simplification
+         error), see write_lod_tiles. Every node then shows its own content until its
+         children replace it: chunks are 'contents' of the node's tile instead of child
+         tiles, and the geometricError of a node is its simplification error (at least
+         that of its children). A single content's own tile dict is kept as 'mesh'.
+    Returns the tile dict, or None if the node has no content.
+    """
+    tiles = contents.get(node["name"], [])
+    children = [child for child in (finalize_tile_tree(child, contents, lod) for child in node["children"]) if child]
+    if lod is not None:
+        tiles, error = lod.get(node["name"], (tiles, 0.0))
+        if not tiles and not children:
+            return None
+        tile = {
+            "min": np.min([child["min"] for child in tiles + children], axis=0).tolist(),
+            "max": np.max([child["max"] for child in tiles + children], axis=0).tolist(),
+            "geometricError": max([error] + [child["geometricError"] for child in children]),
+            "children": children
         }
-        tileset["root"]["children"].append(tile_entry)
+        if len(tiles) == 1:
+            tile["gltf"] = tiles[0]["gltf"]
+            tile["mesh"] = tiles[0]
+        elif tiles:
+            tile["contents"] = tiles
+        if not node["children"]:
+            tile["vertex_count"] = sum(content["vertex_count"] for content in tiles)
+    elif len(tiles) == 1 and not children:
+        tile = tiles[0]
+    else:
+        children = tiles + children
+        if not children:
+            return None
+        tile = {
+            "min": np.min([child["min"] for child in children], axis=0).tolist(),
+            "max": np.max([child["max"] for child in children], axis=0).tolist(),
+            "geometricError": node["size"] * math.sqrt(2),
+            "children": children
+        }
+    tile.update({key: node[key] for key in ("level", "x", "y", "size", "origin") if key in node})
+    return tile
 
-    tileset_path = os.path.join(output_folder, "tileset.json")
-    with open(tileset_path, "w") as f:
-        json.dump(tileset, f, indent=2)
+# Geometry arrays handed to pool workers through shared memory
+SHARED_GEOMETRY_KEYS = ("vertices", "scale", "translate", "ring_vertices", "ring_offsets", "surface_offsets",
+                        "surface_object", "triangles", "triangle_surface")
 
-import math
+_worker_geometry = None
+_worker_blocks = []
+
+def share_geometry(geometry):
+    """
+    Copy the SHARED_GEOMETRY_KEYS arrays of geometry into shared memory blocks.
+    Returns (blocks, specs): the blocks must be closed and unlinked by the caller;
+    specs is what _attach_shared_geometry needs to map them in a worker.
+    """
+    blocks = []
+    specs = {}
+    for key in SHARED_GEOMETRY_KEYS:
+        array = np.ascontiguousarray(geometry[key])
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[key] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+def _attach_shared_geometry(specs):
+    """
+    Pool initializer: map the shared geometry arrays without copying them.
+    """
+    global _worker_geometry
+    geometry = {}
+    for key, (name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        _worker_blocks.append(block)
+        geometry[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    _worker_geometry = geometry
+
+def _merge_leaf(geometry, surfaces, features=None):
+    """
+    Merge the surfaces of a leaf; with features (leaf objects, rows and schema) the feature
+    id of every vertex is looked up as well. Returns (vertices, indices, features for the writer).
+    """
+    if features is None:
+        return merge_surfaces(geometry, surfaces) + (None,)
+    merged_verts, merged_inds, vertex_object = merge_surfaces(geometry, surfaces, feature_ids=True)
+    vertex_feature = np.searchsorted(features["objects"], vertex_object)
+    # Global feature ids count the CityObjects from 1, like ArcGIS OBJECTIDs
+    return merged_verts, merged_inds, {"vertex_feature": vertex_feature, "rows": features["rows"],
+                                       "ids": features["objects"] + 1, "schema": features["schema"]}
+
+def _write_leaf_mesh(name, merged_verts, merged_inds, output_folder, output_format, max_vertices, max_triangles,
+                     mesh_options, previous, features, lod):
+    """
+    write_leaf_tiles, plus the leaf simplified for its ancestors when lod is
+    (leaf level, quadtree origin, root cell size).
+    Returns (manifest entry, written, simplified leaf for write_lod_tiles or None).
+    """
+    entry, written = write_leaf_tiles(name, merged_verts, merged_inds, output_folder, output_format,
+                                      max_vertices, max_triangles, mesh_options, previous, features)
+    if lod is None:
+        return entry, written, None
+    vertex_feature = None if features is None else features["vertex_feature"]
+    levels = simplify_for_ancestors(merged_verts, merged_inds, vertex_feature, *lod)
+    if features is None:
+        return entry, written, {"levels": levels, "rows": None, "ids": None}
+    return entry, written, {"levels": levels, "rows": features["rows"], "ids": features["ids"]}
+
+def _worker_output(output_folder):
+    """
+    Tile output for pool workers: the folder itself, or a MemoryOutput in place of an
+    archive, whose files the workers send back with their result (see _received).
+    """
+    return output_folder if isinstance(output_folder, str) else MemoryOutput()
+
+def _sent(result, output_folder):
+    return (result, output_folder.files) if isinstance(output_folder, MemoryOutput) else result
+
+def _received(result, output_folder):
+    """
+    Result of a pool task; the files a worker kept in memory are copied to the archive.
+    """
+    if isinstance(output_folder, str):
+        return result
+    result, files = result
+    copy_output(files, output_folder)
+    return result
+
+def _write_leaf(name, surfaces, output_folder, output_format, max_vertices, max_triangles, mesh_options,
+                previous, features, lod):
+    merged_verts, merged_inds, features = _merge_leaf(_worker_geometry, surfaces, features)
+    return _sent(_write_leaf_mesh(name, merged_verts, merged_inds, output_folder, output_format,
+                                  max_vertices, max_triangles, mesh_options, previous, features, lod), output_folder)
+
+def _write_spilled_leaf(name, spill_folder, output_folder, output_format, max_vertices, max_triangles,
+                        mesh_options, previous, schema, lod):
+    vertex_path = os.path.join(spill_folder, f"{name}.vertices")
+    index_path = os.path.join(spill_folder, f"{name}.indices")
+    merged_verts = np.fromfile(vertex_path, dtype=np.float64).reshape(-1, 3)
+    merged_inds = np.fromfile(index_path, dtype=np.uint32).reshape(-1, 3)
+    features = None
+    if schema is not None:
+        feature_path = os.path.join(spill_folder, f"{name}.features")
+        row_path = os.path.join(spill_folder, f"{name}.rows")
+        id_path = os.path.join(spill_folder, f"{name}.ids")
+        with open(row_path, "rb") as f:
+            rows = [json_backend.loads(line) for line in f]
+        features = {"vertex_feature": np.fromfile(feature_path, dtype=np.uint32), "rows": rows,
+                    "ids": np.fromfile(id_path, dtype=np.uint64), "schema": schema}
+        os.remove(feature_path)
+        os.remove(row_path)
+        os.remove(id_path)
+    result = _write_leaf_mesh(name, merged_verts, merged_inds, output_folder, output_format,
+                              max_vertices, max_triangles, mesh_options, previous, features, lod)
+    os.remove(vertex_path)
+    os.remove(index_path)
+    return _sent(result, output_folder)
+
+def build_tiles(geometry, output_folder, output_format="gltf",
+                max_vertices=MAX_TILE_VERTICES, max_triangles=MAX_TILE_TRIANGLES,
+                max_features=MAX_TILE_FEATURES, max_bytes=MAX_TILE_BYTES, workers=1, mesh_options=None,
+                manifest=None, feature_metadata=False, lod=False, implicit=False):
+    """
+    Tile the CityObjects with an adaptive quadtree, merge each leaf into one mesh and write it.
+    geometry: dict returned by parse_cityjson_geometry
+    output_folder: folder to write the glTF tiles to, or an archive to stream them into (see open_output)
+    output_format: tile file format, one of TILE_WRITERS
+    max_vertices, max_triangles: per-tile budget; larger tiles are split into chunks
+    max_features, max_bytes: quadtree split thresholds (see build_quadtree)
+    workers: number of processes merging and writing leaves; the geometry arrays are
+             shared with them through shared memory. Output is identical for any value.
+    mesh_options: keyword arguments for the tile writer (quantize, meshopt)
+    manifest: build manifest of the previous run ({leaf name: entry}, see load_build_manifest);
+              leaves whose input is unchanged are not rewritten. Updated in place.
+    feature_metadata: tag every vertex with the feature id of its CityObject and write the
+                      CityObject ids and attributes as per-tile property tables (b3dm:
+                      batch tables), so buildings stay pickable in merged tiles
+    lod: also give every inner quadtree node simplified content (see write_lod_tiles),
+         refined by replacement, instead of leaving the inner nodes empty
+    implicit: build the quadtree for generate_implicit_tileset, with every CityObject
+              inside its node's cell (see the extents of build_quadtree); not with lod
+    Returns the root tile dict for generate_tileset_json; with feature_metadata it holds
+    the tileset's feature 'schema' as well.
+    """
+    surface_object = geometry["surface_object"]
+    centroids, extents, sizes = item_stats(geometry, surface_object, len(geometry["object_ids"]))
+    root, leaves, object_leaf = build_quadtree(centroids, sizes, max_features, max_bytes,
+                                               extents=extents if implicit else None)
+    surface_leaf = object_leaf[surface_object]
+    groups = [(leaves[leaf]["name"], surfaces) for leaf, surfaces in group_surfaces_by_tile(surface_leaf)]
+    corner_count = surface_corner_count(geometry, np.flatnonzero(surface_leaf >= 0))
+    leaf_lod = [None] * len(groups)
+    if lod:
+        levels = {leaf["name"]: leaf["level"] for leaf in leaves}
+        leaf_lod = [(levels[name], root["origin"], root["size"]) for name, _ in groups]
+
+    previous = manifest if manifest is not None else {}
+    names = [name for name, _ in groups]
+    leaf_rows = [None] * len(groups)
+    schema = None
+    if feature_metadata:
+        # One schema for the whole tileset, so every tile types its properties the same way
+        leaf_rows = [leaf_features(geometry, surfaces) for _, surfaces in groups]
+        schema = infer_schema(chain.from_iterable(rows for _, rows in leaf_rows))
+        leaf_rows = [{"objects": objects, "rows": rows, "schema": schema} for objects, rows in leaf_rows]
+    if workers <= 1:
+        results = []
+        for (name, surfaces), features, leaf_options in zip(groups, leaf_rows, leaf_lod):
+            merged_verts, merged_inds, features = _merge_leaf(geometry, surfaces, features)
+            results.append(_write_leaf_mesh(name, merged_verts, merged_inds, output_folder, output_format,
+                                            max_vertices, max_triangles, mesh_options, previous.get(name),
+                                            features, leaf_options))
+    else:
+        blocks, specs = share_geometry(geometry)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared_geometry,
+                                     initargs=(specs,)) as executor:
+                # map returns results in submission order, so the tree matches a serial run
+                tasks = executor.map(_write_leaf, names, [surfaces for _, surfaces in groups],
+                                     repeat(_worker_output(output_folder)), repeat(output_format),
+                                     repeat(max_vertices), repeat(max_triangles), repeat(mesh_options),
+                                     [previous.get(name) for name in names], leaf_rows, leaf_lod)
+                results = [_received(result, output_folder) for result in tasks]
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    return _finish_tile_tree(root, names, results, output_folder, output_format, max_vertices, max_triangles,
+                             mesh_options, manifest, schema, lod, corner_count)
+
+def _finish_tile_tree(root, names, results, output_folder, output_format, max_vertices, max_triangles,
+                      mesh_options, manifest, schema, lod, corner_count):
+    """
+    Shared tail of build_tiles and build_tiles_from_stream: write the LOD content of the
+    inner nodes (with lod), update the manifest and build the tile tree from the results
+    of _write_leaf_mesh for the leaves in names.
+    """
+    entries = {name: entry for name, (entry, _, _) in zip(names, results)}
+    rebuilt = {name: written for name, (_, written, _) in zip(names, results)}
+    contents = {name: entry["tiles"] for name, entry in entries.items()}
+    lod_contents = None
+    if lod:
+        simplified = {name: leaf for name, (_, _, leaf) in zip(names, results)}
+        lod_contents, lod_entries, lod_rebuilt = write_lod_tiles(
+            root, simplified, output_folder, output_format, max_vertices, max_triangles, mesh_options,
+            manifest, schema)
+        entries.update(lod_entries)
+        rebuilt.update(lod_rebuilt)
+    if manifest is not None:
+        update_build_manifest(manifest, entries, rebuilt, output_folder)
+
+    root = finalize_tile_tree(root, contents, lod_contents)
+    if root is not None and lod:
+        root["refine"] = "REPLACE"
+    if root is not None and schema is not None:
+        root["schema"] = schema
+    report_vertex_sharing(root, corner_count)
+    return root
+
+def is_cityjsonseq(path):
+    """
+    True for CityJSON Text Sequences (CityJSONL) input, recognised by the .jsonl extension.
+    """
+    return path.lower().endswith(".jsonl")
+
+def iter_cityjsonseq(path):
+    """
+    Read a CityJSONSeq file one line at a time.
+    Yields the header CityJSON object first, then every CityJSONFeature.
+    """
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json_backend.loads(line)
+
+def iter_cityjsonseq_geometry(input_path, batch_size=STREAM_BATCH_SIZE):
+    """
+    Parse a CityJSONSeq file in batches of batch_size features.
+    Yields (geometry, surface_feature, num_features) per batch, where surface_feature maps
+    every surface to its feature within the batch.
+    """
+    features = iter_cityjsonseq(input_path)
+    header = next(features, None)
+    if header is None or header.get("type") != "CityJSON":
+        raise ValueError(f"{input_path} does not start with a CityJSON header line")
+    transform = header.get("transform")
+
+    batch = []
+    for feature in chain(features, [None]):
+        if feature is not None:
+            batch.append(feature)
+        if batch and (feature is None or len(batch) >= batch_size):
+            geometry = parse_cityjson_features(batch, transform)
+            yield geometry, geometry["object_feature"][geometry["surface_object"]], len(batch)
+            batch = []
+
+def build_tiles_from_stream(input_path, output_folder, output_format="gltf",
+                            max_vertices=MAX_TILE_VERTICES, max_triangles=MAX_TILE_TRIANGLES,
+                            max_features=MAX_TILE_FEATURES, max_bytes=MAX_TILE_BYTES,
+                            batch_size=STREAM_BATCH_SIZE, workers=1, mesh_options=None, manifest=None,
+                            feature_metadata=False, lod=False, implicit=False):
+    """
+    Build the quadtree tiles from a CityJSONSeq file without loading it into memory.
+    The file is read twice. The first pass keeps only the centroid, extent and estimated
+    size of every feature to build the quadtree. The second pass assigns each feature to its leaf
+    right away and appends the merged vertices and triangles to per-leaf spill files on
+    disk; each leaf is written from its spill files at the end, by `workers` processes.
+    Peak memory is bounded by one batch plus the largest tile per worker (and 64 bytes per
+    feature for the quadtree).
+    manifest: build manifest of the previous run, as in build_tiles
+    feature_metadata: per-feature ids and property tables, as in build_tiles; the schema is
+                      inferred in the first pass and the rows are spilled with the meshes
+    lod: simplified content for the inner quadtree nodes, as in build_tiles
+    implicit: quadtree for implicit tiling, as in build_tiles
+    Returns the root tile dict for generate_tileset_json.
+    """
+    centroids, extents, sizes = [], [], []
+    schema = {} if feature_metadata else None
+    for geometry, surface_feature, num_features in iter_cityjsonseq_geometry(input_path, batch_size):
+        batch_centroids, batch_extents, batch_sizes = item_stats(geometry, surface_feature, num_features)
+        centroids.append(batch_centroids)
+        extents.append(batch_extents)
+        sizes.append(batch_sizes)
+        if feature_metadata:
+            schema = infer_schema(leaf_features(geometry, np.arange(len(surface_feature)))[1], schema)
+    centroids = np.vstack(centroids) if centroids else np.zeros((0, 3))
+    extents = np.vstack(extents) if extents else np.zeros((0, 4))
+    sizes = np.concatenate(sizes) if sizes else np.zeros(0)
+    root, leaves, feature_leaf = build_quadtree(centroids, sizes, max_features, max_bytes,
+                                                extents=extents if implicit else None)
+    del centroids, extents, sizes
+
+    with tempfile.TemporaryDirectory(prefix="cityjsonseq_buckets_") as spill_folder:
+        vertex_counts = {}  # key: leaf name, value: vertices spilled so far
+        row_counts = {}  # key: leaf name, value: feature rows spilled so far
+        corner_count = 0
+        offset = 0
+        object_offset = 0
+        for geometry, surface_feature, num_features in iter_cityjsonseq_geometry(input_path, batch_size):
+            surface_leaf = feature_leaf[offset + surface_feature]
+            offset += num_features
+            corner_count += surface_corner_count(geometry, np.flatnonzero(surface_leaf >= 0))
+            for leaf, surfaces in group_surfaces_by_tile(surface_leaf):
+                # Files are reopened per batch so the number of open handles stays small
+                name = leaves[leaf]["name"]
+                spilled = vertex_counts.get(name, 0)
+                if feature_metadata:
+                    objects, rows = leaf_features(geometry, surfaces)
+                    merged_verts, merged_inds, vertex_object = merge_surfaces(geometry, surfaces, feature_ids=True)
+                    # Feature ids count on from the rows this leaf already has
+                    vertex_feature = np.searchsorted(objects, vertex_object) + row_counts.get(name, 0)
+                    with open(os.path.join(spill_folder, f"{name}.features"), "ab") as f:
+                        f.write(vertex_feature.astype(np.uint32).tobytes())
+                    with open(os.path.join(spill_folder, f"{name}.rows"), "ab") as f:
+                        f.writelines(json_backend.dumps(row) + b"\n" for row in rows)
+                    # Global feature ids count the CityObjects of the whole file from 1
+                    with open(os.path.join(spill_folder, f"{name}.ids"), "ab") as f:
+                        f.write((objects + object_offset + 1).astype(np.uint64).tobytes())
+                    row_counts[name] = row_counts.get(name, 0) + len(rows)
+                else:
+                    merged_verts, merged_inds = merge_surfaces(geometry, surfaces)
+                with open(os.path.join(spill_folder, f"{name}.vertices"), "ab") as f:
+                    f.write(merged_verts.astype(np.float64).tobytes())
+                with open(os.path.join(spill_folder, f"{name}.indices"), "ab") as f:
+                    f.write((merged_inds + spilled).astype(np.uint32).tobytes())
+                vertex_counts[name] = spilled + len(merged_verts)
+            object_offset += len(geometry["object_ids"])
+
+        names = list(vertex_counts)
+        previous = manifest if manifest is not None else {}
+        leaf_lod = [None] * len(names)
+        if lod:
+            levels = {leaf["name"]: leaf["level"] for leaf in leaves}
+            leaf_lod = [(levels[name], root["origin"], root["size"]) for name in names]
+        if workers <= 1:
+            results = [_write_spilled_leaf(name, spill_folder, output_folder, output_format, max_vertices,
+                                           max_triangles, mesh_options, previous.get(name), schema, leaf_options)
+                       for name, leaf_options in zip(names, leaf_lod)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                tasks = executor.map(_write_spilled_leaf, names, repeat(spill_folder),
+                                     repeat(_worker_output(output_folder)), repeat(output_format),
+                                     repeat(max_vertices), repeat(max_triangles), repeat(mesh_options),
+                                     [previous.get(name) for name in names], repeat(schema), leaf_lod)
+                results = [_received(result, output_folder) for result in tasks]
+
+    return _finish_tile_tree(root, names, results, output_folder, output_format, max_vertices, max_triangles,
+                             mesh_options, manifest, schema, lod, corner_count)
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python cityjson_to_3dtiles.py input_cityjson.json output_3dtiles_folder")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Convert a CityJSON (or CityJSONSeq .jsonl) file to 3D Tiles.")
+    parser.add_argument("input_path", help="input CityJSON .json or CityJSONSeq .jsonl file")
+    parser.add_argument("output_folder", help="folder to write the tiles and tileset.json to")
+    add_tiling_arguments(parser)
+    parser.add_argument("--implicit-tiling", action="store_true",
+                        help="write a 3D Tiles 1.1 implicit tileset with .subtree availability files")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help=f"rewrite every tile, ignoring the {BUILD_MANIFEST} of a previous build")
+    parser.add_argument("--subtree-levels", type=int, default=SUBTREE_LEVELS,
+                        help=f"quadtree levels per .subtree file with --implicit-tiling (default: {SUBTREE_LEVELS})")
+    pipeline_metrics.add_profile_argument(parser)
+    args = parser.parse_args()
+    if args.implicit_tiling and args.lod:
+        # Implicit tiles refine by replacement with --lod, which would hide the
+        # CityObjects kept in inner tiles
+        parser.error("--lod cannot be combined with --implicit-tiling")
 
-    input_path = sys.argv[1]
-    output_folder = sys.argv[2]
+    input_path = args.input_path
+    output_folder = args.output_folder
 
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    with open(input_path, "r") as f:
-        cityjson = json.load(f)
-
-    vertices_list, indices_list = parse_cityjson_geometry(cityjson)
+    with pipeline_metrics.profile(output_folder, args.profile):
+        # Leaves whose input is unchanged since the last build in output_folder are not rewritten
+        manifest = {} if args.full_rebuild else load_build_manifest(output_folder)
+        root = build_tiles_from_args(input_path, output_folder, args, manifest, args.implicit_tiling)
+        if root is None:
+            raise ValueError("No geometry found in the input.")
+        save_build_manifest(output_folder, manifest)
 
-    # Singapore bounding box in meters (approximate, adjust if needed)
-    # Assuming CityJSON coordinates are in meters in a projected CRS
-    min_x, min_y = 0, 0
-    max_x, max_y = 10000, 10000  # Example 10km x 10km area covering Singapore approx
+        with pipeline_metrics.stage("tileset"):
+            if args.implicit_tiling:
+                generate_implicit_tileset(root, output_folder, args.output_format, args.subtree_levels)
+            else:
+                generate_tileset_json(root, output_folder)
+    pipeline_metrics.report()
+    print(f"3D Tiles generated in folder: {output_folder}")
 
-    # Define grid size (number of tiles in x and y)
-    grid_x, grid_y = 7, 7  # Approx 49 tiles, close to 50 as requested
+def add_tiling_arguments(parser, output_format=None):
+    """
+    Add the tiling options shared by the converters to an argparse parser.
+    output_format: fixed tile format of the converter (e.g. "i3s"); by default the format is
+                   chosen with --output-format among TILE_WRITERS
+    """
+    if output_format is None:
+        parser.add_argument("--output-format", choices=sorted(TILE_WRITERS), default="gltf",
+                            help="tile content format (default: gltf)")
+    else:
+        parser.set_defaults(output_format=output_format)
+    parser.add_argument("--max-tile-vertices", type=int, default=MAX_TILE_VERTICES,
+                        help=f"split tiles with more vertices than this (default: {MAX_TILE_VERTICES})")
+    parser.add_argument("--max-tile-triangles", type=int, default=MAX_TILE_TRIANGLES,
+                        help=f"split tiles with more triangles than this (default: {MAX_TILE_TRIANGLES})")
+    parser.add_argument("--max-tile-features", type=int, default=MAX_TILE_FEATURES,
+                        help=f"split quadtree nodes with more features than this (default: {MAX_TILE_FEATURES})")
+    parser.add_argument("--max-tile-bytes", type=int, default=MAX_TILE_BYTES,
+                        help=f"split quadtree nodes with a larger estimated payload (default: {MAX_TILE_BYTES})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes used to merge and write tiles (default: 1)")
+    parser.add_argument("--feature-metadata", action="store_true",
+                        help="tag vertices with feature ids and write CityObject attributes as property tables")
+    parser.add_argument("--lod", action="store_true",
+                        help="give parent tiles simplified content, with geometricError from the simplification error")
+    parser.add_argument("--quantize", action="store_true",
+                        help="store positions as int16 relative to each tile's bounding box (KHR_mesh_quantization)")
+    parser.add_argument("--meshopt", action="store_true",
+                        help="compress tile buffers with EXT_meshopt_compression (needs the meshoptimizer package)")
 
-    tile_size_x = (max_x - min_x) / grid_x
-    tile_size_y = (max_y - min_y) / grid_y
+def build_tiles_from_args(input_path, output_folder, args, manifest=None, implicit=False):
+    """
+    Run build_tiles or build_tiles_from_stream for input_path with the options added by
+    add_tiling_arguments. manifest is passed on for incremental builds, implicit builds
+    the quadtree for generate_implicit_tileset.
+    Returns the root tile dict.
+    """
+    options = dict(
+        output_format=args.output_format,
+        max_vertices=args.max_tile_vertices,
+        max_triangles=args.max_tile_triangles,
+        max_features=args.max_tile_features,
+        max_bytes=args.max_tile_bytes,
+        workers=args.workers,
+        mesh_options={"quantize": args.quantize, "meshopt": args.meshopt},
+        manifest=manifest,
+        feature_metadata=args.feature_metadata,
+        lod=args.lod,
+        implicit=implicit,
+    )
+    if args.meshopt and meshoptimizer is None:
+        raise ImportError("--meshopt needs the meshoptimizer package (pip install meshoptimizer)")
+    if is_cityjsonseq(input_path):
+        with pipeline_metrics.stage("tiling") as counts:
+            root = build_tiles_from_stream(input_path, output_folder, **options)
+            counts.update(tile_tree_counts(root, output_folder))
+        return root
 
-    # Assign buildings to tiles based on centroid
-    tiles_dict = {}  # key: (ix, iy), value: list of (verts, inds)
+    with pipeline_metrics.stage("load") as counts:
+        cityjson = json_backend.load(input_path)
+        counts["bytes_read"] = os.path.getsize(input_path)
 
-    for verts, inds in zip(vertices_list, indices_list):
-        centroid = verts.mean(axis=0)
-        ix = int(math.floor((centroid[0] - min_x) / tile_size_x))
-        iy = int(math.floor((centroid[1] - min_y) / tile_size_y))
-        # Clamp indices
-        ix = max(0, min(grid_x -1, ix))
-        iy = max(0, min(grid_y -1, iy))
-        key = (ix, iy)
-        if key not in tiles_dict:
-            tiles_dict[key] = []
-        tiles_dict[key].append((verts, inds))
+    with pipeline_metrics.stage("parse") as counts:
+        geometry = parse_cityjson_geometry(cityjson)
+        counts.update(buildings=len(geometry["object_ids"]), vertices=len(geometry["vertices"]),
+                      triangles=len(geometry["triangles"]))
 
-    tiles = []
-    for (ix, iy), geom_list in tiles_dict.items():
-        # Merge geometries in geom_list
-        merged_verts = []
-        merged_inds = []
-        vert_offset = 0
-        for verts, inds in geom_list:
-            merged_verts.append(verts)
-            merged_inds.append(inds + vert_offset)
-            vert_offset += len(verts)
-        merged_verts = np.vstack(merged_verts)
-        merged_inds = np.vstack(merged_inds)
-
-        gltf_filename = f"tile_{ix}_{iy}.gltf"
-        gltf_path = os.path.join(output_folder, gltf_filename)
-        create_gltf_from_mesh(merged_verts, merged_inds, gltf_path)
-
-        # Bounding box for tile
-        min_xyz = merged_verts.min(axis=0)
-        max_xyz = merged_verts.max(axis=0)
-        center = ((min_xyz + max_xyz) / 2).tolist()
-        half_sizes = ((max_xyz - min_xyz) / 2).tolist()
-        bounding_box = [
-            center[0], center[1], center[2],
-            half_sizes[0], 0, 0,
-            0, half_sizes[1], 0,
-            0, 0, half_sizes[2]
-        ]
-
-        tiles.append({
-            "gltf": gltf_filename,
-            "boundingVolume": bounding_box
-        })
-
-    generate_tileset_json(tiles, output_folder)
-    print(f"3D Tiles generated in folder: {output_folder}")
+    with pipeline_metrics.stage("tiling") as counts:
+        root = build_tiles(geometry, output_folder, **options)
+        counts.update(tile_tree_counts(root, output_folder))
+    return root
 
 if __name__ == "__main__":
     main()
@@ -2,291 +2,190 @@
 Python script to convert CityJSON files to ArcGIS Scene Layer Package (SLPK).
 
 This script:
-- Loads a CityJSON file.
+- Loads a CityJSON file, or streams a CityJSONSeq (.jsonl) file feature by feature.
 - Extracts building geometries.
-- Converts geometries to glTF files using pygltflib.
-- Generates a 3D Tiles tileset.json referencing the glTF files as tiles.
-- Packages the 3D Tiles folder into an SLPK archive with required Esri metadata.
+- Tiles them with the quadtree of cityjson_to_3dtiles.py and writes every tile as an I3S 1.7
+  node: a gzipped geometry buffer and one attribute buffer per field (see i3s.py).
+- Writes the 3dSceneLayer.json, the paged node tree (nodepages) and metadata.json of a
+  3D Object scene layer, so ArcGIS loads the nodes on demand.
+- Streams every file straight into the SLPK archive as it is produced; no staging copy of
+  the tiles is written to disk.
+
+The resources are gzipped and the archive entries stored, as SLPK readers expect. Every
+CityObject becomes a feature with its attributes; with --lod the inner nodes get simplified
+meshes. I3S nodes hold one non-indexed mesh each, so tiles are not split into chunks
+(--max-tile-vertices and --max-tile-triangles do not apply).
 
 Dependencies:
 - numpy
-- pygltflib
-- zipfile (standard library)
-- json
-- os
-- sys
+- pygltflib (imported by cityjson_to_3dtiles.py)
+- zlib (standard library; the archive is written by SlpkWriter, not zipfile)
 
 Install dependencies with:
 pip install numpy pygltflib
 
 Usage:
 python cityjson_to_slpk.py input_cityjson.json output_slpk_folder output_slpk_filename.slpk
+python cityjson_to_slpk.py input_cityjson.city.jsonl output_slpk_folder output_slpk_filename.slpk
+python cityjson_to_slpk.py input_cityjson.json output_slpk_folder output_slpk_filename.slpk --lod --wkid 3414
 
 Note:
 This is a basic implementation and may need enhancements for complex CityJSON files or full Esri SLPK compliance.
 """
 
+import io
 import os
 import sys
-import json
-import math
-import numpy as np
-from pygltflib import GLTF2, Scene, Node, Mesh, Buffer, BufferView, Accessor, Asset, Primitive, Material
-import zipfile
-import tempfile
-import shutil
+import time
+import zlib
+import struct
+import argparse
 
-def create_gltf_from_mesh(vertices, indices, output_path):
-    """
-    Create a simple glTF file from vertices and triangle indices.
-    vertices: Nx3 numpy array
-    indices: Mx3 numpy array (triangles)
-    output_path: path to save the glTF file
-    """
-    gltf = GLTF2()
-    gltf.asset = Asset(version="2.0")
-
-    vertex_data = vertices.astype(np.float32).tobytes()
-    index_data = indices.astype(np.uint16).tobytes()
-
-    buffer = Buffer()
-    buffer.byteLength = len(vertex_data) + len(index_data)
-    gltf.buffers.append(buffer)
-
-    vertex_buffer_view = BufferView(buffer=0, byteOffset=0, byteLength=len(vertex_data), target=34962)  # ARRAY_BUFFER
-    index_buffer_view = BufferView(buffer=0, byteOffset=len(vertex_data), byteLength=len(index_data), target=34963)  # ELEMENT_ARRAY_BUFFER
-    gltf.bufferViews.extend([vertex_buffer_view, index_buffer_view])
-
-    accessor_positions = Accessor(bufferView=0, byteOffset=0, componentType=5126, count=len(vertices), type="VEC3",
-                                  min=[float(np.min(vertices[:,0])), float(np.min(vertices[:,1])), float(np.min(vertices[:,2]))],
-                                  max=[float(np.max(vertices[:,0])), float(np.max(vertices[:,1])), float(np.max(vertices[:,2]))])
-    accessor_indices = Accessor(bufferView=1, byteOffset=0, componentType=5123, count=len(indices)*3, type="SCALAR")
-
-    gltf.accessors.extend([accessor_positions, accessor_indices])
-
-    primitive = Primitive(attributes={"POSITION":0}, indices=1, mode=4)  # TRIANGLES
-
-    material = Material()
-    gltf.materials.append(material)
-    primitive.material = 0
-
-    mesh = Mesh(primitives=[primitive])
-    gltf.meshes.append(mesh)
+from cityjson_to_3dtiles import add_tiling_arguments, build_tiles_from_args
+from i3s import write_i3s_layer
+import pipeline_metrics
 
-    node = Node(mesh=0)
-    gltf.nodes.append(node)
+# File extensions of payloads that are already compressed; these entries are stored, not deflated
+STORED_EXTENSIONS = {".gz", ".zip", ".slpk", ".png", ".jpg", ".jpeg", ".ktx2", ".dds", ".draco"}
 
-    scene = Scene(nodes=[0])
-    gltf.scenes.append(scene)
-    gltf.scene = 0
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP64_LIMIT = 0xFFFFFFFF
 
-    gltf.set_binary_blob(vertex_data + index_data)
-
-    gltf.save(output_path)
-
-def parse_cityjson_geometry(cityjson):
+def _compress_entry(data, method):
     """
-    Parse CityJSON geometries into a list of (vertices, indices) tuples.
-    This function assumes simple geometry types (e.g. MultiSurface or Solid).
+    CRC-32 and payload of one zip entry: raw deflate for ZIP_DEFLATED, the data itself
+    for ZIP_STORED.
+    Returns (crc, payload).
     """
-    vertices_list = []
-    indices_list = []
-
-    vertices_global = cityjson.get("vertices", [])
-    vertices_global = np.array(vertices_global, dtype=np.float32)
-
-    city_objects = cityjson.get("CityObjects", {})
-
-    for obj_id, obj in city_objects.items():
-        geom = obj.get("geometry", [])
-        for g in geom:
-            geom_type = g.get("type")
-            boundaries = g.get("boundaries", [])
-
-            if geom_type == "Solid":
-                for shell in boundaries:
-                    for surface in shell:
-                        exterior_ring = surface[0]
-                        verts = vertices_global[exterior_ring]
-                        indices = []
-                        for i in range(1, len(exterior_ring)-1):
-                            indices.append([0, i, i+1])
-                        vertices_list.append(verts)
-                        indices_list.append(np.array(indices, dtype=np.uint16))
-            elif geom_type == "MultiSurface":
-                for surface in boundaries:
-                    exterior_ring = surface[0]
-                    verts = vertices_global[exterior_ring]
-                    indices = []
-                    for i in range(1, len(exterior_ring)-1):
-                        indices.append([0, i, i+1])
-                    vertices_list.append(verts)
-                    indices_list.append(np.array(indices, dtype=np.uint16))
-            else:
-                continue
-
-    return vertices_list, indices_list
-
-def generate_tileset_json(tiles, output_folder):
+    if method == ZIP_DEFLATED:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        return zlib.crc32(data), compressor.compress(data) + compressor.flush()
+    return zlib.crc32(data), data
+
+class _ArchiveEntry(io.BytesIO):
+    def __init__(self, archive, name):
+        super().__init__()
+        self._archive, self._name = archive, name
+
+    def close(self):
+        if not self.closed:
+            self._archive.add(self._name, self.getvalue())
+        super().close()
+
+class SlpkWriter:
     """
-    Generate a tileset.json file for 3D Tiles referencing the glTF tiles.
-    tiles: list of dicts with keys: 'gltf', 'boundingVolume' (box)
-    output_folder: folder to save tileset.json
+    Write a zip archive entry by entry, as the files are produced.
+    open(name) returns a binary file that becomes entry `name` when closed, so the writer
+    can be given to build_tiles as its output (see cityjson_to_3dtiles.open_output).
+    Every entry is deflated unless its extension is in stored_extensions. Zip64 records
+    are written when the archive needs them.
     """
-    tileset = {
-        "asset": {
-            "version": "1.0"
-        },
-        "geometricError": 500,
-        "root": {
-            "boundingVolume": {
-                "box": [0,0,0, 1000,0,0, 0,1000,0, 0,0,1000]
-            },
-            "geometricError": 250,
-            "refine": "ADD",
-            "children": []
-        }
-    }
-
-    for tile in tiles:
-        tile_entry = {
-            "boundingVolume": {
-                "box": tile["boundingVolume"]
-            },
-            "geometricError": 0,
-            "content": {
-                "uri": tile["gltf"]
-            }
-        }
-        tileset["root"]["children"].append(tile_entry)
-
-    tileset_path = os.path.join(output_folder, "tileset.json")
-    with open(tileset_path, "w") as f:
-        json.dump(tileset, f, indent=2)
-
-def create_slpk_metadata(output_folder):
-    """
-    Create minimal Esri SLPK metadata files required for ArcGIS.
-    """
-    # Create scene layer package info json
-    slpk_info = {
-        "layerType": "Scene Layer",
-        "layerTypeName": "3D Object Scene Layer",
-        "version": "1.0",
-        "layerDefinition": {
-            "type": "3DObject",
-            "geometryType": "esriGeometryPolygon",
-            "hasZ": True,
-            "hasM": False,
-            "drawingInfo": {
-                "renderer": {
-                    "type": "simple",
-                    "symbol": {
-                        "type": "esri3DObject",
-                        "symbolLayers": [
-                            {
-                                "type": "object",
-                                "resource": "3dtiles/tileset.json"
-                            }
-                        ]
-                    }
-                }
-            }
-        }
-    }
-    with open(os.path.join(output_folder, "layer.json"), "w") as f:
-        json.dump(slpk_info, f, indent=2)
-
-def package_slpk(source_folder, slpk_path):
-    """
-    Package the source_folder contents into a .slpk zip archive.
-    """
-    with zipfile.ZipFile(slpk_path, 'w', zipfile.ZIP_DEFLATED) as slpk_zip:
-        for root, dirs, files in os.walk(source_folder):
-            for file in files:
-                abs_path = os.path.join(root, file)
-                rel_path = os.path.relpath(abs_path, source_folder)
-                slpk_zip.write(abs_path, rel_path)
+    def __init__(self, path, stored_extensions=STORED_EXTENSIONS):
+        self._file = open(path, "wb")
+        self._stored_extensions = set(stored_extensions)
+        self._central_directory = []
+        self._offset = 0
+        t = time.localtime()
+        self._dos_time = t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+        self._dos_date = (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self, name, mode="wb"):
+        return _ArchiveEntry(self, name)
+
+    def add(self, name, data):
+        """
+        Add entry `name` with the given bytes.
+        """
+        extension = os.path.splitext(name)[1].lower()
+        method = ZIP_STORED if extension in self._stored_extensions else ZIP_DEFLATED
+        self._write_entry(name, method, len(data), *_compress_entry(data, method))
+
+    def _write_entry(self, name, method, size, crc, payload):
+        encoded_name = name.encode("utf-8")
+        zip64 = size >= ZIP64_LIMIT or len(payload) >= ZIP64_LIMIT
+        extra = struct.pack("<HHQQ", 1, 16, size, len(payload)) if zip64 else b""
+        sizes = (ZIP64_LIMIT, ZIP64_LIMIT) if zip64 else (len(payload), size)
+        header = struct.pack("<IHHHHHIIIHH", 0x04034B50, 45 if zip64 else 20, 0x800, method,
+                             self._dos_time, self._dos_date, crc, *sizes, len(encoded_name), len(extra))
+        self._file.write(header + encoded_name + extra)
+        self._file.write(payload)
+        self._central_directory.append((encoded_name, method, crc, len(payload), size, self._offset))
+        self._offset += len(header) + len(encoded_name) + len(extra) + len(payload)
+
+    def close(self):
+        """
+        Write the central directory and close the file.
+        """
+        if self._file.closed:
+            return
+
+        start = self._offset
+        for encoded_name, method, crc, compressed, size, offset in self._central_directory:
+            # Zip64 extra field: only the values that do not fit in 32 bits, in this order
+            values = [value for value in (size, compressed, offset) if value >= ZIP64_LIMIT]
+            extra = struct.pack(f"<HH{len(values)}Q", 1, 8 * len(values), *values) if values else b""
+            record = struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, 45 if values else 20, 45 if values else 20,
+                                 0x800, method, self._dos_time, self._dos_date, crc,
+                                 min(compressed, ZIP64_LIMIT), min(size, ZIP64_LIMIT), len(encoded_name),
+                                 len(extra), 0, 0, 0, 0, min(offset, ZIP64_LIMIT))
+            self._file.write(record + encoded_name + extra)
+            self._offset += len(record) + len(encoded_name) + len(extra)
+
+        count, directory_size = len(self._central_directory), self._offset - start
+        if count >= 0xFFFF or directory_size >= ZIP64_LIMIT or start >= ZIP64_LIMIT:
+            self._file.write(struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count,
+                                         directory_size, start))
+            self._file.write(struct.pack("<IIQI", 0x07064B50, 0, self._offset, 1))
+        self._file.write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                                     min(directory_size, ZIP64_LIMIT), min(start, ZIP64_LIMIT), 0))
+        self._file.close()
 
 def main():
-    if len(sys.argv) != 4:
-        print("Usage: python cityjson_to_slpk.py input_cityjson.json output_slpk_folder output_slpk_filename.slpk")
-        sys.exit(1)
-
-    input_path = sys.argv[1]
-    output_folder = sys.argv[2]
-    slpk_filename = sys.argv[3]
+    parser = argparse.ArgumentParser(description="Convert a CityJSON (or CityJSONSeq .jsonl) file to an SLPK package.")
+    parser.add_argument("input_path", help="input CityJSON .json or CityJSONSeq .jsonl file")
+    parser.add_argument("output_folder", help="folder to build the package in")
+    parser.add_argument("slpk_filename", help="name of the .slpk file to create in output_folder")
+    add_tiling_arguments(parser, output_format="i3s")
+    parser.add_argument("--wkid", type=int, default=3414,
+                        help="EPSG code of the input coordinates (default: 3414, SVY21 / Singapore TM)")
+    parser.add_argument("--layer-name", help="scene layer name (default: the .slpk file name)")
+    pipeline_metrics.add_profile_argument(parser)
+    args = parser.parse_args()
+    if args.quantize or args.meshopt:
+        parser.error("--quantize and --meshopt apply to 3D Tiles content, not to I3S")
+
+    input_path = args.input_path
+    output_folder = args.output_folder
+    slpk_filename = args.slpk_filename
+    layer_name = args.layer_name or os.path.splitext(slpk_filename)[0]
+
+    # Every CityObject is an I3S feature, and I3S meshes need no 16-bit indices
+    args.feature_metadata = True
+    args.max_tile_vertices = args.max_tile_triangles = sys.maxsize
 
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    with open(input_path, "r", encoding="utf-8") as f:
-        cityjson = json.load(f)
-
-    vertices_list, indices_list = parse_cityjson_geometry(cityjson)
-
-    # Define bounding box and grid for tiling (example values)
-    min_x, min_y = 0, 0
-    max_x, max_y = 10000, 10000
-    grid_x, grid_y = 7, 7
-
-    tile_size_x = (max_x - min_x) / grid_x
-    tile_size_y = (max_y - min_y) / grid_y
-
-    tiles_dict = {}
-
-    for verts, inds in zip(vertices_list, indices_list):
-        centroid = verts.mean(axis=0)
-        ix = int(math.floor((centroid[0] - min_x) / tile_size_x))
-        iy = int(math.floor((centroid[1] - min_y) / tile_size_y))
-        ix = max(0, min(grid_x -1, ix))
-        iy = max(0, min(grid_y -1, iy))
-        key = (ix, iy)
-        if key not in tiles_dict:
-            tiles_dict[key] = []
-        tiles_dict[key].append((verts, inds))
-
-    tiles_folder = os.path.join(output_folder, "3dtiles")
-    if not os.path.exists(tiles_folder):
-        os.makedirs(tiles_folder)
-
-    tiles = []
-    for (ix, iy), geom_list in tiles_dict.items():
-        merged_verts = []
-        merged_inds = []
-        vert_offset = 0
-        for verts, inds in geom_list:
-            merged_verts.append(verts)
-            merged_inds.append(inds + vert_offset)
-            vert_offset += len(verts)
-        merged_verts = np.vstack(merged_verts)
-        merged_inds = np.vstack(merged_inds)
-
-        gltf_filename = f"tile_{ix}_{iy}.gltf"
-        gltf_path = os.path.join(tiles_folder, gltf_filename)
-        create_gltf_from_mesh(merged_verts, merged_inds, gltf_path)
-
-        min_xyz = merged_verts.min(axis=0)
-        max_xyz = merged_verts.max(axis=0)
-        center = ((min_xyz + max_xyz) / 2).tolist()
-        half_sizes = ((max_xyz - min_xyz) / 2).tolist()
-        bounding_box = [
-            center[0], center[1], center[2],
-            half_sizes[0], 0, 0,
-            0, half_sizes[1], 0,
-            0, 0, half_sizes[2]
-        ]
-
-        tiles.append({
-            "gltf": gltf_filename,
-            "boundingVolume": bounding_box
-        })
-
-    generate_tileset_json(tiles, tiles_folder)
-    create_slpk_metadata(output_folder)
-
+    # The resources are gzipped already; SLPK archives store them (and metadata.json) as they are
     slpk_path = os.path.join(output_folder, slpk_filename)
-    package_slpk(output_folder, slpk_path)
+    with pipeline_metrics.profile(output_folder, args.profile):
+        with pipeline_metrics.stage("package") as counts:
+            with SlpkWriter(slpk_path, stored_extensions=STORED_EXTENSIONS | {".json"}) as slpk:
+                root = build_tiles_from_args(input_path, slpk, args)
+                if root is None:
+                    raise ValueError("No geometry found in the input.")
+
+                with pipeline_metrics.stage("i3s_layer"):
+                    write_i3s_layer(slpk, root, root["schema"], layer_name, args.wkid)
+            counts["output_bytes"] = os.path.getsize(slpk_path)
+    pipeline_metrics.report()
 
     print(f"SLPK package created at: {slpk_path}")
 
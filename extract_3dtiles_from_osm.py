@@ -1,20 +1,44 @@
-import osmnx as ox
-import shapely.geometry
 import numpy as np
-import json
 import os
-from pygltflib import GLTF2, Scene, Node, Mesh, Buffer, BufferView, Accessor, Asset, Primitive, Material, PbrMetallicRoughness
-import trimesh
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import Point
+import argparse
 
-def extract_3d_models_from_osm(place_name, output_dir="output_3dtiles"):
+from cityjson_to_3dtiles import build_tiles, generate_tileset_json, tile_tree_counts
+from building_heights import normalize_heights
+from extrusion import extrude_footprints, extruded_mesh_blocks
+from mesh_writers import ObjWriter
+from osm_cache import load_buildings, add_osm_arguments, osm_options
+import pipeline_metrics
+
+# OSM tags copied into the per-feature property tables
+OSM_ATTRIBUTES = ["name", "building", "building:levels", "height"]
+# HDB columns copied into the property tables when a CSV is given
+HDB_ATTRIBUTES = ["blk_no", "street", "max_floor_lvl", "year_completed"]
+# Buildings written to the OBJ model per block
+OBJ_BLOCK = 10000
+
+def extract_3d_models_from_osm(place_name, output_dir="output_3dtiles", csv_path=None, output_format="glb",
+                               osm=None):
     """
     Extract 3D building models from OSM for the given place and convert them to 3D Tiles format.
+    All footprints are extruded in one batch (extrusion.extrude_footprints). Buildings are
+    merged into quadtree tiles; every vertex carries the feature id of its building and the
+    building attributes (osmid, height and, with csv_path, the HDB block data) are written
+    as per-tile property tables (b3dm: batch tables).
     Also generates a full Singapore model in one OBJ file.
-    
+    Every step is recorded as a pipeline_metrics stage.
+
     Args:
         place_name (str): The place name or query to download OSM data.
         output_dir (str): Directory to save the 3D Tiles output and OBJ file.
-        
+        csv_path (str): Optional HDB CSV with blk_no, max_floor_lvl, longitude, latitude;
+                        max_floor_lvl overrides the OSM height of the buildings it falls in.
+        output_format (str): Tile content format (gltf, glb or b3dm).
+        osm (dict): Options of osm_cache.load_buildings (cache folder, TTL, snapshot date,
+                    local .osm.pbf extract, offline mode).
+
     Returns:
         tuple: (str) Path to the generated 3D Tiles tileset.json file,
                (str) Path to the generated full OBJ model file.
@@ -22,235 +46,97 @@ def extract_3d_models_from_osm(place_name, output_dir="output_3dtiles"):
     # Create output directory
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    
-    # Download building footprints with height data
+
+    # Building footprints with height data, downloaded or from the cache (see osm_cache.py)
     tags = {"building": True}
-    print(f"Downloading building footprints for {place_name}...")
-    gdf = ox.features_from_place(place_name, tags)
-    
-    # Filter buildings with height or levels attribute
-    def get_height(row):
-        if 'height' in row and row['height'] is not None:
-            try:
-                # height might be in meters or string like '10 m'
-                h = float(str(row['height']).replace(' m','').strip())
-                return h
-            except:
-                return None
-        elif 'building:levels' in row and row['building:levels'] is not None:
-            try:
-                levels = float(str(row['building:levels']).strip())
-                return levels * 3  # approx 3 meters per level
-            except:
-                return None
-        else:
-            return None
-    
-    gdf['height_m'] = gdf.apply(get_height, axis=1)
-    gdf = gdf[gdf['height_m'].notnull()]
-    
+    print(f"Loading building footprints for {place_name}...")
+    with pipeline_metrics.stage("download") as counts:
+        gdf, source = load_buildings(place_name, tags, **(osm or {}))
+        counts.update(features=len(gdf), source=source)
+    print(f"Loaded {len(gdf)} features from {source}")
+
+    # Project to Singapore TM (EPSG:3414) so heights and footprints are both in meters
+    with pipeline_metrics.stage("project"):
+        gdf = gdf.to_crs(epsg=3414)
+
+    if csv_path is not None:
+        print(f"Reading CSV data from {csv_path}...")
+        with pipeline_metrics.stage("sjoin") as counts:
+            df_csv = pd.read_csv(csv_path)
+            geometry = [Point(xy) for xy in zip(df_csv['longitude'], df_csv['latitude'])]
+            gdf_csv = gpd.GeoDataFrame(df_csv, geometry=geometry, crs="EPSG:4326").to_crs(epsg=3414)
+            gdf = gdf.sjoin(gdf_csv, how="left", predicate="intersects")
+            # Remove duplicates after join, keep first occurrence
+            gdf = gdf[~gdf.index.duplicated(keep='first')]
+            counts.update(csv_rows=len(df_csv), buildings=len(gdf))
+
+    # Heights from the HDB floors, the height tag or the floors tag (see building_heights.py);
+    # buildings none of them cover are dropped
+    with pipeline_metrics.stage("heights") as counts:
+        heights, coverage = normalize_heights(gdf)
+        gdf['height_m'] = heights['height_m']
+        gdf['min_height_m'] = heights['min_height_m']
+        gdf = gdf[gdf['height_m'].notnull()]
+        counts.update(coverage, buildings=len(gdf))
+
     if gdf.empty:
         raise ValueError("No buildings with height information found in the area.")
-    
+
     print(f"Found {len(gdf)} buildings with height data.")
-    
-    # For simplicity, create a glTF file for each building as an extruded polygon
-    gltf_files = []
-    # For merging all buildings into one mesh
-    merged_meshes = []
-    
-    for idx, row in gdf.iterrows():
-        footprint = row.geometry
-        height = row['height_m']
-        if not isinstance(footprint, shapely.geometry.Polygon):
-            # skip non-polygon geometries
-            continue
-        
-        gltf = create_extruded_building_gltf(footprint, height)
-        gltf_filename = os.path.join(output_dir, f"building_{idx}.gltf")
-        gltf.save(gltf_filename)
-        gltf_files.append(gltf_filename)
-        
-        # Create trimesh mesh for merging
-        mesh = create_trimesh_extruded_building(footprint, height)
-        merged_meshes.append(mesh)
-    
-    # Merge all building meshes into one
-    full_mesh = trimesh.util.concatenate(merged_meshes)
+
+    columns = [c for c in OSM_ATTRIBUTES + HDB_ATTRIBUTES if c in gdf.columns]
+
+    # All polygon footprints are extruded at once into the geometry arrays that are tiled with
+    # per-feature metadata; other geometry types are skipped
+    with pipeline_metrics.stage("extrude") as counts:
+        # osmnx (and osm_cache.read_osm_extract) index features by (element, id)
+        osmids = [idx[-1] if isinstance(idx, tuple) else idx for idx in gdf.index]
+        heights = gdf['height_m'].to_numpy(dtype=np.float64)
+        attributes = [{"osmid": osmid, "height_m": float(height),
+                       **{c: value for c, value in record.items() if pd.notnull(value)}}
+                      for osmid, height, record in zip(osmids, heights, gdf[columns].to_dict("records"))]
+        geometry = extrude_footprints(gdf.geometry, heights, [str(osmid) for osmid in osmids], attributes,
+                                      bases=gdf['min_height_m'].to_numpy(dtype=np.float64))
+        counts.update(buildings=len(geometry["object_ids"]), vertices=len(geometry["vertices"]),
+                      triangles=len(geometry["triangles"]))
+
+    # All buildings in one mesh, written OBJ_BLOCK buildings at a time without building the
+    # mesh of the whole model or its OBJ text in memory
     obj_path = os.path.join(output_dir, "singapore_full_model.obj")
-    full_mesh.export(obj_path)
+    with pipeline_metrics.stage("obj_export") as counts:
+        with ObjWriter(obj_path) as writer:
+            for vertices, faces, _ in extruded_mesh_blocks(geometry, OBJ_BLOCK):
+                writer.write(vertices, faces)
+        counts.update(vertices=writer.vertex_count, triangles=writer.face_count,
+                      output_bytes=os.path.getsize(obj_path))
     print(f"Full Singapore model exported as OBJ at {obj_path}")
-    
-    # Create a basic tileset.json referencing the glTF files as individual tiles
-    tileset = create_basic_tileset_json(gltf_files)
+
+    # Merge buildings into quadtree tiles, keeping each building pickable by feature id
+    with pipeline_metrics.stage("tiling") as counts:
+        root = build_tiles(geometry, output_dir, output_format, feature_metadata=True)
+        counts.update(tile_tree_counts(root, output_dir))
+    with pipeline_metrics.stage("tileset"):
+        generate_tileset_json(root, output_dir)
     tileset_path = os.path.join(output_dir, "tileset.json")
-    with open(tileset_path, "w") as f:
-        json.dump(tileset, f, indent=2)
-    
+
     print(f"3D Tiles generated at {tileset_path}")
     return tileset_path, obj_path
 
-def create_trimesh_extruded_building(footprint, height):
-    """
-    Create a trimesh mesh of an extruded polygon footprint.
-    Args:
-        footprint (shapely.geometry.Polygon): 2D footprint polygon.
-        height (float): extrusion height in meters.
-    Returns:
-        trimesh.Trimesh: extruded mesh.
-    """
-    exterior_coords = np.array(footprint.exterior.coords)
-    # Create vertices for bottom and top
-    bottom = np.column_stack((exterior_coords, np.zeros(len(exterior_coords))))
-    top = np.column_stack((exterior_coords, np.full(len(exterior_coords), height)))
-    
-    vertices = np.vstack((bottom, top))
-    
-    n = len(exterior_coords)
-    faces = []
-    # Bottom face (triangle fan)
-    for i in range(1, n-1):
-        faces.append([0, i, i+1])
-    # Top face (triangle fan)
-    for i in range(1, n-1):
-        faces.append([n, n+i+1, n+i])
-    # Side faces (quads split into two triangles)
-    for i in range(n-1):
-        a = i
-        b = i+1
-        c = n + b
-        d = n + a
-        faces.append([a, b, c])
-        faces.append([a, c, d])
-    
-    mesh = trimesh.Trimesh(vertices=vertices, faces=faces)
-    return mesh
-
-def create_extruded_building_gltf(footprint, height):
-    """
-    Create a simple glTF model of an extruded polygon footprint.
-    Args:
-        footprint (shapely.geometry.Polygon): 2D footprint polygon.
-        height (float): extrusion height in meters.
-    Returns:
-        GLTF2: glTF model object.
-    """
-    # Extract exterior coords
-    exterior_coords = np.array(footprint.exterior.coords)
-    # Create vertices for bottom and top
-    vertices = []
-    for x, y in exterior_coords:
-        vertices.append([x, y, 0])       # bottom
-    for x, y in exterior_coords:
-        vertices.append([x, y, height])  # top
-    
-    # Create faces (triangles) for sides and top/bottom
-    # Indices for bottom and top rings
-    n = len(exterior_coords)
-    # Bottom face (triangle fan)
-    bottom_faces = []
-    for i in range(1, n-1):
-        bottom_faces.append([0, i, i+1])
-    # Top face (triangle fan)
-    top_faces = []
-    for i in range(1, n-1):
-        top_faces.append([n, n+i+1, n+i])
-    # Side faces (quads split into two triangles)
-    side_faces = []
-    for i in range(n-1):
-        a = i
-        b = i+1
-        c = n + b
-        d = n + a
-        side_faces.append([a, b, c])
-        side_faces.append([a, c, d])
-    
-    # Flatten faces
-    faces = bottom_faces + top_faces + side_faces
-    
-    # Convert vertices and faces to glTF buffers
-    vertices_flat = np.array(vertices, dtype=np.float32).flatten()
-    indices_flat = np.array(faces, dtype=np.uint16).flatten()
-    
-    # Create glTF structure using pygltflib
-    gltf = GLTF2()
-    gltf.asset = Asset(version="2.0")
-    
-    # Buffer data
-    vertex_bytes = vertices_flat.tobytes()
-    index_bytes = indices_flat.tobytes()
-    buffer_data = vertex_bytes + index_bytes
-    
-    buffer = Buffer(byteLength=len(buffer_data))
-    gltf.buffers.append(buffer)
-    
-    # BufferViews
-    vertex_buffer_view = BufferView(buffer=0, byteOffset=0, byteLength=len(vertex_bytes), target=34962)  # ARRAY_BUFFER
-    index_buffer_view = BufferView(buffer=0, byteOffset=len(vertex_bytes), byteLength=len(index_bytes), target=34963)  # ELEMENT_ARRAY_BUFFER
-    gltf.bufferViews.extend([vertex_buffer_view, index_buffer_view])
-    
-    # Accessors
-    vertex_accessor = Accessor(bufferView=0, byteOffset=0, componentType=5126, count=len(vertices), type="VEC3", max=[float(np.max(vertices_flat[0::3])), float(np.max(vertices_flat[1::3])), float(np.max(vertices_flat[2::3]))], min=[float(np.min(vertices_flat[0::3])), float(np.min(vertices_flat[1::3])), float(np.min(vertices_flat[2::3]))])
-    index_accessor = Accessor(bufferView=1, byteOffset=0, componentType=5123, count=len(indices_flat), type="SCALAR")
-    gltf.accessors.extend([vertex_accessor, index_accessor])
-    
-    # Mesh primitive
-    primitive = Primitive(attributes={"POSITION": 0}, indices=1)
-    mesh = Mesh(primitives=[primitive])
-    gltf.meshes.append(mesh)
-    
-    # Node
-    node = Node(mesh=0)
-    gltf.nodes.append(node)
-    
-    # Scene
-    scene = Scene(nodes=[0])
-    gltf.scenes.append(scene)
-    gltf.scene = 0
-    
-    # Set buffer data
-    gltf.set_binary_blob(buffer_data)
-    
-    return gltf
+def main():
+    parser = argparse.ArgumentParser(description="Extract OSM buildings of a place as 3D Tiles and one OBJ model.")
+    parser.add_argument("place_name", nargs="?", default="Singapore", help="place to download (default: Singapore)")
+    parser.add_argument("--output-dir", default="output_3dtiles", help="folder for the tiles and the OBJ model")
+    parser.add_argument("--csv", help="HDB CSV whose max_floor_lvl overrides the OSM heights")
+    parser.add_argument("--output-format", choices=["gltf", "glb", "b3dm"], default="glb",
+                        help="tile content format (default: glb)")
+    add_osm_arguments(parser)
+    pipeline_metrics.add_profile_argument(parser)
+    args = parser.parse_args()
 
-def create_basic_tileset_json(gltf_files):
-    """
-    Create a basic 3D Tiles tileset.json referencing the given glTF files as individual tiles.
-    Args:
-        gltf_files (list of str): List of glTF file paths.
-    Returns:
-        dict: tileset JSON structure.
-    """
-    root = {
-        "asset": {
-            "version": "1.0"
-        },
-        "geometricError": 500,
-        "root": {
-            "boundingVolume": {
-                "region": [1.808, 0.021, 1.815, 0.026, 0, 1000]  # Singapore bounding box in radians
-            },
-            "geometricError": 0,
-            "refine": "ADD",
-            "children": []
-        }
-    }
-    
-    for i, gltf_path in enumerate(gltf_files):
-        tile = {
-            "boundingVolume": {
-                "region": [1.808, 0.021, 1.815, 0.026, 0, 1000]  # Singapore bounding box in radians, should be updated per building
-            },
-            "geometricError": 0,
-            "content": {
-                "uri": os.path.basename(gltf_path)
-            }
-        }
-        root["root"]["children"].append(tile)
-    
-    return root
+    with pipeline_metrics.profile(args.output_dir, args.profile):
+        extract_3d_models_from_osm(args.place_name, args.output_dir, args.csv, args.output_format,
+                                   osm_options(args))
+    pipeline_metrics.report()
 
 if __name__ == "__main__":
-    # Example usage
-    place = "Singapore"
-    extract_3d_models_from_osm(place)
+    main()
@@ -1,27 +1,56 @@
-import osmnx as ox
-import shapely.geometry
+import shapely
 import numpy as np
 import os
-import trimesh
-import json
+import tempfile
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import Point
+import argparse
 
-def extract_singapore_obj(output_dir="output_obj", csv_path="HDBPropertyInformation_geocoded.csv"):
+import pipeline_metrics
+import json_backend
+from osm_cache import load_buildings, add_osm_arguments, osm_options
+from building_heights import normalize_heights
+from extrusion import extrude_footprints, extruded_mesh, POLYGON_TYPE_ID
+from mesh_writers import open_mesh_writer
+
+# Buildings extruded and written to the full model at a time
+EXTRUDE_CHUNK = 10000
+# Height in meters of the buildings without height data
+MIN_HEIGHT = 3.0
+# Side in meters of the square spatial chunks of the partitioned mode
+CHUNK_SIZE = 5000.0
+# Header and transform of the CityJSON export; CityObjects and vertices go in between
+CITYJSON_HEADER = {"type": "CityJSON", "version": "1.0"}
+CITYJSON_TRANSFORM = {"scale": [1, 1, 1], "translate": [0, 0, 0]}
+
+def extract_singapore_obj(output_dir="output_obj", csv_path="HDBPropertyInformation_geocoded.csv", mesh_format="obj",
+                          osm=None, workers=1, chunk_size=None):
     """
-    Extract 3D building models from OSM for Singapore and export as a single OBJ file.
+    Extract 3D building models from OSM for Singapore and export as a single OBJ file
+    (or PLY / GLB), streamed to disk chunk by chunk (see mesh_writers.py).
     Also export all building footprints as GeoJSON including those without height data.
     Also export buildings as CityJSON including all attributes.
     Update building heights based on CSV max_floor_lvl data for intersecting buildings.
+    With workers > 1 or a chunk_size, the join, heights, CityJSON and extrusion run per
+    spatial chunk in a process pool (see extract_partitioned).
+    Every step is recorded as a pipeline_metrics stage.
     
     Args:
         output_dir (str): Directory to save the OBJ, GeoJSON, and CityJSON files.
         csv_path (str): Path to the CSV file with max_floor_lvl, longitude, latitude.
+        mesh_format (str): Format of the full model: obj, ply or glb.
+        osm (dict): Options of osm_cache.load_buildings (cache folder, TTL, snapshot date,
+                    local .osm.pbf extract, offline mode).
+        workers (int): Processes of the partitioned mode.
+        chunk_size (float): Side in meters of the chunks of the partitioned mode
+                            (default: CHUNK_SIZE).
         
     Returns:
-        tuple: (str) Path to the generated OBJ file,
+        tuple: (str) Path to the generated OBJ (PLY, GLB) file,
                (str) Path to the generated GeoJSON file,
                (str) Path to the generated CityJSON file.
     """
@@ -33,143 +62,342 @@ def extract_singapore_obj(output_dir="output_obj", csv_path="HDBPropertyInformat
     
     place_name = "Singapore"
     tags = {"building": True}
-    print(f"Downloading building footprints for {place_name}...")
-    gdf = ox.features_from_place(place_name, tags)
+    print(f"Loading building footprints for {place_name}...")
+    with pipeline_metrics.stage("download") as counts:
+        gdf, source = load_buildings(place_name, tags, **(osm or {}))
+        counts.update(features=len(gdf), source=source)
+    print(f"Loaded {len(gdf)} features from {source}")
     
     # Read CSV and create GeoDataFrame of points
     print(f"Reading CSV data from {csv_path}...")
-    df_csv = pd.read_csv(csv_path)
-    # Create geometry column from longitude and latitude
-    geometry = [Point(xy) for xy in zip(df_csv['longitude'], df_csv['latitude'])]
-    gdf_csv = gpd.GeoDataFrame(df_csv, geometry=geometry, crs="EPSG:4326")
+    with pipeline_metrics.stage("read_csv") as counts:
+        df_csv = pd.read_csv(csv_path)
+        # Create geometry column from longitude and latitude
+        geometry = [Point(xy) for xy in zip(df_csv['longitude'], df_csv['latitude'])]
+        gdf_csv = gpd.GeoDataFrame(df_csv, geometry=geometry, crs="EPSG:4326")
+        counts["rows"] = len(df_csv)
     
     # Project both GeoDataFrames to Singapore TM (EPSG:3414) for spatial operations
-    gdf = gdf.to_crs(epsg=3414)
-    gdf_csv = gdf_csv.to_crs(epsg=3414)
+    with pipeline_metrics.stage("project"):
+        gdf = gdf.to_crs(epsg=3414)
+        gdf_csv = gdf_csv.to_crs(epsg=3414)
     
+    geojson_filename = f"singapore_building_footprints_{timestamp}.geojson"
+    geojson_path = os.path.join(output_dir, geojson_filename)
+    cityjson_filename = f"singapore_buildings_{timestamp}.city.json"
+    cityjson_path = os.path.join(output_dir, cityjson_filename)
+    obj_filename = f"singapore_full_model_{timestamp}.{mesh_format}"
+    obj_path = os.path.join(output_dir, obj_filename)
+
+    if workers > 1 or chunk_size is not None:
+        extract_partitioned(gdf, gdf_csv, geojson_path, cityjson_path, obj_path,
+                            workers, CHUNK_SIZE if chunk_size is None else chunk_size)
+        return obj_path, geojson_path, cityjson_path
+
     # Spatial join: find buildings intersecting with CSV points
     print("Performing spatial join to update building heights from CSV data...")
-    joined = gdf.sjoin(gdf_csv, how="left", predicate="intersects")
+    with pipeline_metrics.stage("sjoin") as counts:
+        joined = gdf.sjoin(gdf_csv, how="left", predicate="intersects")
+        counts["rows"] = len(joined)
     
-    # Update height_m using max_floor_lvl from CSV if available
-    def get_height(row):
-        MIN_HEIGHT = 3.0  # minimum height in meters if no data available
-        if pd.notnull(row.get('max_floor_lvl')):
-            try:
-                levels = float(row['max_floor_lvl'])
-                return levels * 3  # approx 3 meters per level
-            except:
-                pass
-        if 'height' in row and pd.notnull(row['height']):
-            try:
-                h = float(str(row['height']).replace(' m','').strip())
-                return h
-            except:
-                return MIN_HEIGHT
-        elif 'building:levels' in row and pd.notnull(row['building:levels']):
-            try:
-                levels = float(str(row['building:levels']).strip())
-                return levels * 3
-            except:
-                return MIN_HEIGHT
-        else:
-            return MIN_HEIGHT
-    
-    joined['height_m'] = joined.apply(get_height, axis=1)
-    
-    # Remove duplicates after join, keep first occurrence
-    joined = joined[~joined.index.duplicated(keep='first')]
+    # Heights from the HDB floors, the height tag or the floors tag (see building_heights.py)
+    with pipeline_metrics.stage("heights") as counts:
+        joined, coverage = with_heights(joined)
+        counts.update(coverage, buildings=len(joined))
     
     # Save all building footprints as GeoJSON (including those without height)
-    geojson_filename = f"singapore_building_footprints_{timestamp}.geojson"
-    geojson_path = os.path.join(output_dir, geojson_filename)
-    joined.to_file(geojson_path, driver="GeoJSON")
+    with pipeline_metrics.stage("geojson_export") as counts:
+        joined.to_file(geojson_path, driver="GeoJSON")
+        counts["output_bytes"] = os.path.getsize(geojson_path)
     print(f"All building footprints exported as GeoJSON at {geojson_path}")
     
     # Export CityJSON
-    cityjson_filename = f"singapore_buildings_{timestamp}.city.json"
-    cityjson_path = os.path.join(output_dir, cityjson_filename)
-    cityjson_data = {
-        "type": "CityJSON",
-        "version": "1.0",
-        "CityObjects": {},
-        "vertices": [],
-        "transform": {
-            "scale": [1, 1, 1],
-            "translate": [0, 0, 0]
-        }
-    }
+    with pipeline_metrics.stage("cityjson_export") as counts:
+        city_objects, vertices = footprint_city_objects(joined)
+        cityjson_data = {**CITYJSON_HEADER, "CityObjects": city_objects, "vertices": vertices,
+                         "transform": CITYJSON_TRANSFORM}
+        json_backend.dump(cityjson_data, cityjson_path)
+        counts.update(buildings=len(city_objects), vertices=len(vertices),
+                      output_bytes=os.path.getsize(cityjson_path))
+    print(f"All building footprints exported as CityJSON at {cityjson_path}")
+    
+    # Buildings are extruded and written EXTRUDE_CHUNK at a time, so memory stays flat
+    with pipeline_metrics.stage("mesh_export") as counts:
+        with open_mesh_writer(obj_path) as writer:
+            buildings = 0
+            for vertices, faces, extruded in extruded_chunks(joined):
+                writer.write(vertices, faces)
+                buildings += extruded
+        counts.update(buildings=buildings, vertices=writer.vertex_count, triangles=writer.face_count,
+                      output_bytes=os.path.getsize(obj_path))
     
-    vertex_index = 0
-    vertices = []
-    for idx, row in joined.iterrows():
-        geom = row.geometry
-        if not isinstance(geom, shapely.geometry.Polygon):
-            continue
-        coords = list(geom.exterior.coords)
-        # Add vertices
-        vert_indices = []
-        for coord in coords:
-            vertices.append([coord[0], coord[1], 0])
-            vert_indices.append(vertex_index)
-            vertex_index += 1
-        # Create CityObject
-        cityjson_data["CityObjects"][str(idx)] = {
+    report_mesh(writer, obj_path)
+    return obj_path, geojson_path, cityjson_path
+
+def with_heights(joined):
+    """
+    The buildings of the spatial join, one row each, with height_m and min_height_m.
+    Returns (GeoDataFrame, coverage counts of normalize_heights).
+    """
+    # Remove duplicates after join, keep the first CSV row of every building: the order of
+    # the matches depends on the spatial index, which differs from chunk to chunk
+    building = pd.factorize(joined.index)[0]
+    joined = joined.iloc[np.lexsort((joined['index_right'].to_numpy(), building))]
+    joined = joined[~joined.index.duplicated(keep='first')]
+    heights, coverage = normalize_heights(joined, default=MIN_HEIGHT)
+    joined['height_m'] = heights['height_m']
+    joined['min_height_m'] = heights['min_height_m']
+    return joined, coverage
+
+def footprint_city_objects(joined, vertex_offset=0):
+    """
+    CityObjects of the Polygon footprints of joined (flat Solids at z = 0, with every column
+    as attributes) and their vertices; vertex indices start at vertex_offset. The rings are
+    read for all footprints at once and the attributes column-wise (to_dict("records")).
+    Returns (dict of CityObjects by index, list of [x, y, z] vertices).
+    """
+    geoms = joined.geometry.to_numpy()
+    rows = np.flatnonzero(shapely.get_type_id(geoms) == POLYGON_TYPE_ID)
+    coords, ring = shapely.get_coordinates(shapely.get_exterior_ring(geoms[rows]), return_index=True)
+    vertices = [[x, y, 0] for x, y in coords.tolist()]
+    # Vertex indices of every exterior ring, in order
+    ends = np.cumsum(np.bincount(ring, minlength=len(rows)))
+    rings = np.split(np.arange(vertex_offset, vertex_offset + len(coords)), ends[:-1])
+    attributes = joined.iloc[rows].drop(columns="geometry").to_dict("records")
+    city_objects = {
+        str(idx): {
             "type": "Building",
             "geometry": [{
                 "type": "Solid",
-                "boundaries": [[[vert_indices]]]
+                "boundaries": [[[vert_indices.tolist()]]]
             }],
-            "attributes": row.drop("geometry").to_dict()
+            "attributes": attributes_of
         }
-    cityjson_data["vertices"] = vertices
-    
-    with open(cityjson_path, "w") as f:
-        json.dump(cityjson_data, f, indent=2)
-    print(f"All building footprints exported as CityJSON at {cityjson_path}")
-    
-    def create_trimesh_extruded_building(footprint, height):
-        exterior_coords = np.array(footprint.exterior.coords)
-        bottom = np.column_stack((exterior_coords, np.zeros(len(exterior_coords))))
-        top = np.column_stack((exterior_coords, np.full(len(exterior_coords), height)))
-        vertices = np.vstack((bottom, top))
-        n = len(exterior_coords)
-        faces = []
-        for i in range(1, n-1):
-            faces.append([0, i, i+1])
-        for i in range(1, n-1):
-            faces.append([n, n+i+1, n+i])
-        for i in range(n-1):
-            a = i
-            b = i+1
-            c = n + b
-            d = n + a
-            faces.append([a, b, c])
-            faces.append([a, c, d])
-        mesh = trimesh.Trimesh(vertices=vertices, faces=faces)
-        return mesh
-    
-    merged_meshes = []
-    for idx, row in joined.iterrows():
-        footprint = row.geometry
-        height = row['height_m']
-        if not isinstance(footprint, shapely.geometry.Polygon):
-            continue
-        mesh = create_trimesh_extruded_building(footprint, height)
-        merged_meshes.append(mesh)
-    
-    full_mesh = trimesh.util.concatenate(merged_meshes)
-    
+        for idx, vert_indices, attributes_of in zip(joined.index[rows], rings, attributes)
+    }
+    return city_objects, vertices
+
+def extruded_chunks(joined):
+    """
+    Extrude the buildings of joined EXTRUDE_CHUNK at a time.
+    Yields (vertices, faces, number of buildings extruded) for every chunk.
+    """
+    for start in range(0, len(joined), EXTRUDE_CHUNK):
+        chunk = joined.iloc[start:start + EXTRUDE_CHUNK]
+        geometry = extrude_footprints(chunk.geometry, chunk['height_m'].to_numpy(dtype=np.float64),
+                                      bases=chunk['min_height_m'].to_numpy(dtype=np.float64))
+        vertices, faces, _ = extruded_mesh(geometry)
+        yield vertices, faces, len(geometry["object_ids"])
+
+def report_mesh(writer, obj_path):
     # Debug prints
-    print(f"Final merged mesh has {len(full_mesh.vertices)} vertices and {len(full_mesh.faces)} faces.")
-    if len(full_mesh.vertices) == 0 or len(full_mesh.faces) == 0:
-        print("Warning: The merged mesh is empty. No geometry to export.")
-    
-    obj_filename = f"singapore_full_model_{timestamp}.obj"
-    obj_path = os.path.join(output_dir, obj_filename)
-    full_mesh.export(obj_path)
-    print(f"Full Singapore model exported as OBJ at {obj_path}")
-    return obj_path, geojson_path, cityjson_path
+    print(f"Final merged mesh has {writer.vertex_count} vertices and {writer.face_count} faces.")
+    if writer.vertex_count == 0 or writer.face_count == 0:
+        print("Warning: The merged mesh is empty. No geometry was exported.")
+    print(f"Full Singapore model exported as {os.path.splitext(obj_path)[1][1:].upper()} at {obj_path}")
+
+def partition(footprints, chunk_size):
+    """
+    Split footprints (a projected GeoSeries) into square chunks of chunk_size meters over
+    their extent. Every footprint belongs to the one chunk holding the center of its bounding
+    box, so a building crossing a chunk edge is joined and extruded once, whole.
+    Returns the positions in footprints of every nonempty chunk, chunks in row-major order.
+    """
+    bounds = shapely.bounds(np.asarray(footprints, dtype=object))
+    center = (bounds[:, :2] + bounds[:, 2:]) / 2
+    finite = np.isfinite(center).all(axis=1)
+    origin = bounds[finite, :2].min(axis=0) if finite.any() else np.zeros(2)
+    # Empty geometries (and coordinates that did not project) have no usable bounds; they
+    # go to the first chunk
+    center[~finite] = origin
+    cell = np.floor((center - origin) / chunk_size).astype(np.int64)
+    key = cell[:, 1] * (cell[:, 0].max(initial=0) + 1) + cell[:, 0]
+    order = np.argsort(key, kind="stable")
+    return np.split(order, np.flatnonzero(np.diff(key[order])) + 1) if len(order) else []
+
+def _extract_chunk(buildings, points, vertex_offset, spill_prefix, layer):
+    """
+    Partitioned mode worker: spatial join, heights, GeoJSON, CityJSON and extrusion of the
+    buildings of one chunk. points are the CSV points within the bounds of the buildings, so
+    joins across chunk edges are kept. Writes, to files starting with spill_prefix:
+    - .geojson: the buildings as GeoJSON, layer named layer
+    - .objects.json, .vertices.json: the CityObjects and their vertices as JSON fragments
+      (the members of the object and the items of the list), vertex indices from vertex_offset
+    - .mesh.vertices, .mesh.faces: the extruded mesh as raw float64 vertices and int64 faces
+    Returns the counts of the chunk.
+    """
+    joined = buildings.sjoin(points, how="left", predicate="intersects")
+    # index_right is float in the join of all buildings too (see extract_partitioned)
+    if pd.api.types.is_integer_dtype(joined["index_right"].dtype):
+        joined["index_right"] = joined["index_right"].astype(np.float64)
+    joined, coverage = with_heights(joined)
+    joined.to_file(spill_prefix + ".geojson", driver="GeoJSON", layer=layer)
+
+    city_objects, vertices = footprint_city_objects(joined, vertex_offset)
+    with open(spill_prefix + ".objects.json", "wb") as f:
+        f.write(json_backend.dumps(city_objects)[1:-1])
+    with open(spill_prefix + ".vertices.json", "wb") as f:
+        f.write(json_backend.dumps(vertices)[1:-1])
+
+    extruded = mesh_vertices = mesh_faces = 0
+    with open(spill_prefix + ".mesh.vertices", "wb") as vertex_file, open(spill_prefix + ".mesh.faces", "wb") as face_file:
+        for chunk_vertices, chunk_faces, chunk_buildings in extruded_chunks(joined):
+            vertex_file.write(np.asarray(chunk_vertices, dtype=np.float64).tobytes())
+            face_file.write((np.asarray(chunk_faces, dtype=np.int64) + mesh_vertices).tobytes())
+            extruded += chunk_buildings
+            mesh_vertices += len(chunk_vertices)
+            mesh_faces += len(chunk_faces)
+
+    counts = Counter(coverage)
+    counts.update(buildings=len(joined), city_objects=len(city_objects), cityjson_vertices=len(vertices),
+                  extruded=extruded, vertices=mesh_vertices, triangles=mesh_faces)
+    return counts
+
+def _copy_fragments(paths, f):
+    """
+    Write the nonempty JSON fragments at paths to f, separated by commas.
+    """
+    first = True
+    for path in paths:
+        with open(path, "rb") as fragment:
+            data = fragment.read()
+        if data:
+            f.write(data if first else b"," + data)
+            first = False
+
+def _copy_features(paths, f):
+    """
+    Merge the GeoJSON files at paths, written by the GDAL GeoJSON driver (the header up to
+    the "features" line, then one feature per line), into one FeatureCollection in f.
+    """
+    first = True
+    for path in paths:
+        with open(path, "rb") as collection:
+            header = []
+            for line in collection:
+                header.append(line)
+                if line.startswith(b'"features"'):
+                    break
+            if first:
+                f.writelines(header)
+            for line in collection:
+                if line.startswith(b"]"):
+                    break
+                feature = line.rstrip(b"\r\n").rstrip(b",")
+                f.write(feature if first else b",\n" + feature)
+                first = False
+    f.write(b"\n]\n}\n")
+
+def extract_partitioned(gdf, gdf_csv, geojson_path, cityjson_path, obj_path, workers, chunk_size):
+    """
+    Partitioned mode of extract_singapore_obj for projected buildings gdf and CSV points
+    gdf_csv: the buildings are split into spatial chunks (see partition), every chunk is
+    joined, given heights, exported and extruded by _extract_chunk in a pool of workers
+    processes (in this process when workers is 1), and the partial outputs are merged in
+    chunk order by streaming them into the GeoJSON, CityJSON and mesh files. At most
+    2 * workers chunks are queued at a time, so a worker only ever holds one chunk.
+    """
+    with pipeline_metrics.stage("partition") as counts:
+        chunks = partition(gdf.geometry, chunk_size)
+        geoms = gdf.geometry.to_numpy()
+        # CityJSON vertices of every building (the exterior ring of Polygons), to number the
+        # vertices of every chunk before it is processed
+        cityjson_vertices = np.where(shapely.get_type_id(geoms) == POLYGON_TYPE_ID,
+                                     shapely.get_num_coordinates(shapely.get_exterior_ring(geoms)), 0)
+        vertex_offsets = np.cumsum([0] + [int(cityjson_vertices[rows].sum()) for rows in chunks])
+        csv_points = gdf_csv.geometry.to_numpy()
+        csv_xy = np.column_stack((shapely.get_x(csv_points), shapely.get_y(csv_points)))
+        # Integer CSV columns are float in the join of all buildings, as some building always
+        # falls in no HDB block; a chunk where every building falls in one would keep ints
+        gdf_csv = gdf_csv.astype({column: np.float64 for column, dtype in gdf_csv.dtypes.items()
+                                  if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype)})
+        counts.update(chunks=len(chunks), max_chunk_buildings=max((len(rows) for rows in chunks), default=0),
+                      chunk_size_m=chunk_size)
+    print(f"Processing {len(gdf)} buildings in {len(chunks)} chunks of {chunk_size:g} m with {workers} workers...")
+
+    layer = os.path.splitext(os.path.basename(geojson_path))[0]
+
+    def chunk_arguments(index, rows):
+        buildings = gdf.iloc[rows]
+        if isinstance(buildings.index, pd.MultiIndex):
+            # A slice keeps the levels of the whole index, which every pandas operation copies
+            buildings.index = buildings.index.remove_unused_levels()
+        minx, miny, maxx, maxy = buildings.total_bounds
+        inside = ((csv_xy[:, 0] >= minx) & (csv_xy[:, 0] <= maxx)
+                  & (csv_xy[:, 1] >= miny) & (csv_xy[:, 1] <= maxy))
+        return buildings, gdf_csv[inside], vertex_offsets[index], prefixes[index], layer
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(obj_path))) as spill_folder:
+        prefixes = [os.path.join(spill_folder, f"chunk_{index}") for index in range(len(chunks))]
+        with pipeline_metrics.stage("chunks") as counts:
+            totals = Counter()
+            if workers <= 1:
+                for index, rows in enumerate(chunks):
+                    totals.update(_extract_chunk(*chunk_arguments(index, rows)))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    pending = deque()
+                    for index, rows in enumerate(chunks):
+                        pending.append(executor.submit(_extract_chunk, *chunk_arguments(index, rows)))
+                        if len(pending) >= 2 * workers:
+                            totals.update(pending.popleft().result())
+                    for future in pending:
+                        totals.update(future.result())
+            counts.update(totals, workers=workers)
+
+        # Save all building footprints as GeoJSON (including those without height)
+        with pipeline_metrics.stage("geojson_export") as counts:
+            if chunks:
+                with open(geojson_path, "wb") as f:
+                    _copy_features([prefix + ".geojson" for prefix in prefixes], f)
+            else:
+                gdf.to_file(geojson_path, driver="GeoJSON")
+            counts.update(buildings=totals["buildings"], output_bytes=os.path.getsize(geojson_path))
+        print(f"All building footprints exported as GeoJSON at {geojson_path}")
+
+        with pipeline_metrics.stage("cityjson_export") as counts:
+            header = json_backend.dumps(CITYJSON_HEADER)[:-1]
+            with open(cityjson_path, "wb") as f:
+                f.write(header + b',"CityObjects":{')
+                _copy_fragments([prefix + ".objects.json" for prefix in prefixes], f)
+                f.write(b'},"vertices":[')
+                _copy_fragments([prefix + ".vertices.json" for prefix in prefixes], f)
+                f.write(b'],"transform":' + json_backend.dumps(CITYJSON_TRANSFORM) + b"}")
+            counts.update(buildings=totals["city_objects"], vertices=int(vertex_offsets[-1]),
+                          output_bytes=os.path.getsize(cityjson_path))
+        print(f"All building footprints exported as CityJSON at {cityjson_path}")
+
+        with pipeline_metrics.stage("mesh_export") as counts:
+            with open_mesh_writer(obj_path) as writer:
+                for prefix in prefixes:
+                    writer.write(np.fromfile(prefix + ".mesh.vertices", dtype=np.float64),
+                                 np.fromfile(prefix + ".mesh.faces", dtype=np.int64))
+            counts.update(buildings=totals["extruded"], vertices=writer.vertex_count, triangles=writer.face_count,
+                          output_bytes=os.path.getsize(obj_path))
+
+    report_mesh(writer, obj_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Singapore's OSM buildings as OBJ, GeoJSON and CityJSON.")
+    parser.add_argument("--output-dir", default="output_obj", help="folder for the exported files")
+    parser.add_argument("--csv", default="HDBPropertyInformation_geocoded.csv",
+                        help="HDB CSV whose max_floor_lvl overrides the OSM heights")
+    parser.add_argument("--mesh-format", choices=["obj", "ply", "glb"], default="obj",
+                        help="format of the full model (default: obj)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes joining and extruding spatial chunks; more than 1 turns on the "
+                             "partitioned mode (default: 1)")
+    parser.add_argument("--chunk-size", type=float,
+                        help=f"side in meters of the spatial chunks; turns on the partitioned mode "
+                             f"(default with --workers: {CHUNK_SIZE:g})")
+    add_osm_arguments(parser)
+    pipeline_metrics.add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with pipeline_metrics.profile(args.output_dir, args.profile):
+        extract_singapore_obj(args.output_dir, args.csv, args.mesh_format, osm_options(args),
+                              args.workers, args.chunk_size)
+    pipeline_metrics.report()
 
 if __name__ == "__main__":
-    extract_singapore_obj()
+    main()
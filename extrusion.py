@@ -0,0 +1,243 @@
+"""
+Bulk extrusion of building footprints into flat mesh arrays.
+
+This module:
+- Reads the rings of all footprint polygons at once with shapely 2 (get_rings and
+  get_coordinates with return_index), drops the closing vertex of every ring and orients
+  exterior rings counter-clockwise and holes clockwise.
+- Extrudes every footprint from its base (z = 0 unless given) to its height into a Solid of
+  a bottom surface, a top surface and one quad wall per footprint edge (holes included), as
+  the flat, offset-indexed geometry arrays of cityjson_to_3dtiles.parse_cityjson_geometry,
+  ready for build_tiles.
+- Triangulates the bottom and top surfaces once for all footprints (see triangulation.py)
+  and splits every wall into two triangles, all wound to face outwards.
+
+No Python code runs per building or per face; only concave footprints and footprints with
+holes are ear clipped one at a time.
+
+Dependencies:
+- numpy
+- shapely >= 2.0
+"""
+
+import numpy as np
+import shapely
+
+from triangulation import triangulate_surfaces
+
+# shapely geometry type id of Polygon
+POLYGON_TYPE_ID = 3
+
+def footprint_rings(footprints):
+    """
+    Rings of the Polygon footprints, without their closing vertex; other geometry types
+    and empty polygons are skipped.
+    Exterior rings are counter-clockwise and holes clockwise.
+    Returns a dict with:
+    - footprint_index: (P,) positions in footprints of the polygons read
+    - coords: Cx2 corners of all rings
+    - ring_offsets: (R+1) offsets of each ring into coords
+    - polygon_offsets: (P+1) offsets of each polygon into the rings, first ring is exterior
+    """
+    footprints = np.asarray(footprints, dtype=object)
+    footprint_index = np.flatnonzero((shapely.get_type_id(footprints) == POLYGON_TYPE_ID)
+                                     & ~shapely.is_empty(footprints))
+    rings, ring_polygon = shapely.get_rings(footprints[footprint_index], return_index=True)
+    coords, corner_ring = shapely.get_coordinates(rings, return_index=True)
+
+    polygon_offsets = np.zeros(len(footprint_index) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ring_polygon, minlength=len(footprint_index)), out=polygon_offsets[1:])
+
+    # Drop the closing vertex of every ring
+    closed_sizes = np.bincount(corner_ring, minlength=len(rings))
+    keep = np.ones(len(coords), dtype=bool)
+    keep[(np.cumsum(closed_sizes) - 1)[closed_sizes > 0]] = False
+    coords, corner_ring = coords[keep], corner_ring[keep]
+    ring_offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+    np.cumsum(np.maximum(closed_sizes - 1, 0), out=ring_offsets[1:])
+
+    # Shoelace area of every ring; reverse the rings that wind the wrong way
+    following = coords[_next_corner(ring_offsets)]
+    area = np.bincount(corner_ring, coords[:, 0] * following[:, 1] - following[:, 0] * coords[:, 1],
+                       minlength=len(rings))
+    exterior = np.zeros(len(rings), dtype=bool)
+    exterior[polygon_offsets[:-1][np.diff(polygon_offsets) > 0]] = True
+    flip = np.where(exterior, area < 0, area > 0)[corner_ring]
+    # Reversed rings keep their first corner, as shapely.geometry.polygon.orient does
+    corners = np.arange(len(coords))
+    start, size = ring_offsets[:-1][corner_ring], np.diff(ring_offsets)[corner_ring]
+    coords = coords[np.where(flip, start + (size - (corners - start)) % np.maximum(size, 1), corners)]
+
+    return {"footprint_index": footprint_index, "coords": coords, "ring_offsets": ring_offsets,
+            "polygon_offsets": polygon_offsets}
+
+def _next_corner(ring_offsets):
+    """
+    Position of the next corner in its ring, for every corner.
+    """
+    next_corner = np.arange(1, ring_offsets[-1] + 1)
+    nonempty = ring_offsets[1:] > ring_offsets[:-1]
+    next_corner[ring_offsets[1:][nonempty] - 1] = ring_offsets[:-1][nonempty]
+    return next_corner
+
+def _reversed_corner(ring_offsets, corner_ring):
+    """
+    Position of every corner in its ring read backwards.
+    """
+    return ring_offsets[:-1][corner_ring] + ring_offsets[1:][corner_ring] - 1 - np.arange(len(corner_ring))
+
+def _interleave(owners, num_owners):
+    """
+    Merge groups of elements, each sorted by owner (building), into one array sorted by owner
+    with the groups in the given order within every owner.
+    Returns (positions of the elements of every group in the merged array, merged length).
+    """
+    counts = [np.bincount(owner, minlength=num_owners) for owner in owners]
+    total = np.sum(counts, axis=0, dtype=np.int64)
+    before = np.cumsum(total) - total
+    positions = []
+    for owner, count in zip(owners, counts):
+        group_start = np.cumsum(count) - count
+        positions.append(before[owner] + np.arange(len(owner)) - group_start[owner])
+        before = before + count
+    return positions, int(total.sum())
+
+def extrude_footprints(footprints, heights, object_ids=None, object_attributes=None, bases=None):
+    """
+    Extrude Polygon footprints (a GeoSeries, e.g. gdf.geometry, or any sequence of shapely
+    geometries) to their heights; holes are kept, other geometry types are skipped.
+    heights: height in meters of every footprint
+    bases: height in meters every footprint starts at (OSM min_height; default 0)
+    object_ids, object_attributes: id and attributes dict of every footprint (default: the
+        position of the footprint and no attributes)
+    Returns a dict with the arrays of cityjson_to_3dtiles.parse_cityjson_geometry (one
+    CityObject per extruded footprint, its surfaces ordered bottom, top, walls; float64
+    vertices, each building's bottom corners then its top corners) and footprint_index, the
+    positions in footprints of the CityObjects.
+    """
+    rings = footprint_rings(footprints)
+    footprint_index = rings["footprint_index"]
+    coords, ring_offsets, polygon_offsets = rings["coords"], rings["ring_offsets"], rings["polygon_offsets"]
+    num_polygons = len(footprint_index)
+    num_corners = len(coords)
+    heights = np.asarray(heights, dtype=np.float64)[footprint_index]
+    bases = np.zeros(num_polygons) if bases is None else np.asarray(bases, dtype=np.float64)[footprint_index]
+
+    ring_polygon = np.repeat(np.arange(num_polygons), np.diff(polygon_offsets))
+    corner_ring = np.repeat(np.arange(len(ring_offsets) - 1), np.diff(ring_offsets))
+    corner_polygon = ring_polygon[corner_ring]
+    corner_count = np.diff(ring_offsets[polygon_offsets])
+    ring_sizes = np.diff(ring_offsets)
+
+    # Every building's bottom corners, then its top corners
+    bottom_id = ring_offsets[polygon_offsets[:-1]][corner_polygon] + np.arange(num_corners)
+    top_id = bottom_id + corner_count[corner_polygon]
+    vertices = np.empty((2 * num_corners, 3))
+    vertices[bottom_id, :2] = coords
+    vertices[bottom_id, 2] = bases[corner_polygon]
+    vertices[top_id, :2] = coords
+    vertices[top_id, 2] = heights[corner_polygon]
+
+    # One wall per footprint edge of nonzero length: bottom i, bottom j, top j, top i
+    next_corner = _next_corner(ring_offsets)
+    walls = np.flatnonzero(np.any(coords[next_corner] != coords, axis=1))
+    wall_polygon = corner_polygon[walls]
+    wall_ids = np.column_stack((bottom_id[walls], bottom_id[next_corner[walls]],
+                                top_id[next_corner[walls]], top_id[walls]))
+
+    # Surfaces of every building: bottom (rings reversed, facing down), top, walls
+    reverse = _reversed_corner(ring_offsets, corner_ring)
+    (bottom_pos, top_pos, wall_pos), num_positions = _interleave(
+        [corner_polygon, corner_polygon, np.repeat(wall_polygon, 4)], num_polygons)
+    ring_vertices = np.empty(num_positions, dtype=np.int64)
+    ring_vertices[bottom_pos] = bottom_id[reverse]
+    ring_vertices[top_pos] = top_id
+    ring_vertices[wall_pos] = wall_ids.ravel()
+
+    (bottom_rings, top_rings, wall_rings), num_rings = _interleave([ring_polygon, ring_polygon, wall_polygon],
+                                                                   num_polygons)
+    sizes = np.empty(num_rings, dtype=np.int64)
+    sizes[bottom_rings] = ring_sizes
+    sizes[top_rings] = ring_sizes
+    sizes[wall_rings] = 4
+    out_ring_offsets = np.zeros(num_rings + 1, dtype=np.int64)
+    np.cumsum(sizes, out=out_ring_offsets[1:])
+
+    polygons = np.arange(num_polygons)
+    (bottom_surface, top_surface, wall_surface), num_surfaces = _interleave([polygons, polygons, wall_polygon],
+                                                                            num_polygons)
+    surface_rings = np.empty(num_surfaces, dtype=np.int64)
+    surface_rings[bottom_surface] = np.diff(polygon_offsets)
+    surface_rings[top_surface] = np.diff(polygon_offsets)
+    surface_rings[wall_surface] = 1
+    surface_offsets = np.zeros(num_surfaces + 1, dtype=np.int64)
+    np.cumsum(surface_rings, out=surface_offsets[1:])
+    surface_object = np.repeat(polygons, 2 + np.bincount(wall_polygon, minlength=num_polygons))
+
+    # The footprints are triangulated once, as the top surfaces; the bottom reuses the
+    # triangles with the opposite winding
+    flat = np.column_stack((coords, np.zeros(num_corners)))
+    caps, cap_polygon = triangulate_surfaces(flat, np.arange(num_corners), ring_offsets, polygon_offsets)
+    wall_pos = wall_pos.reshape(-1, 4)
+    wall_triangles = np.stack((wall_pos[:, [0, 1, 2]], wall_pos[:, [0, 2, 3]]), axis=1).reshape(-1, 3)
+    (bottom_tris, top_tris, wall_tris), num_triangles = _interleave(
+        [cap_polygon, cap_polygon, np.repeat(wall_polygon, 2)], num_polygons)
+    triangles = np.empty((num_triangles, 3), dtype=np.int64)
+    triangles[bottom_tris] = bottom_pos[reverse[caps]][:, [0, 2, 1]]
+    triangles[top_tris] = top_pos[caps]
+    triangles[wall_tris] = wall_triangles
+    triangle_surface = np.empty(num_triangles, dtype=np.int64)
+    triangle_surface[bottom_tris] = bottom_surface[cap_polygon]
+    triangle_surface[top_tris] = top_surface[cap_polygon]
+    triangle_surface[wall_tris] = np.repeat(wall_surface, 2)
+
+    if object_ids is None:
+        object_ids = [str(i) for i in footprint_index]
+    else:
+        object_ids = [object_ids[i] for i in footprint_index]
+    if object_attributes is None:
+        object_attributes = [{} for _ in footprint_index]
+    else:
+        object_attributes = [object_attributes[i] for i in footprint_index]
+
+    return {
+        "vertices": vertices,
+        "scale": np.ones(3),
+        "translate": np.zeros(3),
+        "ring_vertices": ring_vertices,
+        "ring_offsets": out_ring_offsets,
+        "surface_offsets": surface_offsets,
+        "surface_object": surface_object,
+        "object_ids": object_ids,
+        "object_attributes": object_attributes,
+        "triangles": triangles,
+        "triangle_surface": triangle_surface,
+        "footprint_index": footprint_index,
+    }
+
+def extruded_mesh(geometry):
+    """
+    The triangle mesh of extruded footprints (see extrude_footprints).
+    Returns (vertices Vx3 float64, faces Fx3, face_object (F,) index of the CityObject of
+    every face).
+    """
+    return (geometry["vertices"], geometry["ring_vertices"][geometry["triangles"]],
+            geometry["surface_object"][geometry["triangle_surface"]])
+
+def extruded_mesh_blocks(geometry, block_size):
+    """
+    The triangle mesh of extruded footprints (see extruded_mesh) in blocks of block_size
+    CityObjects, for the streaming writers of mesh_writers.py. The vertices, surfaces and
+    triangles of extrude_footprints are ordered by building, so every block is a slice of
+    them; its faces index the block's vertices from 0.
+    Yields (vertices, faces, number of CityObjects) for every block.
+    """
+    num_objects = len(geometry["object_ids"])
+    for start in range(0, num_objects, block_size):
+        stop = min(start + block_size, num_objects)
+        first, last = np.searchsorted(geometry["triangle_surface"],
+                                      np.searchsorted(geometry["surface_object"], [start, stop]))
+        faces = geometry["ring_vertices"][geometry["triangles"][first:last]]
+        low = int(faces.min()) if len(faces) else 0
+        high = int(faces.max()) + 1 if len(faces) else 0
+        yield geometry["vertices"][low:high], faces - low, stop - start
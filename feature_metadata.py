@@ -0,0 +1,152 @@
+"""
+Per-feature metadata for merged tile meshes.
+
+This module:
+- Infers a property schema (STRING, INT64, FLOAT64 or BOOLEAN per attribute) from
+  feature attribute rows.
+- Encodes the rows of one tile as an EXT_structural_metadata property table (binary
+  columns) or as a 3D Tiles 1.0 b3dm batch table (JSON).
+
+Every row is a dict of attribute name -> value; missing and NaN values are written as
+the property's noData value (empty string for STRING, false for BOOLEAN).
+
+Dependencies:
+- numpy
+"""
+
+import re
+import math
+import numbers
+import numpy as np
+
+# Class of every feature in the property tables
+FEATURE_CLASS = "building"
+# noData value of numeric properties
+NO_DATA = -9999
+
+# Type promotion when an attribute holds values of several types
+_PROMOTE = {
+    frozenset(["INT64", "FLOAT64"]): "FLOAT64",
+}
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+def value_type(value):
+    """
+    Property type of a single attribute value, or None for a missing value.
+    """
+    if _is_missing(value):
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return "BOOLEAN"
+    if isinstance(value, numbers.Integral):
+        return "INT64"
+    if isinstance(value, numbers.Real):
+        return None if math.isnan(value) else "FLOAT64"
+    return "STRING"
+
+def infer_schema(rows, schema=None):
+    """
+    Property type of every attribute in rows, merged into schema (a previous result for
+    other rows) when given. Attributes mixing INT64 and FLOAT64 become FLOAT64; any other
+    mix becomes STRING. Returns {attribute name: type}.
+    """
+    schema = dict(schema or {})
+    for row in rows:
+        for name, value in row.items():
+            kind = value_type(value)
+            if kind is None:
+                schema.setdefault(name, None)
+                continue
+            known = schema.get(name)
+            if known is None or known == kind:
+                schema[name] = kind
+            else:
+                schema[name] = _PROMOTE.get(frozenset([known, kind]), "STRING")
+    return schema
+
+def property_ids(schema):
+    """
+    Map attribute names to metadata property ids, which may only use letters, digits and
+    underscores (e.g. 'building:levels' -> 'building_levels'). Returns {name: id}.
+    """
+    ids = {}
+    used = set()
+    for name in schema:
+        base = re.sub(r"[^A-Za-z0-9_]", "_", str(name))
+        if not base or base[0].isdigit():
+            base = "_" + base
+        property_id, n = base, 1
+        while property_id in used:
+            property_id, n = f"{base}_{n}", n + 1
+        used.add(property_id)
+        ids[name] = property_id
+    return ids
+
+def metadata_schema(schema):
+    """
+    EXT_structural_metadata schema with one class holding every attribute of schema.
+    Attributes that were always missing are written as STRING.
+    """
+    properties = {}
+    for name, property_id in property_ids(schema).items():
+        kind = schema[name] or "STRING"
+        definition = {"name": str(name)}
+        if kind in ("STRING", "BOOLEAN"):
+            definition["type"] = kind
+        else:
+            definition.update({"type": "SCALAR", "componentType": kind, "noData": NO_DATA})
+        properties[property_id] = definition
+    return {"id": "features", "classes": {FEATURE_CLASS: {"properties": properties}}}
+
+def _column(rows, name, kind):
+    """
+    Binary column of one property for the rows.
+    Returns {"values": array} and, for STRING, {"stringOffsets": array} as well.
+    """
+    values = [row.get(name) for row in rows]
+    if kind == "BOOLEAN":
+        bits = np.array([bool(value) and not _is_missing(value) for value in values], dtype=np.uint8)
+        return {"values": np.packbits(bits, bitorder="little")}
+    if kind in ("INT64", "FLOAT64"):
+        dtype = np.int64 if kind == "INT64" else np.float64
+        return {"values": np.array([NO_DATA if _is_missing(value) else value for value in values], dtype=dtype)}
+
+    encoded = [b"" if _is_missing(value) else str(value).encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return {"values": np.frombuffer(b"".join(encoded), dtype=np.uint8), "stringOffsets": offsets}
+
+def property_table_columns(rows, schema):
+    """
+    Binary columns of the EXT_structural_metadata property table for the rows (one row per
+    feature id). Returns {property id: {"values": array[, "stringOffsets": array]}}; the
+    caller stores each array in a buffer view.
+    """
+    return {
+        property_id: _column(rows, name, schema[name] or "STRING")
+        for name, property_id in property_ids(schema).items()
+    }
+
+def batch_table(rows, schema):
+    """
+    b3dm batch table JSON for the rows: one array per attribute, null where missing.
+    """
+    table = {}
+    for name in schema:
+        column = []
+        for row in rows:
+            value = row.get(name)
+            if _is_missing(value):
+                column.append(None)
+            elif isinstance(value, (bool, np.bool_)):
+                column.append(bool(value))
+            elif isinstance(value, numbers.Integral):
+                column.append(int(value))
+            elif isinstance(value, numbers.Real):
+                column.append(float(value))
+            else:
+                column.append(value if isinstance(value, str) else str(value))
+        table[str(name)] = column
+    return table
@@ -0,0 +1,282 @@
+"""
+I3S 1.7 3D Object scene layer content for SLPK packages.
+
+This module:
+- Writes the geometry buffer (positions, normals, feature ids and face ranges) and one
+  attribute buffer per field for every tile mesh, gzipped as I3S resources.
+- Builds the paged node tree (nodepages) from the tile tree of cityjson_to_3dtiles, with
+  lodThreshold derived from the geometricError of each tile.
+- Writes the 3dSceneLayer.json document and the SLPK metadata.json.
+
+Tile meshes are written as nodes/<resource>/geometries/0.bin.gz and
+nodes/<resource>/attributes/f_<k>/0.bin.gz, where the resource id is derived from the tile
+name, so tiles can be written by any process before the node tree is known.
+Geometry is non-indexed: every triangle has its own three vertices, grouped by feature.
+Positions are relative to the center of the tile's bounding box.
+
+Dependencies:
+- numpy
+"""
+
+import posixpath
+import math
+import gzip
+import uuid
+import struct
+import numpy as np
+
+import json_backend
+from feature_metadata import property_ids
+
+I3S_VERSION = "1.7"
+NODES_PER_PAGE = 64
+# Screen space error (pixels) at which a node switches to its children, as in 3D Tiles viewers
+SCREEN_SPACE_ERROR = 16
+
+# I3S value type and ArcGIS field type of every feature_metadata property type
+FIELD_TYPES = {
+    "STRING": ("String", "esriFieldTypeString"),
+    "INT64": ("Float64", "esriFieldTypeDouble"),
+    "FLOAT64": ("Float64", "esriFieldTypeDouble"),
+    "BOOLEAN": ("Int16", "esriFieldTypeSmallInteger"),
+}
+
+GEOMETRY_DEFINITION = {
+    "geometryBuffers": [{
+        "offset": 8,
+        "position": {"type": "Float32", "component": 3},
+        "normal": {"type": "Float32", "component": 3},
+        "featureId": {"type": "UInt64", "component": 1, "binding": "per-feature"},
+        "faceRange": {"type": "UInt32", "component": 2, "binding": "per-feature"},
+    }]
+}
+
+def _gzip(data):
+    # mtime=0 keeps the package bytes identical between runs
+    return gzip.compress(data, mtime=0)
+
+def resource_id(name):
+    """
+    Resource id of the tile named tile_<level>_<x>_<y>: its index in a full quadtree,
+    level by level with the cells of a level in Morton order.
+    """
+    level, x, y = (int(part) for part in name.split("_")[1:4])
+    index = 0
+    for bit in range(level):
+        index |= ((x >> bit) & 1) << (2 * bit) | ((y >> bit) & 1) << (2 * bit + 1)
+    return (4 ** level - 1) // 3 + index
+
+def geometry_buffer(vertices, indices, feature_ids, center):
+    """
+    I3S geometry buffer of a mesh (see GEOMETRY_DEFINITION).
+    vertices: Nx3 array; indices: Mx3 triangles, grouped by feature
+    feature_ids: (F,) id of every feature and its (first, last) triangle, as (ids, ranges)
+    center: the positions are written relative to this point
+    """
+    ids, ranges = feature_ids
+    corners = np.asarray(vertices, dtype=np.float64)[np.asarray(indices).reshape(-1)]
+    positions = (corners - np.asarray(center, dtype=np.float64)).astype(np.float32)
+
+    # Flat normals: every corner gets the normal of its triangle
+    triangles = corners.reshape(-1, 3, 3)
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    normals = np.where(lengths[:, None] > 0, normals / np.where(lengths > 0, lengths, 1)[:, None], [0, 0, 1])
+    normals = np.repeat(normals.astype(np.float32), 3, axis=0)
+
+    return b"".join([
+        struct.pack("<II", len(positions), len(ids)),
+        positions.tobytes(),
+        normals.tobytes(),
+        np.asarray(ids, dtype=np.uint64).tobytes(),
+        np.asarray(ranges, dtype=np.uint32).tobytes(),
+    ])
+
+def layer_fields(schema):
+    """
+    Fields of the layer: OBJECTID (the feature id), then one per schema attribute, named
+    by its metadata property id. Returns [(attribute name or None, field, attribute storage info)].
+    """
+    storage = {"key": "f_0", "name": "OBJECTID", "header": [{"property": "count", "valueType": "UInt32"}],
+               "ordering": ["attributeValues"], "attributeValues": {"valueType": "Oid32", "valuesPerElement": 1}}
+    fields = [(None, {"name": "OBJECTID", "type": "esriFieldTypeOID", "alias": "OBJECTID"}, storage)]
+    for k, (name, field_name) in enumerate(property_ids(schema).items(), start=1):
+        value_type, field_type = FIELD_TYPES[schema[name] or "STRING"]
+        storage = {"key": f"f_{k}", "name": field_name, "header": [{"property": "count", "valueType": "UInt32"}],
+                   "ordering": ["attributeValues"], "attributeValues": {"valueType": value_type, "valuesPerElement": 1}}
+        if value_type == "String":
+            storage["header"].append({"property": "attributeValuesByteCount", "valueType": "UInt32"})
+            storage["ordering"] = ["attributeByteCounts", "attributeValues"]
+            storage["attributeByteCounts"] = {"valueType": "UInt32", "valuesPerElement": 1}
+            storage["attributeValues"]["encoding"] = "UTF-8"
+        fields.append((name, {"name": field_name, "type": field_type, "alias": str(name)}, storage))
+    return fields
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+def attribute_buffer(values, value_type):
+    """
+    I3S attribute buffer of one field: the count, then the values (for strings: the
+    total byte count, the byte count of every value and the NUL terminated values).
+    Missing numbers are written as NaN (Float64) or 0 (Int16).
+    """
+    count = struct.pack("<I", len(values))
+    if value_type == "Oid32":
+        return count + np.asarray(values, dtype=np.uint32).tobytes()
+    if value_type == "Int16":
+        return count + np.array([0 if _is_missing(v) else int(bool(v)) for v in values], dtype=np.int16).tobytes()
+    if value_type == "Float64":
+        # Float64 values start on an 8-byte boundary
+        array = np.array([math.nan if _is_missing(v) else float(v) for v in values], dtype=np.float64)
+        return count + b"\0" * 4 + array.tobytes()
+    encoded = [(b"" if _is_missing(v) else str(v).encode("utf-8")) + b"\0" for v in values]
+    byte_counts = np.array([len(v) for v in encoded], dtype=np.uint32)
+    return count + struct.pack("<I", int(byte_counts.sum())) + byte_counts.tobytes() + b"".join(encoded)
+
+def create_i3s_from_mesh(vertices, indices, output_path, quantize=False, meshopt=False, features=None,
+                         opener=open, center=None):
+    """
+    Write the I3S geometry and attribute resources of one tile mesh.
+    output_path: <folder>/<tile name>.i3s; the resources are written below <folder>/nodes
+    features: per-vertex feature ids, attribute rows, schema and the global 'ids' of the
+              rows (see build_gltf_document); required, I3S picks and styles by feature
+    opener: called as opener(path, "wb") to open the output files
+    center: the center of the mesh's bounding box when the vertices are relative to it
+            already (as write_tile passes them); computed from the vertices otherwise
+    """
+    if quantize or meshopt:
+        raise ValueError("--quantize and --meshopt apply to glTF content, not to I3S")
+    if features is None or "ids" not in features:
+        raise ValueError("I3S tiles need feature ids and attributes (feature metadata)")
+
+    # Resource names are SLPK entry names, "/"-separated on every platform
+    folder, filename = posixpath.split(output_path)
+    node_folder = posixpath.join(folder, "nodes", str(resource_id(posixpath.splitext(filename)[0])))
+    vertices = np.asarray(vertices)
+    # Positions are relative to the node's OBB center, the center of the mesh bounding box
+    if center is None:
+        offset = (vertices.min(axis=0).astype(np.float64) + vertices.max(axis=0).astype(np.float64)) / 2
+    else:
+        offset = np.zeros(3)
+
+    # Group the triangles by feature; each feature then covers one range of faces
+    triangle_feature = np.asarray(features["vertex_feature"])[np.asarray(indices)[:, 0]]
+    order = np.argsort(triangle_feature, kind="stable")
+    features_used, first = np.unique(triangle_feature[order], return_index=True)
+    last = np.append(first[1:], len(order)) - 1
+    ids = np.asarray(features["ids"])[features_used]
+
+    with opener(posixpath.join(node_folder, "geometries", "0.bin.gz"), "wb") as f:
+        f.write(_gzip(geometry_buffer(vertices, np.asarray(indices)[order], (ids, np.column_stack((first, last))),
+                                      offset)))
+
+    rows = [features["rows"][i] for i in features_used]
+    for name, _, storage in layer_fields(features["schema"]):
+        values = ids if name is None else [row.get(name) for row in rows]
+        with opener(posixpath.join(node_folder, "attributes", storage["key"], "0.bin.gz"), "wb") as f:
+            f.write(_gzip(attribute_buffer(values, storage["attributeValues"]["valueType"])))
+
+def _node(tile, index, parent_index):
+    """
+    Node page entry of a tile (children filled in by node_pages).
+    The OBB is axis aligned and centered on the tile's mesh, when it has one, so the
+    mesh positions are relative to the OBB center; it is grown to enclose the children.
+    """
+    low, high = np.asarray(tile["min"], dtype=np.float64), np.asarray(tile["max"], dtype=np.float64)
+    node = {"index": index}
+    if parent_index is not None:
+        node["parentIndex"] = parent_index
+    if "gltf" in tile:
+        mesh = tile.get("mesh", tile)
+        center = (np.asarray(mesh["min"], dtype=np.float64) + np.asarray(mesh["max"], dtype=np.float64)) / 2
+        resource = resource_id(posixpath.splitext(mesh["gltf"])[0])
+        node["mesh"] = {
+            "material": {"definition": 0},
+            "geometry": {"definition": 0, "resource": resource, "vertexCount": 3 * mesh["triangle_count"],
+                         "featureCount": mesh["feature_count"]},
+            "attribute": {"resource": resource},
+        }
+    else:
+        center = (low + high) / 2
+    half_size = np.maximum(high - center, center - low)
+    node["obb"] = {"center": center.tolist(), "halfSize": half_size.tolist(), "quaternion": [0, 0, 0, 1]}
+
+    # Switch to the children once the node covers more screen area than at the allowed error
+    if tile.get("children") and tile["geometricError"] > 0:
+        diameter = 2 * float(np.linalg.norm(half_size))
+        node["lodThreshold"] = math.pi / 4 * (SCREEN_SPACE_ERROR * diameter / tile["geometricError"]) ** 2
+    elif tile.get("children"):
+        node["lodThreshold"] = 0
+    return node
+
+def node_pages(root, nodes_per_page=NODES_PER_PAGE):
+    """
+    Page the tile tree into I3S nodes in breadth-first order (the root is node 0).
+    Returns the list of node pages, each {"nodes": [...]}.
+    """
+    nodes, pending, head = [], [(root, None)], 0
+    while head < len(pending):
+        tile, parent_index = pending[head]
+        node = _node(tile, head, parent_index)
+        children = tile.get("children", [])
+        if children:
+            node["children"] = list(range(len(pending), len(pending) + len(children)))
+            pending.extend((child, head) for child in children)
+        nodes.append(node)
+        head += 1
+    return [{"nodes": nodes[start:start + nodes_per_page]} for start in range(0, len(nodes), nodes_per_page)]
+
+def scene_layer(root, schema, name, wkid, nodes_per_page=NODES_PER_PAGE):
+    """
+    3dSceneLayer.json document of a 3D Object layer over the tile tree.
+    """
+    crs = f"http://www.opengis.net/def/crs/EPSG/0/{wkid}"
+    layer_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"i3s:{name}"))
+    fields = layer_fields(schema)
+    return {
+        "id": 0,
+        "version": layer_id,
+        "name": name,
+        "layerType": "3DObject",
+        "spatialReference": {"wkid": wkid, "latestWkid": wkid},
+        "heightModelInfo": {"heightModel": "orthometric", "heightUnit": "meter"},
+        "store": {
+            "id": layer_id,
+            "profile": "meshes",
+            "version": I3S_VERSION,
+            "resourcePattern": ["3dNodeIndexDocument", "Attributes", "SharedResource", "Geometry"],
+            "rootNode": "./nodes/root",
+            "extent": [root["min"][0], root["min"][1], root["max"][0], root["max"][1]],
+            "indexCRS": crs,
+            "vertexCRS": crs,
+            "normalReferenceFrame": "vertex-reference-frame",
+            "lodType": "MeshPyramid",
+            "lodModel": "node-switching",
+        },
+        "nodePages": {"nodesPerPage": nodes_per_page, "lodSelectionMetricType": "maxScreenThresholdSQ"},
+        "materialDefinitions": [{
+            "doubleSided": True,
+            "pbrMetallicRoughness": {"baseColorFactor": [1, 1, 1, 1], "metallicFactor": 0, "roughnessFactor": 1},
+        }],
+        "geometryDefinitions": [GEOMETRY_DEFINITION],
+        "fields": [field for _, field, _ in fields],
+        "attributeStorageInfo": [storage for _, _, storage in fields],
+    }
+
+def write_i3s_layer(output, root, schema, name, wkid, nodes_per_page=NODES_PER_PAGE):
+    """
+    Write 3dSceneLayer.json.gz, the node pages and metadata.json of the layer to an archive
+    (anything with open(name, mode)), once the tile meshes are written.
+    root: root tile dict returned by build_tiles; schema: its feature schema
+    """
+    pages = node_pages(root, nodes_per_page)
+    with output.open("3dSceneLayer.json.gz", "wb") as f:
+        f.write(_gzip(json_backend.dumps(scene_layer(root, schema, name, wkid, nodes_per_page))))
+    for i, page in enumerate(pages):
+        with output.open(f"nodepages/{i}.json.gz", "wb") as f:
+            f.write(_gzip(json_backend.dumps(page)))
+    metadata = {"folderPattern": "basic", "archiveCompressionType": "STORE", "resourceCompressionType": "GZIP",
+                "I3SVersion": I3S_VERSION, "nodeCount": sum(len(page["nodes"]) for page in pages)}
+    with output.open("metadata.json", "wb") as f:
+        f.write(json_backend.dumps(metadata))
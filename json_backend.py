@@ -0,0 +1,134 @@
+"""
+Pluggable JSON backend for large CityJSON files and tilesets.
+
+This module:
+- Parses and serializes with orjson when it is installed, else parses with pysimdjson,
+  else uses the standard library json. The backend is picked once at import; set the
+  JSON_BACKEND environment variable (orjson, simdjson or json) or call set_backend to
+  choose one.
+- Parses files from a memory map (load), so a multi-GB CityJSON is not read into a bytes
+  copy first when the backend can parse a buffer (orjson).
+- Pauses the cyclic garbage collector while parsing: the millions of dicts and lists a
+  large CityJSON parses into would otherwise set off repeated full collections, which take
+  longer than the parsing itself.
+- Writes compact JSON (no indentation, no spaces after separators) as UTF-8 bytes unless an
+  indent is asked for; numpy scalars and arrays are written as numbers and lists.
+
+Every backend returns plain dicts, lists, str, int and float, like json.loads.
+
+Dependencies:
+- orjson (optional, fastest loads and dumps)
+- pysimdjson (optional, fast loads)
+
+Install dependencies with:
+pip install orjson
+"""
+
+import gc
+import os
+import json
+import mmap
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+def _default(obj):
+    """
+    Serialize numpy values, which neither backend handles by itself in every case.
+    """
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _json_dumps(obj, indent=None, default=None):
+    separators = (",", ":") if indent is None else (",", ": ")
+    return json.dumps(obj, indent=indent, separators=separators, ensure_ascii=False,
+                      default=default or _default).encode("utf-8")
+
+def _orjson_dumps(obj, indent=None, default=None):
+    # orjson only indents by 2 spaces
+    if indent not in (None, 2):
+        return _json_dumps(obj, indent, default)
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, default=default or _default, option=option)
+
+# Backend name -> (loads, dumps, True if loads parses a memoryview of the file directly)
+BACKENDS = {"json": (json.loads, _json_dumps, False)}
+if simdjson is not None:
+    BACKENDS["simdjson"] = (simdjson.loads, _json_dumps, False)
+if orjson is not None:
+    BACKENDS["orjson"] = (orjson.loads, _orjson_dumps, True)
+
+backend = None
+_loads = _dumps = _parses_buffers = None
+
+def set_backend(name):
+    """
+    Use the backend `name` (one of BACKENDS) from now on.
+    """
+    global backend, _loads, _dumps, _parses_buffers
+    if name not in BACKENDS:
+        raise ValueError(f"JSON backend {name} is not available (available: {', '.join(BACKENDS)})")
+    backend = name
+    _loads, _dumps, _parses_buffers = BACKENDS[name]
+
+@contextmanager
+def _gc_paused():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def loads(data):
+    """
+    Parse JSON from str or bytes.
+    """
+    with _gc_paused():
+        return _loads(data)
+
+def load(path):
+    """
+    Parse the JSON file at path, from a memory map of the file.
+    """
+    with open(path, "rb") as f, _gc_paused():
+        if os.fstat(f.fileno()).st_size == 0:
+            return _loads(b"")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if _parses_buffers:
+                with memoryview(mapped) as view:
+                    return _loads(view)
+            return _loads(mapped[:])
+
+def dumps(obj, indent=None, default=None):
+    """
+    Serialize obj to UTF-8 JSON bytes, compact unless indent is given.
+    default: called for objects the backend cannot serialize, as in json.dumps
+    """
+    return _dumps(obj, indent, default)
+
+def dump(obj, path, indent=None, default=None):
+    """
+    Write obj as JSON to path (see dumps).
+    """
+    with open(path, "wb") as f:
+        f.write(_dumps(obj, indent, default))
+
+set_backend(os.environ.get("JSON_BACKEND") or next(name for name in ("orjson", "simdjson", "json")
+                                                        if name in BACKENDS))
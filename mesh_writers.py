@@ -0,0 +1,200 @@
+"""
+Streaming mesh writers for merged city models (OBJ, PLY and GLB).
+
+This module:
+- Writes a triangle mesh block by block: every write(vertices, faces) appends the block's
+  vertices and its faces, shifted by the number of vertices written before (a running index
+  offset), so no mesh of the whole model is ever built.
+- Formats every block in chunks of CHUNK_ROWS rows and writes them through a buffered file,
+  so memory stays flat however many buildings the model has.
+- PLY and GLB need their counts (and GLB its bounds) before the data: the PLY faces and the
+  GLB binary buffer go to a temporary file next to the output, which is appended once the
+  header is known.
+
+OBJ and PLY vertices are written as they come (OBJ with DIGITS decimals, PLY as float64);
+GLB positions are float32 relative to the center of the first block, which is the node
+translation.
+
+Dependencies:
+- numpy
+- pygltflib (GLB only)
+"""
+
+import os
+import abc
+import shutil
+import struct
+import tempfile
+import numpy as np
+
+# Rows (vertices or faces) formatted or converted at a time
+CHUNK_ROWS = 65536
+# Decimals of OBJ vertex coordinates
+DIGITS = 6
+# Size of the PLY header, which is written before the counts are known and padded to it
+PLY_HEADER_SIZE = 256
+# Buffered file size
+BUFFER_SIZE = 1 << 20
+
+def _chunks(rows):
+    for start in range(0, len(rows), CHUNK_ROWS):
+        yield rows[start:start + CHUNK_ROWS]
+
+class MeshWriter(abc.ABC):
+    """
+    Base class of the streaming writers; use as a context manager, or call close().
+    vertex_count and face_count are the totals written so far.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.vertex_count = 0
+        self.face_count = 0
+        self._file = open(path, "wb", buffering=BUFFER_SIZE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, vertices, faces):
+        """
+        Append a block: Nx3 vertices and Mx3 triangles indexing them from 0.
+        """
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        faces = np.asarray(faces).reshape(-1, 3)
+        self._write_block(vertices, faces, self.vertex_count)
+        self.vertex_count += len(vertices)
+        self.face_count += len(faces)
+
+    @abc.abstractmethod
+    def _write_block(self, vertices, faces, offset):
+        """
+        Write one block: float64 Nx3 vertices and Mx3 faces indexing them from 0, offset
+        being the number of vertices written before the block.
+        """
+
+    def close(self):
+        self._file.close()
+
+class ObjWriter(MeshWriter):
+    """
+    Wavefront OBJ: the "v" lines and then the "f" lines of every block.
+    """
+    def _write_block(self, vertices, faces, offset):
+        for chunk in _chunks(vertices):
+            self._file.write(((f"v %.{DIGITS}f %.{DIGITS}f %.{DIGITS}f\n" * len(chunk))
+                              % tuple(chunk.ravel().tolist())).encode("ascii"))
+        for chunk in _chunks(faces):
+            # OBJ indices start at 1
+            self._file.write((("f %d %d %d\n" * len(chunk))
+                              % tuple((chunk.astype(np.int64) + offset + 1).ravel().tolist())).encode("ascii"))
+
+class PlyWriter(MeshWriter):
+    """
+    Binary little-endian PLY with float64 vertices and uint32 triangle indices.
+    """
+    FACE_DTYPE = np.dtype([("count", "u1"), ("indices", "<u4", 3)])
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._file.write(b" " * PLY_HEADER_SIZE)
+        self._faces = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+
+    def _write_block(self, vertices, faces, offset):
+        for chunk in _chunks(vertices):
+            self._file.write(chunk.astype("<f8").tobytes())
+        for chunk in _chunks(faces):
+            records = np.empty(len(chunk), dtype=self.FACE_DTYPE)
+            records["count"] = 3
+            records["indices"] = chunk.astype(np.int64) + offset
+            self._faces.write(records.tobytes())
+
+    def close(self):
+        self._faces.seek(0)
+        shutil.copyfileobj(self._faces, self._file, BUFFER_SIZE)
+        self._faces.close()
+        header = (f"ply\nformat binary_little_endian 1.0\n"
+                  f"element vertex {self.vertex_count}\n"
+                  "property double x\nproperty double y\nproperty double z\n"
+                  f"element face {self.face_count}\n"
+                  "property list uchar uint vertex_indices\n").encode("ascii")
+        # Pad to the reserved size with a comment line
+        padding = PLY_HEADER_SIZE - len(header) - len(b"comment \nend_header\n")
+        self._file.seek(0)
+        self._file.write(header + b"comment " + b" " * padding + b"\nend_header\n")
+        super().close()
+
+class GlbWriter(MeshWriter):
+    """
+    Binary glTF with one mesh of float32 positions (relative to the node translation) and
+    uint32 indices.
+    """
+    def __init__(self, path):
+        super().__init__(path)
+        folder = os.path.dirname(os.path.abspath(path))
+        self._positions = tempfile.TemporaryFile(dir=folder)
+        self._indices = tempfile.TemporaryFile(dir=folder)
+        self._center = None
+        self._min = np.full(3, np.inf)
+        self._max = np.full(3, -np.inf)
+
+    def _write_block(self, vertices, faces, offset):
+        if self._center is None and len(vertices):
+            self._center = (vertices.min(axis=0) + vertices.max(axis=0)) / 2
+        for chunk in _chunks(vertices):
+            positions = (chunk - self._center).astype(np.float32)
+            self._min = np.minimum(self._min, positions.min(axis=0))
+            self._max = np.maximum(self._max, positions.max(axis=0))
+            self._positions.write(positions.tobytes())
+        for chunk in _chunks(faces):
+            self._indices.write((chunk.astype(np.int64) + offset).astype(np.uint32).tobytes())
+
+    def close(self):
+        from pygltflib import GLTF2, Scene, Node, Mesh, Buffer, BufferView, Accessor, Asset, Primitive
+
+        positions_length = self.vertex_count * 12
+        indices_length = self.face_count * 12
+        gltf = GLTF2(
+            asset=Asset(version="2.0"),
+            scene=0,
+            scenes=[Scene(nodes=[0])],
+            nodes=[Node(mesh=0, translation=None if self._center is None else self._center.tolist())],
+            meshes=[Mesh(primitives=[Primitive(attributes={"POSITION": 0}, indices=1)])],
+            buffers=[Buffer(byteLength=positions_length + indices_length)],
+            bufferViews=[
+                BufferView(buffer=0, byteOffset=0, byteLength=positions_length, target=34962),
+                BufferView(buffer=0, byteOffset=positions_length, byteLength=indices_length, target=34963),
+            ],
+            accessors=[
+                Accessor(bufferView=0, componentType=5126, count=self.vertex_count, type="VEC3",
+                         min=self._min.tolist() if self.vertex_count else None,
+                         max=self._max.tolist() if self.vertex_count else None),
+                Accessor(bufferView=1, componentType=5125, count=self.face_count * 3, type="SCALAR"),
+            ],
+        )
+        json_chunk = gltf.gltf_to_json(separators=(",", ":"), indent=None).encode("utf-8")
+        json_chunk += b" " * (-len(json_chunk) % 4)
+        # Positions and indices are 4-byte sized, so the BIN chunk needs no padding
+        bin_length = positions_length + indices_length
+        self._file.write(struct.pack("<4sII", b"glTF", 2, 12 + 8 + len(json_chunk) + 8 + bin_length))
+        self._file.write(struct.pack("<I4s", len(json_chunk), b"JSON"))
+        self._file.write(json_chunk)
+        self._file.write(struct.pack("<I4s", bin_length, b"BIN\0"))
+        for spill in (self._positions, self._indices):
+            spill.seek(0)
+            shutil.copyfileobj(spill, self._file, BUFFER_SIZE)
+            spill.close()
+        super().close()
+
+# File extension -> writer class
+MESH_WRITERS = {".obj": ObjWriter, ".ply": PlyWriter, ".glb": GlbWriter}
+
+def open_mesh_writer(path):
+    """
+    The streaming writer for path, chosen by its extension (.obj, .ply or .glb).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in MESH_WRITERS:
+        raise ValueError(f"Unsupported mesh format {extension} (supported: {', '.join(MESH_WRITERS)})")
+    return MESH_WRITERS[extension](path)
@@ -0,0 +1,260 @@
+"""
+Offline on-disk cache of OSM building downloads, and reading of local OSM extracts.
+
+This module:
+- Downloads the features of a place with osmnx (ox.features_from_place) once, and stores
+  them as GeoParquet in a cache folder, keyed by the place, the tags and the download time
+  (UTC): <place>_<hash of place and tags>_<YYYYMMDDTHHMMSSZ>.parquet
+- Serves later runs from the newest download younger than the TTL, so repeat runs start in
+  seconds instead of querying Overpass again. A pinned snapshot (--snapshot 2024-01-01) is
+  downloaded as of that date (Overpass [date:...]), cached as <...>_<YYYYMMDD>.parquet and
+  never expires.
+- Reads a local .osm.pbf (or .osm) extract instead of Overpass with the GDAL OSM driver
+  (pyogrio): the areas of the multipolygons layer that match the tags, with every tag as a
+  column and the (element, id) index of osmnx, so the pipeline runs fully offline. An
+  extract is cached too, keyed by its path, modification time and size, so a replaced
+  extract is read again.
+- In offline mode, never downloads: the newest cached snapshot is used whatever its age,
+  and a missing one is an error.
+
+Object columns are stored as strings (lists such as the node ids of osmnx become their
+text), so every tag column round-trips through Parquet whatever mix of types it holds.
+
+Dependencies:
+- geopandas
+- shapely >= 2.0
+- pyarrow (GeoParquet)
+- osmnx (downloads only)
+- pyogrio with GDAL built with the OSM driver (.osm.pbf extracts only)
+
+Install dependencies with:
+pip install geopandas pyarrow osmnx pyogrio
+
+Usage (see add_osm_arguments):
+python extract_singapore_obj.py --cache-ttl 30
+python extract_singapore_obj.py --pbf malaysia-singapore-brunei-latest.osm.pbf
+python extract_3dtiles_from_osm.py Singapore --offline
+"""
+
+import os
+import re
+import glob
+import json
+import hashlib
+from datetime import date, datetime, timezone
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Cache folder, unless given (or set with the OSM_CACHE_DIR environment variable)
+CACHE_DIR = os.environ.get("OSM_CACHE_DIR", "osm_cache")
+# Days (fractions allowed) a download is served from the cache before it is downloaded again
+CACHE_TTL_DAYS = 7.0
+# Cache file stamps: the date of a pinned snapshot, the UTC time of a download of the latest data
+SNAPSHOT_FORMAT = "%Y%m%d"
+DOWNLOAD_FORMAT = "%Y%m%dT%H%M%SZ"
+# Layer of the GDAL OSM driver with the closed ways and multipolygon relations
+PBF_LAYER = "multipolygons"
+# One "key"=>"value" pair of the other_tags column of the GDAL OSM driver (hstore syntax)
+HSTORE_PATTERN = r'"((?:[^"\\]|\\.)*)"=>"((?:[^"\\]|\\.)*)"'
+# Columns of the GDAL OSM driver that are not OSM tags
+PBF_COLUMNS = ["osm_id", "osm_way_id", "other_tags"]
+
+def cache_key(place, tags):
+    """
+    File name prefix of the snapshots of place and tags: a readable slug of the place and a
+    hash of the place and the tags.
+    """
+    digest = hashlib.sha1(json.dumps([place, tags], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    slug = re.sub(r"[^0-9a-zA-Z]+", "-", str(place)).strip("-").lower()[:40] or "place"
+    return f"{slug}_{digest[:12]}"
+
+def cached_snapshots(place, tags, cache_dir=CACHE_DIR):
+    """
+    Cached snapshots of place and tags, oldest first, as a list of (time, pinned, path):
+    the date of a pinned snapshot (as a datetime), or the UTC download time of the latest
+    data.
+    """
+    prefix = cache_key(place, tags)
+    snapshots = []
+    for path in glob.glob(os.path.join(glob.escape(cache_dir), f"{prefix}_*.parquet")):
+        stamp = os.path.basename(path)[len(prefix) + 1:-len(".parquet")]
+        for pinned, stamp_format in ((True, SNAPSHOT_FORMAT), (False, DOWNLOAD_FORMAT)):
+            try:
+                snapshots.append((datetime.strptime(stamp, stamp_format), pinned, path))
+                break
+            except ValueError:
+                continue
+    return sorted(snapshots)
+
+def _snapshot_path(place, tags, time, pinned, cache_dir):
+    stamp = time.strftime(SNAPSHOT_FORMAT if pinned else DOWNLOAD_FORMAT)
+    return os.path.join(cache_dir, f"{cache_key(place, tags)}_{stamp}.parquet")
+
+def _utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _parquet_safe(gdf):
+    """
+    Copy of gdf whose object columns (other than the geometry) hold only strings and missing
+    values.
+    """
+    gdf = gdf.copy()
+    for column in gdf.columns:
+        if column == gdf.geometry.name or gdf[column].dtype != object:
+            continue
+        values = gdf[column]
+        gdf[column] = values.where(values.isna() | values.map(lambda value: isinstance(value, str)),
+                                   values.astype(str)).where(values.notna(), None)
+    return gdf
+
+def write_snapshot(gdf, path):
+    """
+    Store gdf as GeoParquet at path; the file is written next to it and renamed, so an
+    interrupted run never leaves a truncated snapshot behind.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    partial = path + ".partial"
+    _parquet_safe(gdf).to_parquet(partial)
+    os.replace(partial, path)
+
+def _download(place, tags, snapshot=None):
+    import osmnx as ox
+
+    if snapshot is None:
+        return ox.features_from_place(place, tags)
+    # Overpass serves the map as of a date with the [date:...] setting
+    settings = ox.settings.overpass_settings
+    ox.settings.overpass_settings = settings + f'[date:"{snapshot:%Y-%m-%d}T00:00:00Z"]'
+    try:
+        return ox.features_from_place(place, tags)
+    finally:
+        ox.settings.overpass_settings = settings
+
+def _tag_values(tags):
+    return {key: value if isinstance(value, (bool, list)) else [value] for key, value in tags.items()}
+
+def _unescape(values):
+    return values.str.replace(r'\\(.)', r'\1', regex=True)
+
+def read_osm_extract(path, tags):
+    """
+    Areas of the OSM extract at path (.osm.pbf or .osm) matching tags, in the format of
+    ox.features_from_place: EPSG:4326 geometries, a column per OSM tag and the index
+    (element, id) with element "way" or "relation".
+    tags: as for osmnx, e.g. {"building": True} or {"building": ["yes", "house"]}
+    """
+    gdf = gpd.read_file(path, layer=PBF_LAYER, engine="pyogrio")
+
+    # Tags without a column of their own are in other_tags, as "key"=>"value" pairs
+    pairs = gdf["other_tags"].dropna().str.extractall(HSTORE_PATTERN)
+    if len(pairs):
+        pairs = pairs.droplevel("match").set_axis(["key", "value"], axis=1)
+        pairs["key"] = _unescape(pairs["key"])
+        pairs["value"] = _unescape(pairs["value"])
+        pairs = pairs[~pairs["key"].isin(gdf.columns)]
+        pairs = pairs[~pairs.set_index("key", append=True).index.duplicated()]
+        other = pairs.pivot(columns="key", values="value").reindex(gdf.index)
+        gdf = pd.concat([gdf, other], axis=1)
+
+    keep = np.zeros(len(gdf), dtype=bool)
+    for key, values in _tag_values(tags).items():
+        if key not in gdf.columns:
+            continue
+        keep |= gdf[key].notna().to_numpy() if values is True else gdf[key].isin(values).to_numpy()
+    gdf = gdf[keep]
+
+    # osm_id is set for relations, osm_way_id for the areas of closed ways
+    relation = gdf["osm_id"].notna().to_numpy()
+    index = pd.MultiIndex.from_arrays(
+        [np.where(relation, "relation", "way"),
+         np.where(relation, gdf["osm_id"], gdf["osm_way_id"]).astype(np.int64)],
+        names=["element", "id"])
+    gdf = gdf.drop(columns=PBF_COLUMNS).set_axis(index)
+    # Like osmnx: only the tags some feature has, and single-part areas as Polygons
+    gdf = gdf.drop(columns=[column for column in gdf.columns
+                            if column != "geometry" and gdf[column].isna().all()])
+    geometry = gdf.geometry.to_numpy()
+    single = shapely.get_num_geometries(geometry) == 1
+    geometry[single] = shapely.get_geometry(geometry[single], 0)
+    return gpd.GeoDataFrame(gdf.drop(columns="geometry"), geometry=geometry, crs="EPSG:4326")
+
+def load_buildings(place, tags=None, cache_dir=CACHE_DIR, ttl_days=CACHE_TTL_DAYS, snapshot=None,
+                   pbf_path=None, offline=False, refresh=False):
+    """
+    OSM features of place matching tags (default {"building": True}), like
+    ox.features_from_place, from the cache when possible (see the module docstring).
+    cache_dir: cache folder, or None to neither read nor write the cache
+    ttl_days: age in days (fractions allowed) past which a download is downloaded again;
+              0 always downloads
+    snapshot: date (or "YYYY-MM-DD") to pin the data to; the latest data when None
+    pbf_path: local .osm.pbf extract read instead of downloading; place is then only a label
+    offline: never download; use the newest cached snapshot of any age
+    refresh: ignore the cached snapshots, download (or read the extract) and cache again
+    Returns (GeoDataFrame, source), source being the cache file, the extract or "overpass".
+    """
+    tags = {"building": True} if tags is None else tags
+    if isinstance(snapshot, str):
+        snapshot = date.fromisoformat(snapshot)
+
+    if pbf_path is not None:
+        # An extract is keyed by its path, modification time and size, and its
+        # modification date is the snapshot date
+        stat = os.stat(pbf_path)
+        place = f"{os.path.abspath(pbf_path)}@{stat.st_mtime_ns}:{stat.st_size}"
+        snapshot = date.fromtimestamp(stat.st_mtime)
+    now = _utc_now()
+
+    if cache_dir is not None and not refresh:
+        snapshots = cached_snapshots(place, tags, cache_dir)
+        if snapshot is not None:
+            path = _snapshot_path(place, tags, snapshot, True, cache_dir)
+            fresh = [path] if os.path.exists(path) else []
+        elif offline:
+            fresh = [path for _, _, path in snapshots[-1:]]
+        else:
+            # Only downloads of the latest data count, so a pinned past snapshot is
+            # not mistaken for it
+            downloads = [(time, path) for time, pinned, path in snapshots if not pinned]
+            fresh = [path for time, path in downloads[-1:] if (now - time).total_seconds() < ttl_days * 86400]
+        if fresh:
+            return gpd.read_parquet(fresh[0]), fresh[0]
+
+    if pbf_path is not None:
+        gdf, source = read_osm_extract(pbf_path, tags), pbf_path
+    elif offline:
+        raise FileNotFoundError(f"No cached OSM snapshot of {place} {tags} in {cache_dir} "
+                                f"and downloads are disabled (offline)")
+    else:
+        gdf, source = _download(place, tags, snapshot), "overpass"
+
+    if cache_dir is not None:
+        gdf = _parquet_safe(gdf)
+        write_snapshot(gdf, _snapshot_path(place, tags, snapshot or now, snapshot is not None, cache_dir))
+    return gdf, source
+
+def add_osm_arguments(parser):
+    """
+    Add the OSM source and cache options of load_buildings to an argparse parser.
+    """
+    parser.add_argument("--pbf", help="local .osm.pbf extract to read the buildings from instead of Overpass")
+    parser.add_argument("--cache-dir", default=CACHE_DIR,
+                        help=f"folder of the cached OSM snapshots (default: {CACHE_DIR})")
+    parser.add_argument("--no-cache", action="store_true", help="neither read nor write the OSM cache")
+    parser.add_argument("--cache-ttl", type=float, default=CACHE_TTL_DAYS,
+                        help=f"days (fractions allowed) a cached download is used before downloading again; "
+                             f"0 always downloads (default: {CACHE_TTL_DAYS:g})")
+    parser.add_argument("--snapshot", type=date.fromisoformat,
+                        help="use the OSM data as of this date (YYYY-MM-DD); cached for good once downloaded")
+    parser.add_argument("--offline", action="store_true",
+                        help="never download; use the newest cached snapshot or the --pbf extract")
+    parser.add_argument("--refresh", action="store_true", help="download again even when a cached snapshot is fresh")
+
+def osm_options(args):
+    """
+    Keyword arguments of load_buildings from the options added by add_osm_arguments.
+    """
+    return dict(cache_dir=None if args.no_cache else args.cache_dir, ttl_days=args.cache_ttl,
+                snapshot=args.snapshot, pbf_path=args.pbf, offline=args.offline, refresh=args.refresh)
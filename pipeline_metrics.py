@@ -0,0 +1,157 @@
+"""
+Stage-level metrics for the conversion and extraction scripts.
+
+This module:
+- Times named pipeline stages (with stage("parse") as counts: ...), recording wall time,
+  CPU time (including finished worker processes), the peak RSS reached by the end of the
+  stage and how much the stage raised it, and the item counts the stage fills in
+  (buildings, vertices, triangles, bytes written, ...).
+- Prints the stages as a table, and saves them as a JSON summary.
+- With --profile (see add_profile_argument and profile), also runs the whole pipeline under
+  pyinstrument when it is installed, or cProfile otherwise, and writes the trace and the
+  JSON summary to the output folder.
+
+Stages are recorded for the whole process and may be nested; stages of pool worker
+processes are not seen, but their CPU time is counted in the stage that waited for them.
+
+Dependencies:
+- resource (standard library; the peak RSS is null where it is missing, e.g. on Windows)
+- pyinstrument (optional, for an HTML trace instead of a cProfile .prof file)
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# JSON summary written next to the trace with --profile
+SUMMARY_FILENAME = "pipeline_metrics.json"
+# Trace written with --profile: pyinstrument HTML, or cProfile stats for pstats / snakeviz
+TRACE_FILENAME = "profile.html" if Profiler is not None else "profile.prof"
+
+_stages = []
+_depth = 0
+
+def peak_rss():
+    """
+    Peak resident set size in bytes of this process or of its largest finished child
+    process, or None where resource is missing.
+    """
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _cpu_time():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+@contextmanager
+def stage(name):
+    """
+    Record the stage `name` around the with block. The block gets a dict to fill with item
+    counts, e.g. counts["triangles"] = n.
+    """
+    global _depth
+    counts = {}
+    record = {"stage": name, "depth": _depth, "counts": counts}
+    _stages.append(record)
+    rss_before = peak_rss()
+    wall, cpu = time.perf_counter(), _cpu_time()
+    _depth += 1
+    try:
+        yield counts
+    finally:
+        _depth -= 1
+        record["wall_s"] = time.perf_counter() - wall
+        record["cpu_s"] = _cpu_time() - cpu
+        record["peak_rss_bytes"] = peak_rss()
+        record["rss_growth_bytes"] = None if rss_before is None else record["peak_rss_bytes"] - rss_before
+
+def stages():
+    """
+    The recorded stages in the order they started.
+    """
+    return list(_stages)
+
+def reset():
+    global _depth
+    _stages.clear()
+    _depth = 0
+
+def _format_count(value):
+    return f"{value:,}" if isinstance(value, int) else str(value)
+
+def report():
+    """
+    Print the recorded stages as a table.
+    """
+    print(f"{'stage':<28}{'wall (s)':>10}{'cpu (s)':>10}{'peak RSS MB':>13}  counts")
+    for record in _stages:
+        if "wall_s" not in record:
+            continue
+        rss = "-" if record["peak_rss_bytes"] is None else f"{record['peak_rss_bytes'] / 2**20:.0f}"
+        counts = ", ".join(f"{key} {_format_count(value)}" for key, value in record["counts"].items())
+        name = "  " * record["depth"] + record["stage"]
+        print(f"{name:<28}{record['wall_s']:>10.3f}{record['cpu_s']:>10.3f}{rss:>13}  {counts}")
+
+def summary():
+    """
+    Machine-readable summary of the run: the command line and the recorded stages.
+    """
+    return {"argv": sys.argv, "peak_rss_bytes": peak_rss(), "stages": stages()}
+
+def save_summary(path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary(), f, indent=2, default=str)
+
+def add_profile_argument(parser):
+    parser.add_argument("--profile", action="store_true",
+                        help=f"write a {'pyinstrument' if Profiler is not None else 'cProfile'} trace "
+                             f"({TRACE_FILENAME}) and the stage metrics ({SUMMARY_FILENAME}) to the output folder")
+
+@contextmanager
+def profile(output_folder, enabled=True):
+    """
+    Run the with block under the profiler when enabled, then write TRACE_FILENAME and
+    SUMMARY_FILENAME to output_folder (created if needed). Does nothing when not enabled.
+    """
+    if not enabled:
+        yield
+        return
+    if Profiler is None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = Profiler()
+        profiler.start()
+    try:
+        yield
+    finally:
+        if Profiler is None:
+            profiler.disable()
+        else:
+            profiler.stop()
+        os.makedirs(output_folder, exist_ok=True)
+        trace_path = os.path.join(output_folder, TRACE_FILENAME)
+        if Profiler is None:
+            profiler.dump_stats(trace_path)
+        else:
+            with open(trace_path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+        save_summary(os.path.join(output_folder, SUMMARY_FILENAME))
+        print(f"Profile written to {trace_path}")
@@ -0,0 +1,66 @@
+"""
+Vertex clustering simplification for the LOD content of parent tiles.
+
+This module:
+- Snaps the vertices of a tile mesh to a regular grid, merging every vertex in a grid cell
+  into their mean, and drops the triangles that collapse or become duplicates.
+- Measures the simplification error as the largest distance any vertex moved, which is at
+  most the diagonal of a grid cell.
+- Simplifies a quadtree leaf for all its ancestor levels at once, with grids that halve at
+  every level like the quadtree cells, so the pieces of all leaves below a node can be
+  concatenated into the node's simplified mesh.
+
+Dependencies:
+- numpy
+"""
+
+import numpy as np
+
+# Grid cells per quadtree cell edge used to simplify the content of a quadtree node
+GRID_CELLS = 64
+
+def cluster_vertices(vertices, indices, cell_size, origin, vertex_group=None):
+    """
+    Simplify a mesh by vertex clustering on a grid of cell_size, aligned to origin (x, y, z).
+    vertex_group: optional per-vertex group (e.g. the feature id); vertices of different
+                  groups are never merged, so every simplified vertex keeps one group
+    Returns (vertices, indices, vertex_group or None, error): the simplified mesh (float64
+    vertices), the group of its vertices and the largest distance a vertex moved.
+    """
+    coords = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    if not len(coords):
+        return coords, np.zeros((0, 3), dtype=np.int64), vertex_group, 0.0
+
+    keys = np.floor((coords - np.asarray(origin, dtype=np.float64)) / cell_size).astype(np.int64)
+    if vertex_group is not None:
+        keys = np.column_stack((keys, vertex_group))
+    _, first, cluster = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    cluster = cluster.reshape(-1)
+
+    # Every cluster is represented by the mean of its vertices, which stays inside its cell
+    counts = np.bincount(cluster)
+    means = np.column_stack([np.bincount(cluster, weights=coords[:, axis]) for axis in range(3)]) / counts[:, None]
+    error = float(np.sqrt(((coords - means[cluster]) ** 2).sum(axis=1)).max())
+
+    # Drop collapsed triangles, then triangles repeating the same three clusters
+    triangles = cluster[np.asarray(indices, dtype=np.int64).reshape(-1, 3)]
+    triangles = triangles[(triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2])
+                          & (triangles[:, 0] != triangles[:, 2])]
+    _, unique = np.unique(np.sort(triangles, axis=1), axis=0, return_index=True)
+    triangles = triangles[np.sort(unique)]
+
+    used, local = np.unique(triangles, return_inverse=True)
+    group = None if vertex_group is None else np.asarray(vertex_group)[first[used]]
+    return means[used], local.reshape(-1, 3), group, error
+
+def simplify_for_ancestors(vertices, indices, vertex_group, level, origin, root_size, grid_cells=GRID_CELLS):
+    """
+    Simplify the mesh of a quadtree leaf at `level` for each of its ancestor levels
+    0 .. level-1. The grid of level l has cells of root_size / 2**l / grid_cells, aligned to
+    the quadtree origin (x, y) and z = 0, so clustering the leaves one by one gives the same
+    clusters as clustering their union (as long as a group never spans two leaves).
+    Returns a list with one (vertices, indices, vertex_group, error) per ancestor level.
+    """
+    origin = (origin[0], origin[1], 0.0)
+    return [cluster_vertices(vertices, indices, root_size / 2 ** l / grid_cells, origin, vertex_group)
+            for l in range(level)]
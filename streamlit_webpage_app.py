@@ -6,7 +6,8 @@ def main():
 
     # Example: local server URL pointing to your HTML file
     # You need to run a local HTTP server in the folder containing your HTML file first:
-    # python -m http.server 8000
+    # python tile_server.py . --port 8000
+    # (python -m http.server 8000 works too, but without caching headers or .slpk packages)
     # Then update the url accordingly:
     url ="arcgis-multi-feature-layer-service-search-with-feature-search.html"  # Make sure this file is in the same directory as this script
     
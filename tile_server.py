@@ -0,0 +1,405 @@
+"""
+Python script to preview 3D Tiles folders and SLPK packages over HTTP.
+
+This script:
+- Serves a folder (tilesets, the HTML viewers) or a single .slpk file with an asyncio
+  server, so many tile requests are in flight at once over keep-alive connections.
+- Reads the central directory of an SLPK once and serves its entries by offset from a
+  memory map, without unzipping the package.
+- Answers the I3S REST paths of a scene service (SceneServer, SceneServer/layers/0,
+  .../nodepages/0, .../nodes/3/geometries/0, ...) from an SLPK, so the ArcGIS viewers can
+  load a local package like a hosted scene layer: point them at
+  http://localhost:8000/<package>.slpk/SceneServer/layers/0
+- Sends ETag and Cache-Control headers, answers If-None-Match with 304 Not Modified and
+  single byte ranges with 206 Partial Content.
+- Sends precompressed content as it is stored: gzipped I3S resources and tile.glb.gz /
+  tile.glb.br files next to a tile go out with Content-Encoding gzip or br when the client
+  accepts it, and are gunzipped for clients that do not.
+
+Dependencies:
+- asyncio, mmap, zipfile (standard library)
+
+Usage:
+python tile_server.py output_folder
+python tile_server.py output_slpk_folder/buildings.slpk --port 8080
+python tile_server.py . --max-age 3600
+"""
+
+import os
+import sys
+import gzip
+import json
+import mmap
+import zlib
+import struct
+import asyncio
+import zipfile
+import argparse
+import functools
+import mimetypes
+import email.utils
+from urllib.parse import unquote, urlsplit
+
+# Bytes sent per write when streaming a response body
+CHUNK_SIZE = 1 << 20
+# Inflated DEFLATED archive entries kept in memory per archive
+INFLATE_CACHE_SIZE = 256
+# Longest request line or header line accepted
+MAX_LINE = 16384
+
+CONTENT_TYPES = {
+    ".json": "application/json",
+    ".glb": "model/gltf-binary",
+    ".gltf": "model/gltf+json",
+    ".b3dm": "application/octet-stream",
+    ".subtree": "application/octet-stream",
+    ".bin": "application/octet-stream",
+    ".pbf": "application/x-protobuf",
+}
+# Precompressed variants looked up next to a requested file, in order of preference
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+STATUS = {
+    200: "OK", 206: "Partial Content", 304: "Not Modified", 400: "Bad Request",
+    404: "Not Found", 405: "Method Not Allowed", 416: "Range Not Satisfiable",
+}
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(STATUS[status])
+        self.status = status
+
+def content_type(name):
+    extension = os.path.splitext(name)[1].lower()
+    return CONTENT_TYPES.get(extension) or mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+def accepted_encodings(header):
+    """
+    Content codings of an Accept-Encoding header, leaving out the ones with q=0.
+    """
+    accepted = set()
+    for token in header.split(","):
+        coding, _, params = token.strip().partition(";")
+        params = params.replace(" ", "")
+        if coding and params not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.lower())
+    return accepted
+
+def parse_range(header, size):
+    """
+    (start, end) of a single-range "bytes=" header, end exclusive, or None to send the whole
+    body (no header, or several ranges). Raises HttpError(416) if it cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            start, end = max(size - int(last), 0), size
+        else:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+    except ValueError:
+        return None
+    if start >= end or start >= size:
+        raise HttpError(416)
+    return start, end
+
+class Resource:
+    """
+    A response body with the headers describing it. body is bytes or a memoryview; encoding
+    is the Content-Encoding the body is stored with (None for identity).
+    """
+    def __init__(self, body, name, etag, encoding=None, last_modified=None):
+        self.body = body
+        self.name = name
+        self.etag = etag
+        self.encoding = encoding
+        self.last_modified = last_modified
+
+class SlpkArchive:
+    """
+    Random access to the entries of an SLPK (zip) package. The central directory is read
+    once; STORED entries are served as slices of a memory map of the file, DEFLATED ones
+    are inflated on first use and cached.
+    """
+    def __init__(self, path):
+        self.path = path
+        stat = os.stat(path)
+        self.version = (stat.st_mtime_ns, stat.st_size)
+        with zipfile.ZipFile(path) as archive:
+            infos = archive.infolist()
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        self._view = memoryview(self._map)
+
+        self.entries = {}
+        # I3S REST resource paths ("nodes/3/geometries/0") -> entry names ("nodes/3/geometries/0.bin.gz")
+        self.resources = {}
+        for info in infos:
+            if info.is_dir():
+                continue
+            # The entry data follows the local file header and its own name and extra field
+            name_length, extra_length = struct.unpack_from("<HH", self._map, info.header_offset + 26)
+            offset = info.header_offset + 30 + name_length + extra_length
+            self.entries[info.filename] = (offset, info.compress_size, info.compress_type, info.CRC)
+            resource = info.filename[:-3] if info.filename.endswith(".gz") else info.filename
+            self.resources.setdefault(os.path.splitext(resource)[0], info.filename)
+        self._inflate = functools.lru_cache(maxsize=INFLATE_CACHE_SIZE)(self._inflate_entry)
+
+    def close(self):
+        self._view.release()
+        if self._map:
+            self._map.close()
+
+    def _inflate_entry(self, name):
+        offset, size, _, _ = self.entries[name]
+        return zlib.decompressobj(-zlib.MAX_WBITS).decompress(self._view[offset:offset + size])
+
+    def resolve(self, path):
+        """
+        Entry name for a request path inside the package: an entry name, an I3S resource path,
+        or a SceneServer/layers/0 path. Returns None for the scene service document itself.
+        """
+        if path in ("SceneServer", "SceneServer/"):
+            return None
+        if path == "SceneServer/layers/0" or path.startswith("SceneServer/layers/0/"):
+            path = path[len("SceneServer/layers/0"):].strip("/") or "3dSceneLayer"
+        if path in self.entries:
+            return path
+        if path in self.resources:
+            return self.resources[path]
+        raise HttpError(404)
+
+    async def read(self, path):
+        name = self.resolve(path)
+        if name is None:
+            return await self.scene_service()
+        offset, size, compress_type, crc = self.entries[name]
+        if compress_type == zipfile.ZIP_STORED:
+            body = self._view[offset:offset + size]
+        else:
+            body = await asyncio.to_thread(self._inflate, name)
+        etag = f'"{self.version[0]:x}-{crc:08x}"'
+        encoding = "gzip" if name.endswith(".gz") else None
+        last_modified = self.version[0] / 1e9
+        return Resource(body, name[:-3] if encoding else name, etag, encoding, last_modified)
+
+    async def scene_service(self):
+        """
+        Scene service document listing the package's layer, as SceneServer answers it.
+        """
+        layer = await self.read("3dSceneLayer")
+        body = layer.body if layer.encoding is None else gzip.decompress(layer.body)
+        document = json.dumps({
+            "serviceName": os.path.splitext(os.path.basename(self.path))[0],
+            "serviceVersion": "1.7",
+            "supportedBindings": ["REST"],
+            "layers": [json.loads(bytes(body))],
+        }).encode("utf-8")
+        return Resource(document, "SceneServer.json", layer.etag[:-1] + '-service"',
+                        last_modified=layer.last_modified)
+
+class TileServer:
+    """
+    Serves the files below root, and the entries of the .slpk packages among them (or of
+    root itself when it is a package). Packages are opened on first request and reopened
+    when the file changes.
+    """
+    def __init__(self, root, max_age=0):
+        self.root = os.path.realpath(root)
+        self.cache_control = f"public, max-age={max_age}" if max_age else "no-cache"
+        self._archives = {}
+
+    def archive(self, path):
+        stat = os.stat(path)
+        archive = self._archives.get(path)
+        if archive is None or archive.version != (stat.st_mtime_ns, stat.st_size):
+            # A replaced package is not closed: responses may still be sending slices of its map
+            archive = self._archives[path] = SlpkArchive(path)
+        return archive
+
+    def close(self):
+        for archive in self._archives.values():
+            archive.close()
+        self._archives.clear()
+
+    async def resolve(self, path, encodings):
+        """
+        Resource for a decoded request path ("/tiles/tile_0_0_0.glb").
+        """
+        parts = [part for part in path.split("/") if part]
+        if any(part in (".", "..") or "\\" in part or "\0" in part for part in parts):
+            raise HttpError(404)
+
+        if os.path.isfile(self.root):
+            return await self.archive(self.root).read("/".join(parts))
+        # The first .slpk file on the path serves the rest of the path from its entries
+        for i, part in enumerate(parts):
+            candidate = os.path.join(self.root, *parts[:i + 1])
+            if part.lower().endswith(".slpk") and os.path.isfile(candidate) and i + 1 < len(parts):
+                return await self.archive(candidate).read("/".join(parts[i + 1:]))
+
+        file_path = os.path.join(self.root, *parts)
+        if os.path.isdir(file_path):
+            file_path = os.path.join(file_path, "index.html")
+        return await asyncio.to_thread(self.read_file, file_path, encodings)
+
+    def read_file(self, file_path, encodings):
+        # A precompressed variant is preferred if the client accepts its coding; one that
+        # exists alone is sent as is, or gunzipped if the client does not accept gzip
+        for encoding, suffix in ENCODINGS:
+            if encoding in encodings and os.path.isfile(file_path + suffix):
+                return self._file_resource(file_path + suffix, file_path, encoding)
+        if os.path.isfile(file_path):
+            return self._file_resource(file_path, file_path, None)
+        if os.path.isfile(file_path + ".gz"):
+            resource = self._file_resource(file_path + ".gz", file_path, "gzip")
+            resource.body, resource.encoding = gzip.decompress(resource.body), None
+            resource.etag = resource.etag[:-1] + '-identity"'
+            return resource
+        raise HttpError(404)
+
+    @staticmethod
+    def _file_resource(path, name, encoding):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            body = f.read()
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        return Resource(body, name, etag, encoding, stat.st_mtime)
+
+    async def handle(self, reader, writer):
+        """
+        Serve the requests of one keep-alive connection in turn.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if len(line) > MAX_LINE:
+                        raise HttpError(400)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                # GET and HEAD have no body, but skip one a client sends anyway
+                if headers.get("content-length", "0").isdigit():
+                    await reader.readexactly(int(headers.get("content-length", "0")))
+
+                keep_alive = await self.respond(request_line, headers, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError, HttpError):
+            # Broken connections and malformed or oversized headers end the connection
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, request_line, headers, writer):
+        """
+        Write the response to one request. Returns whether the connection stays open.
+        """
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            self.write_status(writer, 400, {}, False)
+            return False
+        keep_alive = (headers.get("connection", "").lower() != "close"
+                      and (version == "HTTP/1.1" or headers.get("connection", "").lower() == "keep-alive"))
+
+        encodings = accepted_encodings(headers.get("accept-encoding", ""))
+        try:
+            if method not in ("GET", "HEAD"):
+                raise HttpError(405)
+            resource = await self.resolve(unquote(urlsplit(target).path), encodings)
+            if resource.encoding == "gzip" and "gzip" not in encodings:
+                resource.body = await asyncio.to_thread(gzip.decompress, resource.body)
+                resource.encoding, resource.etag = None, resource.etag[:-1] + '-identity"'
+        except HttpError as error:
+            self.write_status(writer, error.status, {}, keep_alive)
+            return keep_alive
+
+        response = {
+            "Content-Type": content_type(resource.name),
+            "ETag": resource.etag,
+            "Cache-Control": self.cache_control,
+            "Accept-Ranges": "bytes",
+            "Vary": "Accept-Encoding",
+        }
+        if resource.encoding:
+            response["Content-Encoding"] = resource.encoding
+        if resource.last_modified is not None:
+            response["Last-Modified"] = email.utils.formatdate(resource.last_modified, usegmt=True)
+        if resource.etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+            self.write_status(writer, 304, response, keep_alive)
+            return keep_alive
+
+        status, size = 200, len(resource.body)
+        byte_range = None
+        if headers.get("if-range", resource.etag) == resource.etag:
+            try:
+                byte_range = parse_range(headers.get("range"), size)
+            except HttpError:
+                response["Content-Range"] = f"bytes */{size}"
+                self.write_status(writer, 416, response, keep_alive)
+                return keep_alive
+        start, end = byte_range or (0, size)
+        if byte_range:
+            status = 206
+            response["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+
+        response["Content-Length"] = str(end - start)
+        self.write_head(writer, status, response, keep_alive)
+        if method == "GET":
+            body = memoryview(resource.body)
+            for offset in range(start, end, CHUNK_SIZE):
+                writer.write(body[offset:min(offset + CHUNK_SIZE, end)])
+                await writer.drain()
+        return keep_alive
+
+    @staticmethod
+    def write_head(writer, status, headers, keep_alive):
+        headers = dict(headers, **{
+            "Date": email.utils.formatdate(usegmt=True),
+            "Access-Control-Allow-Origin": "*",
+            "Connection": "keep-alive" if keep_alive else "close",
+        })
+        lines = [f"HTTP/1.1 {status} {STATUS[status]}"] + [f"{key}: {value}" for key, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    def write_status(self, writer, status, headers, keep_alive):
+        self.write_head(writer, status, dict(headers, **{"Content-Length": "0"}), keep_alive)
+
+async def serve(root, host, port, max_age=0):
+    server = TileServer(root, max_age)
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f"Serving {server.root} at http://{host}:{port}/")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve 3D Tiles folders and SLPK packages over HTTP.")
+    parser.add_argument("root", nargs="?", default=".", help="folder or .slpk file to serve (default: .)")
+    parser.add_argument("--host", default="localhost", help="address to listen on (default: localhost)")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on (default: 8000)")
+    parser.add_argument("--max-age", type=int, default=0,
+                        help="Cache-Control max-age in seconds (default: 0, clients revalidate with the ETag)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.root):
+        parser.error(f"{args.root} does not exist")
+    try:
+        asyncio.run(serve(args.root, args.host, args.port, args.max_age))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+Batched polygon triangulation for CityJSON surfaces.
+
+This module:
+- Projects every surface onto the plane of its exterior ring (Newell normal).
+- Triangulates all convex surfaces without holes at once with numpy fans.
+- Triangulates concave surfaces and surfaces with holes (interior rings) by ear clipping,
+  using the compiled mapbox_earcut package when it is installed; without it, all of them
+  are triangulated in one batch by GEOS constrained Delaunay triangulation when shapely
+  >= 2.1 is installed, and only the surfaces GEOS cannot triangulate are ear clipped in Python.
+- Keeps the winding of every triangle consistent with the exterior ring.
+
+Dependencies:
+- numpy
+- mapbox_earcut (optional, faster ear clipping)
+- shapely >= 2.1 (optional, batched triangulation when mapbox_earcut is missing)
+
+Install dependencies with:
+pip install numpy mapbox_earcut
+"""
+
+import numpy as np
+
+try:
+    import mapbox_earcut
+except ImportError:
+    mapbox_earcut = None
+
+try:
+    import shapely
+except ImportError:
+    shapely = None
+# GEOS constrained Delaunay triangulation, shapely >= 2.1
+constrained_delaunay_triangles = getattr(shapely, "constrained_delaunay_triangles", None)
+
+# Relative tolerance for treating a corner as convex or a triangle as non-empty
+EPSILON = 1e-9
+
+def _ring_neighbours(ring_offsets):
+    """
+    For every corner position, the positions of the previous and next corner in its ring.
+    """
+    sizes = np.diff(ring_offsets)
+    ring_of_corner = np.repeat(np.arange(len(sizes)), sizes)
+    start, stop = ring_offsets[:-1][sizes > 0], ring_offsets[1:][sizes > 0]
+    next_pos = np.arange(1, ring_offsets[-1] + 1)
+    next_pos[stop - 1] = start
+    prev_pos = np.arange(-1, ring_offsets[-1] - 1)
+    prev_pos[start] = stop - 1
+    return ring_of_corner, prev_pos, next_pos
+
+def project_surfaces(vertices, ring_vertices, ring_offsets, surface_offsets, neighbours=None):
+    """
+    Project every ring corner onto a 2D plane per surface, dropping the axis along which
+    the Newell normal of the surface's exterior ring is largest.
+    neighbours: result of _ring_neighbours(ring_offsets), computed when not given
+    Returns (coords Nx2 for every position in ring_vertices, signed area of every ring).
+    """
+    num_rings = len(ring_offsets) - 1
+    ring_counts = np.diff(surface_offsets)
+    ring_surface = np.repeat(np.arange(len(ring_counts)), ring_counts)
+    ring_of_corner, _, next_pos = neighbours if neighbours is not None else _ring_neighbours(ring_offsets)
+
+    points = vertices[ring_vertices].astype(np.float64)
+    # Work relative to the first vertex of each surface to keep the products well conditioned
+    surface_origin = ring_offsets[np.minimum(surface_offsets[:-1], num_rings)]
+    points -= points[np.minimum(surface_origin[ring_surface], len(points) - 1)][ring_of_corner]
+    following = points[next_pos]
+
+    # Newell normal of every ring
+    normal = np.column_stack([
+        np.bincount(ring_of_corner, (points[:, 1] - following[:, 1]) * (points[:, 2] + following[:, 2]), num_rings),
+        np.bincount(ring_of_corner, (points[:, 2] - following[:, 2]) * (points[:, 0] + following[:, 0]), num_rings),
+        np.bincount(ring_of_corner, (points[:, 0] - following[:, 0]) * (points[:, 1] + following[:, 1]), num_rings),
+    ]).reshape(-1, 3)
+
+    # Every ring of a surface uses the plane of the surface's exterior ring
+    exterior_normal = normal[surface_offsets[:-1][ring_counts > 0]]
+    surface_axis = np.full(len(ring_counts), 2, dtype=np.int64)
+    surface_axis[ring_counts > 0] = np.argmax(np.abs(exterior_normal), axis=1)
+    corner_axis = surface_axis[ring_surface][ring_of_corner]
+
+    # Keep the two remaining axes in cyclic order so the projection preserves orientation
+    # with respect to the positive dropped axis
+    coords = np.empty((len(points), 2))
+    for axis in range(3):
+        on_axis = corner_axis == axis
+        coords[on_axis] = points[on_axis][:, [(axis + 1) % 3, (axis + 2) % 3]]
+
+    next_coords = coords[next_pos]
+    area = np.bincount(ring_of_corner, coords[:, 0] * next_coords[:, 1] - next_coords[:, 0] * coords[:, 1],
+                       num_rings) / 2
+    return coords, area
+
+def _convex_rings(coords, area, ring_offsets, neighbours=None):
+    """
+    True for every ring whose corners all turn the same way as the ring itself.
+    """
+    ring_of_corner, prev_pos, next_pos = neighbours if neighbours is not None else _ring_neighbours(ring_offsets)
+    incoming = coords - coords[prev_pos]
+    outgoing = coords[next_pos] - coords
+    cross = incoming[:, 0] * outgoing[:, 1] - incoming[:, 1] * outgoing[:, 0]
+    scale = np.hypot(*incoming.T) * np.hypot(*outgoing.T)
+    turn = cross * np.sign(area)[ring_of_corner]
+    concave = np.bincount(ring_of_corner, turn < -EPSILON * scale, len(ring_offsets) - 1)
+    return concave == 0
+
+def _fan(ring_starts, ring_sizes):
+    """
+    Fan triangles [start, start + i, start + i + 1] for every ring, in ring order.
+    """
+    fan_counts = np.maximum(ring_sizes - 2, 0)
+    heads = np.repeat(ring_starts, fan_counts)
+    step = np.arange(len(heads), dtype=np.int64) - np.repeat(np.cumsum(fan_counts) - fan_counts, fan_counts) + 1
+    return np.column_stack((heads, heads + step, heads + step + 1)).reshape(-1, 3), fan_counts
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+def _in_triangle(p, a, b, c):
+    return _cross(a, b, p) >= 0 and _cross(b, c, p) >= 0 and _cross(c, a, p) >= 0
+
+def _bridge_hole(polygon, hole, points):
+    """
+    Splice a hole (list of point ids, clockwise) into the polygon (counter-clockwise) through
+    a bridge from the hole's rightmost point to a visible polygon point.
+    """
+    m = max(range(len(hole)), key=lambda k: (points[hole[k]][0], points[hole[k]][1]))
+    mx, my = points[hole[m]]
+
+    # Nearest polygon edge hit by a ray from M towards +x
+    best_x, best = None, None
+    for k in range(len(polygon)):
+        a, b = points[polygon[k]], points[polygon[(k + 1) % len(polygon)]]
+        if (a[1] <= my <= b[1] or b[1] <= my <= a[1]) and a[1] != b[1]:
+            x = a[0] + (my - a[1]) * (b[0] - a[0]) / (b[1] - a[1])
+            if x >= mx and (best_x is None or x < best_x):
+                best_x = x
+                best = k if a[0] >= b[0] else (k + 1) % len(polygon)
+    if best is None:
+        best = min(range(len(polygon)), key=lambda k: np.hypot(points[polygon[k]][0] - mx, points[polygon[k]][1] - my))
+    else:
+        # A polygon point inside triangle (M, I, P) would block the bridge; take the one
+        # closest in angle to the ray instead
+        p = points[polygon[best]]
+        hit = (best_x, my)
+        triangle = (points[hole[m]], p, hit) if p[1] < my else (points[hole[m]], hit, p)
+        best_tan = None
+        for k in range(len(polygon)):
+            q = points[polygon[k]]
+            if k != best and q[0] > mx and _in_triangle(q, *triangle):
+                tan = abs(q[1] - my) / (q[0] - mx)
+                if best_tan is None or tan < best_tan:
+                    best, best_tan = k, tan
+
+    spliced_hole = hole[m:] + hole[:m] + [hole[m]]
+    return polygon[:best + 1] + spliced_hole + polygon[best:]
+
+def earcut_polygon(points, ring_sizes):
+    """
+    Triangulate one polygon with holes by ear clipping.
+    points: Nx2 coordinates, exterior ring first, then the interior rings
+    ring_sizes: number of points in every ring
+    Returns a list of (a, b, c) point ids.
+    """
+    points = [tuple(p) for p in np.asarray(points, dtype=np.float64).tolist()]
+    rings = []
+    start = 0
+    for size in ring_sizes:
+        rings.append(list(range(start, start + size)))
+        start += size
+
+    def signed_area(ring):
+        return sum(_cross((0, 0), points[ring[k]], points[ring[(k + 1) % len(ring)]]) for k in range(len(ring)))
+
+    # Exterior counter-clockwise, holes clockwise
+    polygon = rings[0] if signed_area(rings[0]) >= 0 else rings[0][::-1]
+    holes = [ring if signed_area(ring) <= 0 else ring[::-1] for ring in rings[1:] if len(ring) >= 3]
+    holes.sort(key=lambda ring: -max(points[p][0] for p in ring))
+    for hole in holes:
+        polygon = _bridge_hole(polygon, hole, points)
+
+    triangles = []
+    remaining = list(polygon)
+    k = 0
+    stalled = 0
+    while len(remaining) > 3:
+        n = len(remaining)
+        a, b, c = remaining[(k - 1) % n], remaining[k % n], remaining[(k + 1) % n]
+        pa, pb, pc = points[a], points[b], points[c]
+        turn = _cross(pa, pb, pc)
+        scale = abs(pb[0] - pa[0]) + abs(pb[1] - pa[1]) + abs(pc[0] - pb[0]) + abs(pc[1] - pb[1])
+
+        if abs(turn) <= EPSILON * scale * scale:
+            # Collinear (or repeated) corner: drop it without emitting a triangle
+            remaining.pop(k % n)
+            stalled = 0
+            continue
+
+        is_ear = turn > 0 and not any(
+            _in_triangle(points[q], pa, pb, pc)
+            for q in remaining
+            if q not in (a, b, c) and points[q] not in (pa, pb, pc)
+        )
+        if is_ear or stalled >= n:
+            # After a full pass without an ear (self-intersecting input) clip anyway
+            triangles.append((a, b, c))
+            remaining.pop(k % n)
+            stalled = 0
+        else:
+            k += 1
+            stalled += 1
+
+    if len(remaining) == 3 and _cross(*(points[p] for p in remaining)) != 0:
+        triangles.append(tuple(remaining))
+    return triangles
+
+def _earcut_surface(coords, ring_offsets, first_ring, last_ring):
+    """
+    Ear clip one surface; returns triangles as positions into ring_vertices.
+    """
+    base = ring_offsets[first_ring]
+    points = coords[base:ring_offsets[last_ring]]
+    sizes = np.diff(ring_offsets[first_ring:last_ring + 1])
+    if mapbox_earcut is not None:
+        local = mapbox_earcut.triangulate_float64(points, np.cumsum(sizes).astype(np.uint32)).reshape(-1, 3)
+    else:
+        local = np.array(earcut_polygon(points, sizes.tolist()), dtype=np.int64).reshape(-1, 3)
+    return local + base
+
+def _ranges(starts, stops):
+    """
+    Concatenated np.arange(start, stop) of every range, and the range of every value.
+    """
+    sizes = stops - starts
+    owner = np.repeat(np.arange(len(sizes)), sizes)
+    return np.arange(int(sizes.sum())) - np.repeat(np.cumsum(sizes) - sizes - starts, sizes), owner
+
+def _delaunay_surfaces(coords, ring_offsets, surface_offsets, surfaces):
+    """
+    Triangulate the given surfaces in one GEOS batch (constrained Delaunay triangulation of
+    their projected rings; interior rings under 3 corners are ignored).
+    Returns (triangles as positions into ring_vertices, triangle_surface, the surfaces left
+    untriangulated because GEOS failed on them, returned no triangles or a corner that is
+    not theirs).
+    """
+    first_ring = surface_offsets[surfaces]
+    ring_ids, ring_local = _ranges(first_ring, surface_offsets[surfaces + 1])
+    ring_sizes = ring_offsets[ring_ids + 1] - ring_offsets[ring_ids]
+    keep = (ring_sizes >= 3) | (ring_ids == first_ring[ring_local])
+    ring_ids, ring_local, ring_sizes = ring_ids[keep], ring_local[keep], ring_sizes[keep]
+    positions, position_ring = _ranges(ring_offsets[ring_ids], ring_offsets[ring_ids + 1])
+    position_local = ring_local[position_ring]
+
+    # GEOS keeps the z of the input corners, so each corner carries its index as z
+    corners = np.column_stack((coords[positions], np.arange(len(positions), dtype=np.float64)))
+    try:
+        rings = shapely.linearrings(corners, indices=np.repeat(np.arange(len(ring_ids)), ring_sizes))
+        triangulated = constrained_delaunay_triangles(shapely.polygons(rings, indices=ring_local))
+    except shapely.errors.ShapelyError:
+        return np.empty((0, 3), dtype=np.int64), np.empty(0, dtype=np.int64), surfaces
+    points, point_local = shapely.get_coordinates(triangulated, include_z=True, return_index=True)
+    # Every triangle is a closed ring of 4 points
+    corner = points[:, 2].reshape(-1, 4)[:, :3].ravel()
+    point_local = point_local[::4].repeat(3)
+    # Points GEOS made up (e.g. at self-intersections) have no corner index of their surface
+    matched = (corner >= 0) & (corner < len(positions)) & (corner == np.round(corner))
+    corner = np.where(matched, corner, 0).astype(np.int64)
+    matched &= position_local[corner] == point_local
+
+    triangle_local = point_local[::3]
+    failed = np.bincount(triangle_local, minlength=len(surfaces)) == 0
+    failed[point_local[~matched]] = True
+    good = ~failed[triangle_local]
+    triangles = positions[corner].reshape(-1, 3)[good]
+    return triangles, surfaces[triangle_local[good]], surfaces[failed]
+
+def triangulate_surfaces(vertices, ring_vertices, ring_offsets, surface_offsets):
+    """
+    Triangulate every surface, holes included.
+    vertices: Nx3 coordinates
+    ring_vertices, ring_offsets, surface_offsets: flattened boundaries (see
+        cityjson_to_3dtiles.parse_cityjson_geometry)
+    Convex surfaces without holes are fanned in one numpy batch; the rest are ear clipped
+    (or, without mapbox_earcut, triangulated in one GEOS batch where possible).
+    Returns (triangles Tx3 as positions into ring_vertices, triangle_surface (T,)), with the
+    triangles in surface order and wound like each surface's exterior ring.
+    """
+    ring_counts = np.diff(surface_offsets)
+    ring_sizes = np.diff(ring_offsets)
+    has_exterior = ring_counts > 0
+    exterior = surface_offsets[:-1][has_exterior]
+
+    neighbours = _ring_neighbours(ring_offsets)
+    coords, area = project_surfaces(vertices, ring_vertices, ring_offsets, surface_offsets, neighbours)
+    exterior_ok = np.zeros(len(ring_counts), dtype=bool)
+    exterior_ok[has_exterior] = ring_sizes[exterior] >= 3
+
+    simple = np.zeros(len(ring_counts), dtype=bool)
+    simple[has_exterior] = (ring_counts[has_exterior] == 1) & \
+        ((ring_sizes[exterior] <= 3) | _convex_rings(coords, area, ring_offsets, neighbours)[exterior])
+    simple &= exterior_ok
+    complex_surfaces = np.flatnonzero(exterior_ok & ~simple)
+
+    # Batch 1: convex rings without holes
+    simple_ids = np.flatnonzero(simple)
+    fan, fan_counts = _fan(ring_offsets[surface_offsets[simple_ids]], ring_sizes[surface_offsets[simple_ids]])
+    parts = [fan]
+    part_surfaces = [np.repeat(simple_ids, fan_counts)]
+
+    # Batch 2: concave rings and rings with holes
+    clipped_any = len(complex_surfaces) > 0
+    if mapbox_earcut is None and constrained_delaunay_triangles is not None and len(complex_surfaces):
+        delaunay, delaunay_surfaces, complex_surfaces = _delaunay_surfaces(coords, ring_offsets, surface_offsets,
+                                                                           complex_surfaces)
+        parts.append(delaunay)
+        part_surfaces.append(delaunay_surfaces)
+    for s in complex_surfaces:
+        clipped = _earcut_surface(coords, ring_offsets, surface_offsets[s], surface_offsets[s + 1])
+        parts.append(clipped)
+        part_surfaces.append(np.full(len(clipped), s, dtype=np.int64))
+
+    triangles = np.vstack(parts).astype(np.int64)
+    triangle_surface = np.concatenate(part_surfaces).astype(np.int64)
+
+    if clipped_any:
+        # Ear clipping and GEOS work on a normalised orientation; restore the exterior ring's winding
+        a, b, c = coords[triangles[:, 0]], coords[triangles[:, 1]], coords[triangles[:, 2]]
+        turn = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+        ring_sign = np.zeros(len(ring_counts))
+        ring_sign[has_exterior] = np.sign(area[exterior])
+        flip = np.sign(turn) * ring_sign[triangle_surface] < 0
+        triangles[flip] = triangles[flip][:, [0, 2, 1]]
+
+        order = np.argsort(triangle_surface, kind="stable")
+        triangles, triangle_surface = triangles[order], triangle_surface[order]
+
+    return triangles, triangle_surface